@@ -1,7 +1,8 @@
 #!/bin/bash -v
 
 # This script runs on all instances
-# It installs a salt minion and mounts the disks
+# It installs a salt minion and mounts the disks, or with PNDA_BAKE=YES
+# prepares an image to be baked (see pnda-cli.py bake)
 
 # The pnda_env-<cluster_name>.sh script generated by the CLI should
 # be run prior to running this script to define various environment
@@ -9,9 +10,16 @@
 
 set -e
 
-/tmp/package-install.sh
 DISTRO=$(cat /etc/*-release|grep ^ID\=|awk -F\= {'print $2'}|sed s/\"//g)
 
+# The firewall and the mirror depend on the cluster, so are set up even on baked images
+/tmp/outbound-firewall.sh
+/tmp/package-install.sh
+
+# Instances created from an image made by pnda-cli.py bake already have the packages
+if [ -e /etc/pnda/baked-image ]; then
+echo "Packages already installed, image baked at $(cat /etc/pnda/baked-image)"
+else
 if [ "x$DISTRO" == "xubuntu" ]; then
 export DEBIAN_FRONTEND=noninteractive
 apt-get -y install xfsprogs salt-minion=2015.8.11+ds-1
@@ -20,10 +28,34 @@ yum -y install xfsprogs wget salt-minion-2015.8.11-1.el7
 #enable boot time startup
 systemctl enable salt-minion.service
 fi
+fi
+
+# When baking an image, pre-install any packages salt will want for this node type and stop
+# there. The minion configuration, grains, disks and firewall are set up when the image is
+# used, and the minion must not take its keys or id from the image.
+if [ "x$PNDA_BAKE" == "xYES" ]; then
+if [ "x$PNDA_BAKE_PACKAGES" != "x" ]; then
+if [ "x$DISTRO" == "xubuntu" ]; then
+apt-get -y install $PNDA_BAKE_PACKAGES
+else
+yum -y install $PNDA_BAKE_PACKAGES
+fi
+fi
+service salt-minion stop || true
+rm -rf /etc/salt/pki/minion /etc/salt/minion_id
+if [ -e /etc/iptables.conf ]; then
+rm -f /etc/iptables.conf /etc/rsyslog.d/10-iptables.conf
+echo '#!/bin/sh' > /etc/rc.local
+fi
+mkdir -p /etc/pnda
+date -u > /etc/pnda/baked-image
+exit 0
+fi
 
-# Set the master address the minion will register itself with
+# Set the master address the minion will register itself with, the salt syndic
+# the CLI assigned to this host if there is one, otherwise the saltmaster
 cat > /etc/salt/minion <<EOF
-master: $PNDA_SALTMASTER_IP
+master: ${PNDA_SYNDIC_IP:-$PNDA_SALTMASTER_IP}
 EOF
 
 # Set the grains common to all minions
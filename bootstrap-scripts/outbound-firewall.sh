@@ -0,0 +1,42 @@
+#!/bin/bash -v
+
+# Rejects outbound connections other than to the PNDA mirror, the client, the NTP servers and
+# the cluster network when REJECT_OUTBOUND is YES. Runs on every bootstrap, including instances
+# created from a baked image, as the addresses allowed depend on the cluster.
+
+set -ex
+
+if [ "x$REJECT_OUTBOUND" == "xYES" ]; then
+PNDA_MIRROR_IP=$(echo $PNDA_MIRROR | awk -F'[/:]' '/http:\/\//{print $4}')
+
+# Log the global scope IP connection.
+cat > /etc/rsyslog.d/10-iptables.conf <<EOF
+:msg,contains,"[ipreject] " /var/log/iptables.log
+STOP
+EOF
+sudo service rsyslog restart
+iptables -F LOGGING | true
+iptables -F OUTPUT | true
+iptables -X LOGGING | true
+iptables -N LOGGING
+iptables -A OUTPUT -j LOGGING
+## Accept all local scope IP packets.
+  ip address show  | awk '/inet /{print $2}' | while IFS= read line; do \
+iptables -A LOGGING -d  $line -j ACCEPT
+  done
+## Log and reject all the remaining IP connections.
+iptables -A LOGGING -j LOG --log-prefix "[ipreject] " --log-level 7 -m state --state NEW
+iptables -A LOGGING -d  $PNDA_MIRROR_IP/32 -j ACCEPT # PNDA mirror
+if [ "x$CLIENT_IP" != "x" ]; then
+iptables -A LOGGING -d  $CLIENT_IP/32 -j ACCEPT # PNDA client
+fi
+if [ "x$NTP_SERVERS" != "x" ]; then
+NTP_SERVERS=$(echo "$NTP_SERVERS" | sed -e 's|[]"'\''\[ ]||g')
+iptables -A LOGGING -d  $NTP_SERVERS -j ACCEPT # NTP server
+fi
+iptables -A LOGGING -d  ${vpcCidr} -j ACCEPT # PNDA network
+iptables -A LOGGING -j REJECT --reject-with icmp-net-unreachable
+iptables-save > /etc/iptables.conf
+echo -e '#!/bin/sh\niptables-restore < /etc/iptables.conf' > /etc/rc.local
+chmod +x /etc/rc.d/rc.local | true
+fi
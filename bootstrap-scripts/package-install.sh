@@ -2,40 +2,9 @@
 
 set -ex
 
-if [ "x$REJECT_OUTBOUND" == "xYES" ]; then
-PNDA_MIRROR_IP=$(echo $PNDA_MIRROR | awk -F'[/:]' '/http:\/\//{print $4}')
-
-# Log the global scope IP connection.
-cat > /etc/rsyslog.d/10-iptables.conf <<EOF
-:msg,contains,"[ipreject] " /var/log/iptables.log
-STOP
-EOF
-sudo service rsyslog restart
-iptables -F LOGGING | true
-iptables -F OUTPUT | true
-iptables -X LOGGING | true
-iptables -N LOGGING
-iptables -A OUTPUT -j LOGGING
-## Accept all local scope IP packets.
-  ip address show  | awk '/inet /{print $2}' | while IFS= read line; do \
-iptables -A LOGGING -d  $line -j ACCEPT
-  done
-## Log and reject all the remaining IP connections.
-iptables -A LOGGING -j LOG --log-prefix "[ipreject] " --log-level 7 -m state --state NEW
-iptables -A LOGGING -d  $PNDA_MIRROR_IP/32 -j ACCEPT # PNDA mirror
-if [ "x$CLIENT_IP" != "x" ]; then
-iptables -A LOGGING -d  $CLIENT_IP/32 -j ACCEPT # PNDA client
-fi
-if [ "x$NTP_SERVERS" != "x" ]; then
-NTP_SERVERS=$(echo "$NTP_SERVERS" | sed -e 's|[]"'\''\[ ]||g')
-iptables -A LOGGING -d  $NTP_SERVERS -j ACCEPT # NTP server
-fi
-iptables -A LOGGING -d  ${vpcCidr} -j ACCEPT # PNDA network
-iptables -A LOGGING -j REJECT --reject-with icmp-net-unreachable
-iptables-save > /etc/iptables.conf
-echo -e '#!/bin/sh\niptables-restore < /etc/iptables.conf' > /etc/rc.local
-chmod +x /etc/rc.d/rc.local | true
-fi
+# Points apt or yum and pip at the PNDA mirror. Runs on every bootstrap, including instances
+# created from a baked image, which are still set up for the mirror of the cluster they were
+# baked in, so it replaces any mirror configuration from an earlier run.
 
 DISTRO=$(cat /etc/*-release|grep ^ID\=|awk -F\= {'print $2'}|sed s/\"//g)
 
@@ -46,13 +15,14 @@ if [ "x$DISTRO" == "xubuntu" ]; then
 
 if [ "x$ADD_ONLINE_REPOS" == "xYES" ]; then
   # Give local mirror priority
+  sed -i '/\/mirror_deb\/ \.\/$/d' /etc/apt/sources.list
   sed -i "1ideb $PNDA_MIRROR/mirror_deb/ ./" /etc/apt/sources.list
 
   (curl -L 'https://archive.cloudera.com/cm5/ubuntu/trusty/amd64/cm/archive.key' | apt-key add - ) && echo 'deb [arch=amd64] https://archive.cloudera.com/cm5/ubuntu/trusty/amd64/cm/ trusty-cm5.9.0 contrib' > /etc/apt/sources.list.d/cloudera-manager.list
   (curl -L 'https://repo.saltstack.com/apt/ubuntu/14.04/amd64/archive/2015.8.11/SALTSTACK-GPG-KEY.pub' | apt-key add - ) && echo 'deb [arch=amd64] https://repo.saltstack.com/apt/ubuntu/14.04/amd64/archive/2015.8.11/ trusty main' > /etc/apt/sources.list.d/saltstack.list
   (curl -L 'https://deb.nodesource.com/gpgkey/nodesource.gpg.key' | apt-key add - ) && echo 'deb [arch=amd64] https://deb.nodesource.com/node_6.x trusty main' > /etc/apt/sources.list.d/nodesource.list
 else
-  mv /etc/apt/sources.list /etc/apt/sources.list.backup
+  [ -e /etc/apt/sources.list.backup ] || mv /etc/apt/sources.list /etc/apt/sources.list.backup
   echo -e "deb $PNDA_MIRROR/mirror_deb/ ./" > /etc/apt/sources.list
 fi
 
@@ -60,6 +30,7 @@ apt-get update
 
 elif [ "x$DISTRO" == "xrhel" -o "x$DISTRO" == "xcentos" ]; then
 
+rm -f /etc/yum.repos.d/*mirror_rpm.repo
 if [ "x$ADD_ONLINE_REPOS" == "xYES" ]; then
   RPM_EXTRAS=rhui-REGION-rhel-server-extras
   RPM_OPTIONAL=rhui-REGION-rhel-server-optional
@@ -71,7 +42,7 @@ if [ "x$ADD_ONLINE_REPOS" == "xYES" ]; then
   yum-config-manager --setopt="$PNDA_REPO.priority=1" --enable $PNDA_REPO
 else
   mkdir -p /etc/yum.repos.d.backup/
-  mv /etc/yum.repos.d/* /etc/yum.repos.d.backup/
+  mv /etc/yum.repos.d/* /etc/yum.repos.d.backup/ 2>/dev/null || true
   yum-config-manager --add-repo $PNDA_MIRROR/mirror_rpm
 fi
   if [ "x$DISTRO" == "xrhel" ]; then
@@ -0,0 +1,20 @@
+#!/bin/bash -v
+
+# This script runs on instances with a node_type tag of "salt-syndic"
+# The salt master and syndic are set up by syndic-common.sh, this
+# sets the minion id and hostname
+
+# The pnda_env-<cluster_name>.sh script generated by the CLI should
+# be run prior to running this script to define various environment
+# variables
+
+set -e
+
+cat >> /etc/salt/minion <<EOF
+id: $PNDA_CLUSTER-salt-syndic-$1
+EOF
+
+echo $PNDA_CLUSTER-salt-syndic-$1 > /etc/hostname
+hostname $PNDA_CLUSTER-salt-syndic-$1
+
+service salt-minion restart
@@ -62,6 +62,10 @@ file_recv: True
 failhard: True
 EOF
 
+# Worker threads, timeouts and caching for the size of the cluster, generated by the CLI
+mkdir -p /etc/salt/master.d
+cp /tmp/salt_master_$PNDA_CLUSTER.conf /etc/salt/master.d/pnda-tuning.conf
+
 # Set up platform-salt that contains the scripts the saltmaster runs to install software
 mkdir -p /srv/salt
 cd /srv/salt
@@ -0,0 +1,39 @@
+#!/bin/bash -v
+
+# This script runs on salt syndics, instances with a node_type tag of "salt-syndic" or
+# existing machines with is_syndic set. It runs after base.sh, which registers the
+# syndic's own minion with the saltmaster.
+# It installs a salt master and syndic that the minions assigned to this syndic register
+# with, serving the saltmaster's platform-salt tree and configuration, and passing on
+# jobs from the saltmaster.
+
+# The pnda_env-<cluster_name>.sh script generated by the CLI should
+# be run prior to running this script to define various environment
+# variables
+set -ex
+
+DISTRO=$(cat /etc/*-release|grep ^ID\=|awk -F\= {'print $2'}|sed s/\"//g)
+
+if [ "x$DISTRO" == "xubuntu" ]; then
+export DEBIAN_FRONTEND=noninteractive
+apt-get update
+apt-get -y install salt-master=2015.8.11+ds-1 salt-syndic=2015.8.11+ds-1
+fi
+
+if [ "x$DISTRO" == "xrhel"  -o "x$DISTRO" == "xcentos" ]; then
+yum -y install salt-master-2015.8.11-1.el7 salt-syndic-2015.8.11-1.el7
+systemctl enable salt-master.service
+systemctl enable salt-syndic.service
+fi
+
+# The platform-salt tree, /etc/salt/master and /etc/salt/master.d of the saltmaster,
+# including the pillar the saltmaster bootstrap generated
+rm -rf /srv/salt/platform-salt
+tar zxf /tmp/$PNDA_SALT_TREE_TARBALL -C /
+
+cat > /etc/salt/master.d/syndic.conf <<EOF
+syndic_master: $PNDA_SALTMASTER_IP
+EOF
+
+service salt-master restart
+service salt-syndic restart
@@ -2,6 +2,19 @@
 import subprocess
 import sys
 import os.path
+import time
+import threading
+import Queue
+
+# most volumes formatted and mounted at once
+MAX_PARALLEL = 4
+# filesystems prepared here, any other kind of volume is left for platform-salt to set up
+FORMATTABLE = ['xfs', 'ext4']
+# xfs labels are at most 12 characters
+MAX_LABEL = 12
+# marker for the per-volume timings the CLI records in its run journal
+TIMING_MARKER = 'PNDA_VOLUME'
+FSTAB = '/etc/fstab'
 
 infile = sys.argv[1]
 outfile = sys.argv[2]
@@ -71,4 +84,122 @@ with open(outfile, 'w') as volume_mappings_file:
 # Check that each requested volume has a line in the mappings file
 if mappings_count != requested_volumes_count:
     print 'ERROR: %s volumes requested but only managed to assign volumes for %s of them' % (requested_volumes_count, mappings_count)
+    sys.exit(-1)
+
+# Format and mount the mapped volumes, several at once as each one is on its own device.
+# A device that already has the filesystem and label it would be given is not formatted
+# again, so running this again on a host does not lose data. A device with any other
+# filesystem is never formatted here, nor is one whose label another device already has.
+# Each volume prepared gets an fstab entry with nofail, so that a missing volume does not
+# stop the host from booting.
+def volume_labels(mappings):
+    # labels cut to MAX_LABEL that would be the same end in a number instead
+    labels = {}
+    for mountpoint in sorted(mapping[1] for mapping in mappings):
+        base = os.path.basename(mountpoint.rstrip('/'))[:MAX_LABEL] or 'root'
+        label = base
+        index = 1
+        while label in labels.values():
+            suffix = str(index)
+            label = base[:MAX_LABEL - len(suffix)] + suffix
+            index += 1
+        labels[mountpoint] = label
+    return labels
+
+def blkid(device, tag):
+    try:
+        return subprocess.check_output(['blkid', '-o', 'value', '-s', tag, device]).strip()
+    except subprocess.CalledProcessError:
+        # blkid exits with 2 when the device has no such tag
+        return ''
+
+def labelled_device(label):
+    try:
+        return subprocess.check_output(['blkid', '-L', label]).strip()
+    except subprocess.CalledProcessError:
+        return ''
+
+def is_mounted(mountpoint):
+    with open('/proc/mounts') as mounts:
+        return any(line.split(' ')[1] == mountpoint for line in mounts)
+
+def add_fstab_entry(mapping):
+    device, mountpoint, fstype = mapping[0], mapping[1], mapping[2]
+    with open(FSTAB) as fstab:
+        if any(len(line.split()) > 1 and line.split()[1] == mountpoint for line in fstab if not line.startswith('#')):
+            return
+    options = (mapping[3] if len(mapping) > 3 else 'defaults') + ',nofail'
+    with open(FSTAB, 'a') as fstab:
+        fstab.write('UUID=%s %s %s %s 0 2\n' % (blkid(device, 'UUID'), mountpoint, fstype, options))
+
+def prepare_volume(mapping, label):
+    device, mountpoint, fstype = mapping[0], mapping[1], mapping[2]
+    start = time.time()
+    existing = blkid(device, 'TYPE') or blkid(device, 'PTTYPE')
+    if not existing:
+        clash = labelled_device(label)
+        if clash:
+            raise Exception('label %s is already used by %s' % (label, clash))
+        # mke2fs asks before formatting a whole disk unless forced, mkfs.xfs only before overwriting a filesystem
+        force = ['-F'] if fstype == 'ext4' else []
+        subprocess.check_call(['mkfs', '-t', fstype] + force + ['-L', label, device])
+        action = 'formatted'
+    elif existing == fstype and blkid(device, 'LABEL') == label:
+        action = 'kept'
+    else:
+        print 'WARNING: %s already has %s on it, leaving it for platform-salt' % (device, existing)
+        action = 'skipped'
+
+    if action != 'skipped' and not is_mounted(mountpoint):
+        if not os.path.isdir(mountpoint):
+            os.makedirs(mountpoint)
+        options = ['-o', mapping[3]] if len(mapping) > 3 else []
+        subprocess.check_call(['mount', '-t', fstype] + options + [device, mountpoint])
+    return action, time.time() - start
+
+def prepare_volumes(mappings):
+    labels = volume_labels(mappings)
+    pending = Queue.Queue()
+    for mapping in mappings:
+        pending.put(mapping)
+    failures = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            try:
+                mapping = pending.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                action, seconds = prepare_volume(mapping, labels[mapping[1]])
+                if action != 'skipped':
+                    with lock:
+                        add_fstab_entry(mapping)
+            except Exception as exception:
+                failures.append('%s: %s' % (mapping[0], exception))
+                action, seconds = 'failed', 0
+            with lock:
+                print '%s %s %s %s %.1f' % (TIMING_MARKER, mapping[0], mapping[1], action, seconds)
+                sys.stdout.flush()
+
+    workers = [threading.Thread(target=worker) for _ in range(min(MAX_PARALLEL, len(mappings)))]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return failures
+
+with open(outfile) as volume_mappings_file:
+    mappings = [line.split() for line in volume_mappings_file if line.strip()]
+# partitions that do not exist yet are created and formatted by platform-salt
+to_prepare = [mapping for mapping in mappings
+              if len(mapping) > 2 and mapping[2] in FORMATTABLE and mapping[0].startswith('/dev/') and os.path.exists(mapping[0])]
+
+print '\npreparing %s volumes, up to %s at once' % (len(to_prepare), MAX_PARALLEL)
+prepare_start = time.time()
+prepare_failures = prepare_volumes(to_prepare)
+print 'prepared volumes in %.1f seconds' % (time.time() - prepare_start)
+if prepare_failures:
+    print 'ERROR: failed to prepare volumes: %s' % '; '.join(prepare_failures)
     sys.exit(-1)
\ No newline at end of file
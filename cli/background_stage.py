@@ -0,0 +1,69 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Local work run in the background while the CLI waits on something else, such as a
+            Cloud Formation stack, with its result or failure picked up later by the thread
+            that needs it.
+
+"""
+
+import sys
+import time
+import traceback
+
+from threading import Thread
+
+class BackgroundStage(object):
+    '''
+    Runs func(*args) in a thread as soon as it is created
+    '''
+
+    def __init__(self, log, name, func, *args):
+        self.name = name
+        self._log = log
+        self._result = None
+        self._exc_info = None
+        self._thread = Thread(target=self._run, args=[func, args])
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, func, args):
+        start = time.time()
+        try:
+            self._result = func(*args)
+            self._log.info('%s took %.1fs', self.name, time.time() - start)
+        except Exception: #pylint: disable=W0703
+            self._log.error('%s failed: %s', self.name, traceback.format_exc())
+            self._exc_info = sys.exc_info()
+
+    def _reraise(self):
+        exc_type, exc_value, exc_tb = self._exc_info
+        raise exc_type, exc_value, exc_tb
+
+    def raise_if_failed(self):
+        '''
+        Raise what the stage raised if it has finished and failed, without waiting for it
+        '''
+        if not self._thread.is_alive() and self._exc_info is not None:
+            self._reraise()
+
+    def result(self):
+        '''
+        Wait for the stage to finish and return what it returned, or raise what it raised
+        '''
+        self._thread.join()
+        if self._exc_info is not None:
+            self._reraise()
+        return self._result
@@ -0,0 +1,138 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The bake command, which makes an image of each node type of a flavor with the
+            packages every instance of that node type needs already installed
+
+"""
+
+import sys
+import time
+import traceback
+import Queue
+
+import retry_policy
+import image_bake
+
+from cluster_context import MILLI_TIME, repo_path
+from cloud_formation import ec2_connection, cfn_connection, stack_template, create_stack, fetch_stack_events, wait_for_stack
+from config_checks import check_config
+from host_access import get_inventory, prepare_host_access
+from remote_ops import THROW_BASH_ERROR, scp, report_transfers, ssh, wait_on_host_operations
+from destroy import destroy
+
+def bake_instance(instance, ctx, error_queue):
+    '''
+    Run the part of the bootstrap that does not depend on the cluster on an instance, so that an image of it
+    has the packages every instance of its node type needs
+    '''
+    try:
+        ip_address = instance.private_ip_address
+        packages = image_bake.bake_packages(ctx.flavor, instance.node_type)
+        files_to_scp = [ctx.pnda_env_sh,
+                        repo_path('bootstrap-scripts', 'outbound-firewall.sh'),
+                        repo_path('bootstrap-scripts', 'package-install.sh'),
+                        repo_path('bootstrap-scripts', 'base.sh')]
+        cmds_to_run = ['source /tmp/pnda_env_%s.sh' % ctx.name,
+                       'export PNDA_BAKE=YES',
+                       "export PNDA_BAKE_PACKAGES='%s'" % ' '.join(packages),
+                       'sudo chmod a+x /tmp/outbound-firewall.sh',
+                       'sudo chmod a+x /tmp/package-install.sh',
+                       'sudo chmod a+x /tmp/base.sh',
+                       '(sudo -E /tmp/base.sh 2>&1) | tee -a pnda-bake.log; %s' % THROW_BASH_ERROR]
+        scp(files_to_scp, ctx, ip_address)
+        ssh(cmds_to_run, ctx, ip_address, stream='bootstrap')
+    except:
+        ret_val = 'Error for host %s. %s' % (instance.name, traceback.format_exc())
+        ctx.console.error(ret_val)
+        error_queue.put(ret_val)
+
+def create_images(ctx, cluster):
+    '''
+    Image every instance and wait for the images to become available. Returns node type to image id.
+    '''
+    ec2 = ec2_connection(ctx)
+    images = {}
+    for instance in cluster.typed:
+        if instance.node_type:
+            name = 'pnda-%s-%s-%s' % (ctx.flavor, instance.node_type, MILLI_TIME())
+            description = 'PNDA %s image for %s instances' % (ctx.flavor, instance.node_type)
+            images[instance.node_type] = retry_policy.AWS_API.call(ctx.log, ec2.create_image, instance.instance_id, name, description)
+    ctx.to_runfile({'images': images})
+
+    pending = set(images.values())
+    while pending:
+        time.sleep(15)
+        ctx.console.info('Waiting for %s images to become available', len(pending))
+        for image in retry_policy.AWS_API.call(ctx.log, ec2.get_all_images, image_ids=list(pending)):
+            if image.state == 'available':
+                pending.discard(image.id)
+            elif image.state == 'failed':
+                ctx.console.error('Image %s could not be created', image.id)
+                sys.exit(1)
+    return images
+
+def bake(ctx, template_data, keyname, no_config_check):
+    '''
+    Bake an image for every node type of a flavor: create a stack with an instance of each node type,
+    install the packages every create would install on them, image them and record the images in the
+    flavor's image manifest for create to use. The stack is deleted whether or not baking succeeds.
+    '''
+    keyfile = repo_path('%s.pem' % keyname)
+    ec2_access = ctx.pnda_env['ec2_access']
+    cf_parameters = [('keyName', keyname), ('pndaCluster', ctx.name), ('awsAvailabilityZone', ec2_access['AWS_AVAILABILITY_ZONE'])]
+    for parameter in ctx.pnda_env['cloud_formation_parameters']:
+        cf_parameters.append((parameter, ctx.pnda_env['cloud_formation_parameters'][parameter]))
+
+    if not no_config_check:
+        check_config(ctx, keyname, keyfile)
+
+    ctx.console.info('Creating Cloud Formation stack with an instance of each node type to bake')
+    ctx.record_phase('stack')
+    conn = cfn_connection(ctx)
+    template_args, template_key = stack_template(ctx, template_data)
+    create_stack(ctx, conn, cf_parameters, template_args)
+    if template_key is not None:
+        retry_policy.AWS_API.call(ctx.log, template_key.delete)
+
+    try:
+        stack_status = wait_for_stack(ctx, conn, 'CREATING', ['CREATE_IN_PROGRESS', 'CREATING'])
+        if stack_status != 'CREATE_COMPLETE':
+            ctx.console.error('Stack did not come up, status is: ' + stack_status)
+            fetch_stack_events(ctx, conn, ctx.name)
+            sys.exit(1)
+
+        ctx.clear_inventory_cache()
+        cluster = get_inventory(ctx)
+        bastion_ip = prepare_host_access(ctx, cluster, keyfile)
+
+        ctx.record_phase('bootstrap')
+        ctx.console.info('Installing packages to bake. Expect this to take a few minutes, check the debug log for progress (%s).', ctx.log_file_name)
+        bake_operations = []
+        bake_errors = Queue.Queue()
+        for instance in cluster.typed:
+            bake_operations.append((bake_instance, [instance, ctx, bake_errors], instance.private_ip_address))
+        wait_on_host_operations(ctx, 'baking host', bake_operations, bastion_ip is not None, bake_errors)
+        report_transfers(ctx)
+
+        # imaging reboots the instances, so it waits until nothing is connected through the bastion
+        ctx.record_phase('image')
+        ctx.console.info('Creating images')
+        images = create_images(ctx, cluster)
+        image_bake.record_images(ctx.flavor, ec2_access['AWS_REGION'], ctx.pnda_env['cloud_formation_parameters'].get('imageId'), images)
+        ctx.console.info('Images for %s recorded in %s, create will use them for %s clusters in %s',
+                         ', '.join(sorted(images)), image_bake.manifest_path(ctx.flavor), ctx.flavor, ec2_access['AWS_REGION'])
+    finally:
+        destroy(ctx)
@@ -0,0 +1,85 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Routing of ssh sessions through the bastions of a cluster. Each host is assigned a
+            bastion by consistent hashing of its address, so adding a bastion only moves the
+            hosts it takes over, and new sessions are staggered per bastion rather than
+            across all of them.
+
+"""
+
+import time
+import bisect
+import hashlib
+import threading
+
+# gap between starting sessions through the same bastion, so it is not overloaded with inbound
+# connections and has none rejected
+STAGGER_S = 2
+# points on the ring for each bastion, enough for hosts to be spread evenly over a few bastions
+POINTS_PER_BASTION = 64
+
+def _hash(key):
+    return int(hashlib.md5(key).hexdigest()[:8], 16)
+
+class BastionRing(object):
+    '''
+    Consistent hash ring of the public addresses of a cluster's bastions, along with when the
+    next session through each of them may start
+    '''
+
+    def __init__(self, bastions=(), stagger_s=STAGGER_S):
+        self.stagger_s = stagger_s
+        self.bastions = []
+        self._points = []
+        self._keys = []
+        self._lock = threading.Lock()
+        self._next_start = {}
+        self.set_bastions(bastions)
+
+    def set_bastions(self, bastions):
+        points = sorted((_hash('%s#%s' % (bastion, point)), bastion) for bastion in bastions for point in range(POINTS_PER_BASTION))
+        with self._lock:
+            self.bastions = sorted(bastions)
+            self._points = points
+            self._keys = [key for key, _ in points]
+
+    def bastion_for(self, host):
+        '''
+        The bastion sessions to host go through, or None if there are no bastions
+        '''
+        with self._lock:
+            if not self._points:
+                return None
+            return self._points[bisect.bisect(self._keys, _hash(host)) % len(self._points)][1]
+
+    def hosts_by_bastion(self, hosts):
+        by_bastion = {}
+        for host in hosts:
+            by_bastion.setdefault(self.bastion_for(host), []).append(host)
+        return by_bastion
+
+    def admit(self, host):
+        '''
+        Wait until a session to host may start, no sooner than stagger_s after the last one
+        admitted through the same bastion. Hosts routed through other bastions do not wait.
+        '''
+        bastion = self.bastion_for(host) if host is not None else None
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_start.get(bastion, now))
+            self._next_start[bastion] = start + self.stagger_s
+        if start > now:
+            time.sleep(start - now)
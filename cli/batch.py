@@ -0,0 +1,78 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The batch command, which runs the commands for several clusters concurrently,
+            optionally within one outbound connection limit shared between them
+
+"""
+
+import sys
+import logging
+import traceback
+import Queue
+
+from threading import Thread
+from argparse import ArgumentTypeError
+
+import config_cache
+
+from validation import UserInputValidator
+from cluster_context import repo_path, ConnectionLimiter
+
+CONSOLE = logging.getLogger('console')
+
+def run_batch(batch_definition_file, run_command, flavors):
+    '''
+    Run the create, expand or destroy commands for every cluster in a batch definition
+    file concurrently with run_command, optionally sharing one outbound connection limit
+    between them. Each definition is validated against flavors.
+    '''
+    batch = config_cache.load_yaml(repo_path(batch_definition_file))
+    shared_limiter = None
+    if batch.get('max_simultaneous_outbound_connections') is not None:
+        shared_limiter = ConnectionLimiter(int(batch['max_simultaneous_outbound_connections']), batch.get('reserved_critical_connections'))
+
+    results = Queue.Queue()
+
+    def do_run(definition):
+        name = definition.get('pnda_cluster')
+        try:
+            input_validator = UserInputValidator(flavors)
+            fields = input_validator.validate_definition(definition)
+            run_command(fields, input_validator.get_range_validator(), shared_limiter, True)
+            results.put((name, 0))
+        except SystemExit as exit_exception:
+            results.put((name, exit_exception.code or 0))
+        except ArgumentTypeError as validation_error:
+            CONSOLE.error('[%s] %s', name, validation_error)
+            results.put((name, 1))
+        except:
+            CONSOLE.error('[%s] %s', name, traceback.format_exc())
+            results.put((name, 1))
+
+    threads = [Thread(target=do_run, args=[definition]) for definition in batch['clusters']]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    failed = 0
+    while not results.empty():
+        name, exit_code = results.get()
+        CONSOLE.info('%s: %s', name, 'OK' if exit_code == 0 else 'FAILED (exit code %s)' % exit_code)
+        if exit_code != 0:
+            failed += 1
+    if failed > 0:
+        sys.exit(1)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Stand in for scp against a simulated fleet. Waits for the configured connection
+            latency plus the time the local source files would take at the configured
+            bandwidth, or the scp -l limit if that is lower, and fails at the configured
+            rates. Nothing is copied to hosts, a file fetched from a host is written with the
+            size of a diagnostic bundle.
+
+"""
+
+import os
+import sys
+
+import fleet_state
+import fake_ssh
+
+# scp options that take a value
+OPTIONS_WITH_ARGS = set('cFiloPS')
+
+def parse_args(argv):
+    options = {}
+    index = 0
+    while index < len(argv) and argv[index].startswith('-'):
+        flag = argv[index][1:2]
+        if flag in OPTIONS_WITH_ARGS:
+            value = argv[index][2:] or argv[index + 1]
+            index += 1 if argv[index][2:] else 2
+            options.setdefault(flag, []).append(value)
+        else:
+            index += 1
+    sources = argv[index:-1]
+    remote = argv[-1] if ':' in argv[-1] else sources[0]
+    host = remote.split(':', 1)[0].split('@')[-1]
+    return options, sources, host
+
+def main(argv):
+    config = fleet_state.load_config()
+    options, sources, host = parse_args(argv)
+    fleet_state.record_call(config, 'scp', host)
+    fleet_state.sleep_ms(config['connect_latency_ms'] + (config['proxy_latency_ms'] if fake_ssh.uses_proxy(options) else 0))
+    if not fake_ssh.is_up(config, host) or fleet_state.chance(config['connect_failure_rate']):
+        sys.stderr.write('ssh: connect to host %s port 22: Connection refused\r\nlost connection\n' % host)
+        return 1
+
+    if ':' in sources[0]:
+        # fetching from the host
+        total_bytes = config['diagnostics_bytes']
+        with open(argv[-1], 'wb') as fetched:
+            fetched.write(b'\0' * total_bytes)
+    else:
+        total_bytes = sum([os.path.getsize(source) for source in sources if os.path.isfile(source)])
+    bandwidth_kbps = min([config['bandwidth_kbps']] + [float(limit) for limit in options.get('l', [])])
+    fleet_state.sleep_ms(total_bytes * 8.0 / bandwidth_kbps)
+    if fleet_state.chance(config['command_failure_rate']):
+        sys.stderr.write('lost connection\n')
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
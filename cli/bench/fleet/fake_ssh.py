@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Stand in for ssh against a simulated fleet. Accepts the command lines pnda-cli.py
+            builds, waits for the configured connection latency and command duration,
+            writes the configured volume of output and fails at the configured rates.
+
+            Understands just enough of the remote commands to keep the CLI's view of the
+            fleet consistent: touch ~/.bootstrap_complete marks a host bootstrapped,
+            ls ~/.bootstrap_complete reports it, salt-key --list=accepted lists the
+            minion ids of bootstrapped hosts, the connectivity sweep reports hosts
+            once their boot delay has passed, detached salt jobs finish after the
+            time their salt commands would have taken and base.sh is quicker on hosts
+            launched from baked images, unless it is baking one. Bootstraps of some
+            node types can be made to take longer than the rest, or to fail a number of
+            times. Phases of a resumable bootstrap leave markers and are skipped when
+            their marker exists. Diagnostic bundles are reported written at a fixed size.
+            The saltmaster's platform-salt tree is empty, or an up to date git checkout.
+
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import base64
+
+import fleet_state
+
+# ssh options that take a value
+OPTIONS_WITH_ARGS = set('bcDEeFIiJLlmOoPpQRSWw')
+# scripts run by a bootstrap, the one named after the node type is the last
+BOOTSTRAP_SCRIPT = re.compile(r'sudo -E /tmp/([\w.-]+)\.sh')
+# if [ -f <marker> ]; then echo ...; else <phase>; touch <marker>; fi
+PHASE = re.compile(r'if \[ -f (\S+) \]; then [^;]*; else .*?sudo -E /tmp/([\w.-]+)\.sh.*?; touch \1; fi')
+
+def parse_args(argv):
+    options = {}
+    index = 0
+    while index < len(argv) and argv[index].startswith('-'):
+        flag = argv[index][1:2]
+        if flag in OPTIONS_WITH_ARGS:
+            value = argv[index][2:] or argv[index + 1]
+            index += 1 if argv[index][2:] else 2
+            options.setdefault(flag, []).append(value)
+        else:
+            index += 1
+    host = argv[index].split('@')[-1]
+    return options, host, ' '.join(argv[index + 1:])
+
+def uses_proxy(options):
+    for option in options.get('o', []):
+        if option.lower().startswith('proxycommand'):
+            return True
+    for config_path in options.get('F', []):
+        if os.path.isfile(config_path):
+            with open(config_path) as config_file:
+                if 'proxycommand' in config_file.read().lower():
+                    return True
+    return False
+
+def is_up(config, host):
+    details = fleet_state.read_json(config, 'hosts.json', {}).get(host)
+    if details is None:
+        return True
+    return time.time() - details.get('launched', 0) >= config['boot_delay_s']
+
+def write_output(lines, duration_ms, stream=sys.stdout):
+    # spread output over the duration of the command, as a real bootstrap or salt run would
+    chunks = 10
+    per_chunk = lines // chunks
+    for chunk in range(chunks):
+        count = per_chunk + (lines % chunks if chunk == chunks - 1 else 0)
+        for line in range(count):
+            stream.write('simulated output line %d\n' % (chunk * per_chunk + line))
+        stream.flush()
+        fleet_state.sleep_ms(duration_ms / float(chunks))
+
+def run_sweep(config, command):
+    # echo <script> | base64 -d | bash -s -- <timeout> <host>...
+    args = encoded_script_args(command)
+    timeout = int(args[0])
+    pending = args[1:]
+    start = time.time()
+    while pending:
+        fleet_state.sleep_ms(config['command_ms'])
+        for host in [host for host in pending if is_up(config, host)]:
+            sys.stdout.write('PNDA_SWEEP_UP %s\n' % host)
+            pending.remove(host)
+        sys.stdout.flush()
+        if not pending or time.time() - start >= timeout:
+            break
+        fleet_state.sleep_ms(2000)
+    for host in pending:
+        sys.stdout.write('PNDA_SWEEP_DOWN %s\n' % host)
+    return 0
+
+def encoded_script(command):
+    if '| base64 -d | bash -s --' not in command:
+        return ''
+    return base64.b64decode(command.split()[1])
+
+def encoded_script_args(command):
+    return command.split(' -- ', 1)[1].split()
+
+def launch_job(config, host, command):
+    # echo <launcher> | base64 -d | bash -s -- <job id> <job script>
+    job_id, job_script = encoded_script_args(command)
+    salt_runs = sum(base64.b64decode(job_script).count(salt_command) for salt_command in ['state.highstate', 'state.orchestrate', 'state.sls'])
+    fleet_state.sleep_ms(config['command_ms'])
+    with fleet_state.locked(config):
+        jobs = fleet_state.read_json(config, 'jobs.json', {})
+        key = '%s/%s' % (host, job_id)
+        if key not in jobs:
+            jobs[key] = {'started': time.time(),
+                         'duration_s': salt_runs * config['salt_ms'] / 1000.0,
+                         'exit_code': 1 if fleet_state.chance(config['command_failure_rate']) else 0}
+            fleet_state.write_json(config, 'jobs.json', jobs)
+    sys.stdout.write('PNDA_JOB_STARTED %s\n' % job_id)
+    return 0
+
+def job_status(config, host, command):
+    job_id = encoded_script_args(command)[0]
+    fleet_state.sleep_ms(config['command_ms'])
+    job = fleet_state.read_json(config, 'jobs.json', {}).get('%s/%s' % (host, job_id))
+    if job is None:
+        sys.stdout.write('PNDA_JOB_STATE unknown\n')
+    elif time.time() - job['started'] >= job['duration_s']:
+        sys.stdout.write('PNDA_JOB_STATE finished %s\n' % job['exit_code'])
+    else:
+        sys.stdout.write('PNDA_JOB_STATE running\nsimulated salt output\n')
+    return 0
+
+def base_duration_ms(config, host, command):
+    baked = fleet_state.read_json(config, 'hosts.json', {}).get(host, {}).get('baked', False)
+    return config['baked_bootstrap_ms'] if baked and 'PNDA_BAKE=YES' not in command else config['bootstrap_ms']
+
+def run_phases(config, host, command, phases):
+    # each phase runs unless an earlier attempt left its marker, the node type script is last
+    node_type = phases[-1][1]
+    for marker, script in phases:
+        key = '%s %s' % (host, marker)
+        if key in fleet_state.read_json(config, 'phases.json', {}):
+            continue
+        if script == 'base':
+            write_output(config['output_lines'], base_duration_ms(config, host, command))
+        elif script == node_type:
+            write_output(config['output_lines'], config['node_type_bootstrap_ms'].get(node_type, 0))
+        else:
+            fleet_state.sleep_ms(config['command_ms'])
+        with fleet_state.locked(config):
+            failures = fleet_state.read_json(config, 'phase_failures.json', {})
+            failed = failures.get('%s %s' % (host, script), 0)
+            if script == node_type and failed < config['node_type_bootstrap_failures'].get(node_type, 0):
+                failures['%s %s' % (host, script)] = failed + 1
+                fleet_state.write_json(config, 'phase_failures.json', failures)
+                sys.stderr.write('simulated failure of %s on %s\n' % (script, host))
+                return 1
+            markers = fleet_state.read_json(config, 'phases.json', {})
+            markers[key] = time.time()
+            fleet_state.write_json(config, 'phases.json', markers)
+    return 0
+
+def report_tree(config, _host, _command):
+    # the platform-salt tree on the saltmaster is empty and its git checkout up to date
+    fleet_state.sleep_ms(config['command_ms'])
+    return 0
+
+def report_size(marker):
+    # bundles and tarballs written on a host are all reported at the diagnostic bundle size
+    def report(config, _host, _command):
+        fleet_state.sleep_ms(config['command_ms'])
+        sys.stdout.write('%s %s\n' % (marker, config['diagnostics_bytes']))
+        return 0
+    return report
+
+def list_minions(config, _host, _command):
+    fleet_state.sleep_ms(config['command_ms'])
+    hosts = fleet_state.read_json(config, 'hosts.json', {})
+    minions = [details['minion_id'] for ip_address, details in hosts.items()
+               if 'minion_id' in details and fleet_state.is_bootstrapped(config, ip_address)]
+    sys.stdout.write(json.dumps({'minions': sorted(minions)}, indent=4) + '\n')
+    return 0
+
+def check_bootstrapped(config, host, _command):
+    fleet_state.sleep_ms(config['command_ms'])
+    if fleet_state.is_bootstrapped(config, host):
+        sys.stdout.write('/home/user/.bootstrap_complete\n')
+        return 0
+    sys.stderr.write("ls: cannot access /home/user/.bootstrap_complete: No such file or directory\n")
+    return 2
+
+def run_other(config, host, command):
+    # salt, bootstrap phases, base.sh and anything else, which can be made to fail
+    phases = [(match.group(1), match.group(2)) for match in PHASE.finditer(command)]
+    if 'state.highstate' in command or 'state.orchestrate' in command or 'state.sls' in command:
+        write_output(config['salt_output_lines'], config['salt_ms'])
+    elif phases:
+        if run_phases(config, host, command, phases) != 0:
+            return 1
+    elif 'base.sh' in command:
+        duration_ms = base_duration_ms(config, host, command)
+        node_type = BOOTSTRAP_SCRIPT.findall(command)[-1]
+        duration_ms += config['node_type_bootstrap_ms'].get(node_type, 0)
+        write_output(config['output_lines'], duration_ms)
+    else:
+        fleet_state.sleep_ms(config['command_ms'])
+
+    if fleet_state.chance(config['command_failure_rate']):
+        sys.stderr.write('simulated command failure on %s\n' % host)
+        return 1
+
+    if 'touch ~/.bootstrap_complete' in command:
+        fleet_state.mark_bootstrapped(config, host)
+    return 0
+
+# (marker in an encoded script, handler) for the scripts the CLI sends encoded
+SCRIPT_HANDLERS = [(b'PNDA_SWEEP_UP', lambda config, host, command: run_sweep(config, command)),
+                   (b'PNDA_JOB_STARTED', launch_job),
+                   (b'PNDA_JOB_STATE', job_status),
+                   (b'PNDA_MANIFEST', report_tree),
+                   (b'PNDA_CHANGED', report_tree),
+                   (b'PNDA_DIAGNOSTICS', report_size('PNDA_DIAGNOSTICS')),
+                   (b'PNDA_SALT_TREE', report_size('PNDA_SALT_TREE'))]
+# (test of the command, handler) for plain commands
+COMMAND_HANDLERS = [(lambda command: 'salt-key' in command and '--list=accepted' in command, list_minions),
+                    (lambda command: command.strip().startswith('ls ~/.bootstrap_complete'), check_bootstrapped)]
+
+def run_command(config, host, command):
+    script = encoded_script(command)
+    for marker, handler in SCRIPT_HANDLERS:
+        if marker in script:
+            return handler(config, host, command)
+    for matches, handler in COMMAND_HANDLERS:
+        if matches(command):
+            return handler(config, host, command)
+    return run_other(config, host, command)
+
+def main(argv):
+    config = fleet_state.load_config()
+    options, host, command = parse_args(argv)
+    fleet_state.record_call(config, 'ssh', host)
+    fleet_state.sleep_ms(config['connect_latency_ms'] + (config['proxy_latency_ms'] if uses_proxy(options) else 0))
+    if not is_up(config, host) or fleet_state.chance(config['connect_failure_rate']):
+        sys.stderr.write('ssh: connect to host %s port 22: Connection refused\n' % host)
+        return 255
+    return run_command(config, host, command)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
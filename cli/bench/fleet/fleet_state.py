@@ -0,0 +1,170 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    State shared by the simulated fleet: the fake ssh/scp executables and the boto
+            stand in all read the fleet configuration named by $PNDA_FAKE_FLEET and keep
+            hosts, stacks and bootstrap markers in its state_dir, so that one run of the
+            CLI sees a consistent fleet across all of its child processes.
+
+"""
+
+import os
+import json
+import time
+import fcntl
+import random
+
+from contextlib import contextmanager
+
+CONFIG_ENV = 'PNDA_FAKE_FLEET'
+
+DEFAULTS = {
+    # directory holding hosts.json, stacks.json, jobs.json, images.json, calls.log and bootstrap markers
+    'state_dir': None,
+    # cost of establishing an ssh/scp session, plus the extra hop when going through a bastion
+    'connect_latency_ms': 50,
+    'proxy_latency_ms': 20,
+    # scp throughput
+    'bandwidth_kbps': 100000,
+    # time taken by remote commands: base.sh bootstrap, salt runs and anything else
+    'bootstrap_ms': 1000,
+    # base.sh on an instance launched from a baked image, which skips package installation
+    'baked_bootstrap_ms': 200,
+    # extra bootstrap time of some node types, e.g. {"hadoop-mgr": 3000}
+    'node_type_bootstrap_ms': {},
+    # times the node type script of each host of some node types fails before it succeeds, e.g. {"kafka": 1}
+    'node_type_bootstrap_failures': {},
+    'salt_ms': 5000,
+    'command_ms': 10,
+    # lines of output written by bootstrap and salt commands
+    'output_lines': 50,
+    'salt_output_lines': 2000,
+    # size of the diagnostic bundle each host writes for the collect command
+    'diagnostics_bytes': 65536,
+    # probability of a session being refused and of a remote command failing
+    'connect_failure_rate': 0.0,
+    'command_failure_rate': 0.0,
+    # seconds after a cloud instance is launched before it accepts ssh connections
+    'boot_delay_s': 0,
+    # seconds a stack spends in each *_IN_PROGRESS state
+    'stack_create_s': 0,
+    # seconds into stack creation by which every instance is running, instances start running
+    # one after another in template order until then
+    'instance_create_s': 0,
+    # stack creation ends in ROLLBACK_COMPLETE instead of CREATE_COMPLETE
+    'stack_create_fails': False,
+    'stack_update_s': 0,
+    'stack_delete_s': 0,
+    # seconds an image spends pending before it is available
+    'image_create_s': 0,
+    # probability of an AWS API call failing with a Throttling error
+    'api_throttle_rate': 0.0
+}
+
+# sitecustomize may scale time.sleep for the CLI process, simulated latency is never scaled
+_sleep = getattr(time, '_unscaled_sleep', time.sleep)
+
+def load_config():
+    with open(os.environ[CONFIG_ENV]) as config_file:
+        config = json.load(config_file)
+    merged = dict(DEFAULTS)
+    merged.update(config)
+    return merged
+
+def sleep_ms(millis):
+    if millis > 0:
+        _sleep(millis / 1000.0)
+
+def chance(rate):
+    return rate > 0 and random.random() < rate
+
+def state_file(config, name):
+    return os.path.join(config['state_dir'], name)
+
+@contextmanager
+def locked(config):
+    with open(state_file(config, 'lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_json(config, name, default):
+    path = state_file(config, name)
+    if not os.path.isfile(path):
+        return default
+    with open(path) as infile:
+        return json.load(infile)
+
+def write_json(config, name, data):
+    path = state_file(config, name)
+    with open(path + '.tmp', 'w') as outfile:
+        json.dump(data, outfile, indent=2, sort_keys=True)
+    os.rename(path + '.tmp', path)
+
+def register_hosts(config, hosts):
+    '''
+    Add or replace hosts, given as {ip: {'minion_id': ..., 'launched': ...}}
+    '''
+    with locked(config):
+        known = read_json(config, 'hosts.json', {})
+        known.update(hosts)
+        write_json(config, 'hosts.json', known)
+
+def forget_hosts(config, ips):
+    with locked(config):
+        known = read_json(config, 'hosts.json', {})
+        for ip_address in ips:
+            known.pop(ip_address, None)
+            marker = bootstrap_marker(config, ip_address)
+            if os.path.exists(marker):
+                os.remove(marker)
+        write_json(config, 'hosts.json', known)
+
+def bootstrap_marker(config, ip_address):
+    return os.path.join(config['state_dir'], 'bootstrapped', ip_address)
+
+def is_bootstrapped(config, ip_address):
+    return os.path.exists(bootstrap_marker(config, ip_address))
+
+def mark_bootstrapped(config, ip_address):
+    marker_dir = os.path.join(config['state_dir'], 'bootstrapped')
+    if not os.path.isdir(marker_dir):
+        try:
+            os.makedirs(marker_dir)
+        except OSError:
+            pass
+    open(bootstrap_marker(config, ip_address), 'a').close()
+
+def record_call(config, kind, target=''):
+    '''
+    Append one line per simulated network call, for the benchmark to count
+    '''
+    fd = os.open(state_file(config, 'calls.log'), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, ('%s\t%s\t%.3f\n' % (kind, target, time.time())).encode('utf-8'))
+    finally:
+        os.close(fd)
+
+def count_calls(state_dir):
+    counts = {}
+    path = os.path.join(state_dir, 'calls.log')
+    if os.path.isfile(path):
+        with open(path) as calls:
+            for line in calls:
+                kind = line.split('\t', 1)[0]
+                counts[kind] = counts.get(kind, 0) + 1
+    return counts
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+Purpose:    Generate existing machines definition files of any size for the simulated fleet
+
+Usage:      python bench/fleet/generate_machines.py --nodes 100 --flavor pico -o /tmp/pico-100.json
+                [--no-bastion] [--cluster NAME --state-dir DIR]
+
+The flavor's definition in existing-machines/ is used as a template. Every node in it is
+kept, apart from datanodes, which are added until the file describes --nodes machines.
+All machines are given fresh private addresses. With --state-dir, the machines are also
+registered with a simulated fleet so that salt-key lists them once they are bootstrapped.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import fleet_state
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+
+def generate(flavor, nodes, bastion=True):
+    with open(os.path.join(REPO_ROOT, 'existing-machines', '%s.json' % flavor)) as template_file:
+        template = json.load(template_file)
+
+    machines = {}
+    for name, details in template.items():
+        if details['node_type'] == 'hadoop-dn' or (details.get('is_bastion') and not bastion):
+            continue
+        machines[name] = dict(details)
+
+    if nodes <= len(machines):
+        raise ValueError('%s needs at least %s nodes' % (flavor, len(machines) + 1))
+
+    # addresses follow the order nodes are added in, so a larger file for the same
+    # flavor describes the same machines plus some new ones, as for an expand
+    order = sorted(machines)
+    datanode = 0
+    while len(machines) < nodes:
+        name = 'hadoop-dn-%s' % datanode
+        machines[name] = {'node_type': 'hadoop-dn'}
+        order.append(name)
+        datanode += 1
+
+    for index, name in enumerate(order):
+        host = index + 10
+        machines[name]['ip_address'] = '10.%d.%d.%d' % (host >> 16, (host >> 8) & 255, host & 255)
+        if machines[name].get('is_bastion'):
+            machines[name]['public_ip_address'] = '203.0.113.%d' % (index % 250 + 1)
+    return machines
+
+def register(machines, cluster, state_dir):
+    config = dict(fleet_state.DEFAULTS)
+    config['state_dir'] = state_dir
+    hosts = {}
+    for name, details in machines.items():
+        hosts[details['ip_address']] = {'minion_id': '%s-%s' % (cluster, name), 'launched': 0}
+    fleet_state.register_hosts(config, hosts)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate an existing machines definition for the simulated fleet')
+    parser.add_argument('--nodes', type=int, required=True, help='Total number of machines')
+    parser.add_argument('--flavor', default='pico', help='Flavor whose existing machines definition is used as a template')
+    parser.add_argument('--no-bastion', action='store_true', help='Leave the bastion out, so hosts are reached directly')
+    parser.add_argument('--cluster', help='Cluster name, used for minion ids when registering with --state-dir')
+    parser.add_argument('--state-dir', help='Register the machines with the simulated fleet in this directory')
+    parser.add_argument('-o', '--output', required=True, help='File to write')
+    args = parser.parse_args()
+
+    machines = generate(args.flavor, args.nodes, not args.no_bastion)
+    with open(args.output, 'w') as outfile:
+        json.dump(machines, outfile, indent=4, sort_keys=True)
+    if args.state_dir:
+        if not args.cluster:
+            parser.error('--cluster is required with --state-dir')
+        register(machines, args.cluster, args.state_dir)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Shared plumbing for the simulated boto connections
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+import fleet_state #pylint: disable=C0413
+
+from boto.exception import BotoServerError #pylint: disable=C0413
+
+class FakeConnection(object):
+
+    def __init__(self, service, region):
+        self.config = fleet_state.load_config()
+        self.service = service
+        self.region = region
+
+    def api_call(self, operation):
+        fleet_state.record_call(self.config, 'aws', '%s.%s' % (self.service, operation))
+        fleet_state.sleep_ms(self.config['connect_latency_ms'])
+        if fleet_state.chance(self.config['api_throttle_rate']):
+            raise BotoServerError(400, 'Bad Request', '<Code>Throttling</Code><Message>Rate exceeded</Message>', 'Throttling')
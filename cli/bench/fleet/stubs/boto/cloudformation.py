@@ -0,0 +1,231 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Simulated fleet stand in for boto.cloudformation. Stacks move to *_COMPLETE after
+            the configured number of seconds. Their instances are the AWS::EC2::Instance
+            resources of the template, registered with the fleet so ssh to them works.
+            Instances start running one after another while the stack is being created, and
+            their resources are listed as complete once they are running.
+            When the template has a wait condition, instances bootstrap themselves: creation
+            takes the bootstrap time longer, fails if the bootstrap bundle parameter does not
+            point at an uploaded bundle and otherwise marks every instance bootstrapped.
+            Instances launched from an image made with the ec2 stand in are marked baked.
+
+"""
+
+import os
+import json
+import time
+
+from boto import _fleet
+from boto.exception import BotoServerError
+
+def read_stacks(config):
+    return _fleet.fleet_state.read_json(config, 'stacks.json', {})
+
+def _resolve(value, parameters):
+    if isinstance(value, dict) and 'Ref' in value:
+        return parameters.get(value['Ref'], value['Ref'])
+    if isinstance(value, dict) and 'Fn::Join' in value:
+        separator, parts = value['Fn::Join']
+        return separator.join([_resolve(part, parameters) for part in parts])
+    return value
+
+def _template_instances(template_body, parameters):
+    instances = {}
+    for logical_id, resource in json.loads(template_body)['Resources'].items():
+        if resource['Type'] == 'AWS::EC2::Instance':
+            tags = dict((tag['Key'], _resolve(tag['Value'], parameters)) for tag in resource['Properties'].get('Tags', []))
+            instances[tags['Name']] = (logical_id, tags, _resolve(resource['Properties'].get('ImageId'), parameters))
+    return instances
+
+def _template_body(template_body, template_url):
+    if template_url is None:
+        return template_body
+    with open(template_url.replace('file://', '', 1)) as template_file:
+        return template_file.read()
+
+def _is_self_bootstrap(template_body):
+    return any(resource['Type'] == 'AWS::CloudFormation::WaitCondition' for resource in json.loads(template_body)['Resources'].values())
+
+def _merge_parameters(previous, parameters):
+    # (key, value) or (key, value, use_previous_value) tuples, as boto takes them
+    merged = {}
+    for parameter in parameters:
+        key, value = parameter[:2]
+        merged[key] = previous.get(key) if len(parameter) > 2 and parameter[2] else value
+    return merged
+
+class Parameter(object): #pylint: disable=R0903
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+class Stack(object): #pylint: disable=R0903
+    def __init__(self, name, status, parameters=None):
+        self.stack_name = name
+        self.stack_status = status
+        self.parameters = [Parameter(key, value) for key, value in sorted((parameters or {}).items())]
+
+class EventPage(list):
+    next_token = None
+
+class ResourcePage(list):
+    next_token = None
+
+class StackResourceSummary(object): #pylint: disable=R0903
+    def __init__(self, logical_id, physical_id, resource_type, status):
+        self.logical_resource_id = logical_id
+        self.physical_resource_id = physical_id
+        self.resource_type = resource_type
+        self.resource_status = status
+
+def is_running(details):
+    return time.time() >= details.get('running_at', 0)
+
+class CloudFormationConnection(_fleet.FakeConnection):
+
+    def __init__(self, region):
+        super(CloudFormationConnection, self).__init__('cloudformation', region)
+
+    def _apply_template(self, stacks, stack_name, template_body, parameters):
+        stack = stacks.setdefault(stack_name, {'instances': {}})
+        stack['parameters'] = _merge_parameters(stack.get('parameters', {}), parameters)
+        if 'self_bootstrap' not in stack:
+            stack['self_bootstrap'] = _is_self_bootstrap(template_body)
+        wanted = _template_instances(template_body, stack['parameters'])
+        images = _fleet.fleet_state.read_json(self.config, 'images.json', {})
+        used_ips = set([details['private_ip_address'] for other in stacks.values() for details in other['instances'].values()])
+        next_ip = len(used_ips)
+        now = time.time()
+        new_hosts = {}
+        new_names = sorted(name for name in wanted if name not in stack['instances'])
+        for name, (logical_id, tags, image_id) in sorted(wanted.items()):
+            if name in stack['instances']:
+                continue
+            running_at = now + self.config['instance_create_s'] * (new_names.index(name) + 1) / float(len(new_names))
+            while True:
+                next_ip += 1
+                ip_address = '10.%d.%d.%d' % (next_ip >> 16, (next_ip >> 8) & 255, next_ip & 255)
+                if ip_address not in used_ips:
+                    break
+            details = {'tags': tags, 'private_ip_address': ip_address, 'instance_id': 'i-%08x' % next_ip, 'image_id': image_id,
+                       'logical_id': logical_id, 'running_at': running_at}
+            if tags.get('node_type') == 'bastion':
+                details['ip_address'] = '203.0.%d.%d' % ((next_ip >> 8) & 255, next_ip & 255)
+            stack['instances'][name] = details
+            new_hosts[ip_address] = {'minion_id': name, 'launched': running_at, 'baked': image_id in images}
+            if 'ip_address' in details:
+                new_hosts[details['ip_address']] = {'launched': running_at}
+        return new_hosts
+
+    def _set_status(self, stack_name, status, template_body=None, parameters=None):
+        new_hosts = {}
+        with _fleet.fleet_state.locked(self.config):
+            stacks = read_stacks(self.config)
+            if template_body is not None:
+                new_hosts = self._apply_template(stacks, stack_name, template_body, parameters)
+            stacks[stack_name]['status'] = status
+            stacks[stack_name]['changed'] = time.time()
+            _fleet.fleet_state.write_json(self.config, 'stacks.json', stacks)
+        if new_hosts:
+            _fleet.fleet_state.register_hosts(self.config, new_hosts)
+
+    def list_stacks(self):
+        self.api_call('ListStacks')
+        return [Stack(name, stack['status']) for name, stack in read_stacks(self.config).items()]
+
+    def create_stack(self, stack_name, template_body=None, template_url=None, parameters=None):
+        self.api_call('CreateStack')
+        template_body = _template_body(template_body, template_url)
+        if read_stacks(self.config).get(stack_name, {}).get('status', 'DELETE_COMPLETE') != 'DELETE_COMPLETE':
+            raise BotoServerError(400, 'Bad Request', 'Stack [%s] already exists' % stack_name, 'AlreadyExistsException')
+        self._set_status(stack_name, 'CREATE_IN_PROGRESS', template_body, parameters or [])
+
+    def update_stack(self, stack_name, template_body=None, template_url=None, parameters=None):
+        self.api_call('UpdateStack')
+        template_body = _template_body(template_body, template_url)
+        self._existing(stack_name)
+        self._set_status(stack_name, 'UPDATE_IN_PROGRESS', template_body, parameters or [])
+
+    def delete_stack(self, stack_name):
+        self.api_call('DeleteStack')
+        self._set_status(stack_name, 'DELETE_IN_PROGRESS')
+
+    def _existing(self, stack_name):
+        stack = read_stacks(self.config).get(stack_name)
+        if stack is None or stack['status'] == 'DELETE_COMPLETE':
+            raise BotoServerError(400, 'Bad Request', 'Stack with id %s does not exist' % stack_name, 'ValidationError')
+        return stack
+
+    def describe_stacks(self, stack_name_or_id=None):
+        self.api_call('DescribeStacks')
+        stack = self._existing(stack_name_or_id)
+        status = stack['status']
+        if status.endswith('_IN_PROGRESS'):
+            operation = status.split('_')[0].lower()
+            duration = self.config['stack_%s_s' % operation]
+            self_bootstrapping = status == 'CREATE_IN_PROGRESS' and stack.get('self_bootstrap')
+            if self_bootstrapping:
+                # instances bootstrap in parallel at boot, the wait condition completes when the slowest has
+                duration += self.config['boot_delay_s'] + self.config['bootstrap_ms'] / 1000.0
+            if time.time() - stack['changed'] >= duration:
+                status = status.replace('_IN_PROGRESS', '_COMPLETE')
+                if status == 'DELETE_COMPLETE':
+                    self._delete(stack_name_or_id)
+                    raise BotoServerError(400, 'Bad Request', 'Stack with id %s does not exist' % stack_name_or_id, 'ValidationError')
+                if self_bootstrapping:
+                    status = self._self_bootstrap(stack)
+                if status == 'CREATE_COMPLETE' and self.config['stack_create_fails']:
+                    status = 'ROLLBACK_COMPLETE'
+                self._set_status(stack_name_or_id, status)
+        return [Stack(stack_name_or_id, status, stack.get('parameters'))]
+
+    def _self_bootstrap(self, stack):
+        bundle_url = stack['parameters'].get('bootstrapBundleUrl', '')
+        if not os.path.isfile(bundle_url.replace('file://', '', 1)):
+            return 'CREATE_FAILED'
+        for details in stack['instances'].values():
+            _fleet.fleet_state.mark_bootstrapped(self.config, details['private_ip_address'])
+        return 'CREATE_COMPLETE'
+
+    def _delete(self, stack_name):
+        with _fleet.fleet_state.locked(self.config):
+            stacks = read_stacks(self.config)
+            stack = stacks.pop(stack_name)
+            _fleet.fleet_state.write_json(self.config, 'stacks.json', stacks)
+        ips = []
+        for details in stack['instances'].values():
+            ips.append(details['private_ip_address'])
+            if 'ip_address' in details:
+                ips.append(details['ip_address'])
+        _fleet.fleet_state.forget_hosts(self.config, ips)
+
+    def list_stack_resources(self, stack_name_or_id=None, next_token=None): #pylint: disable=W0613
+        self.api_call('ListStackResources')
+        stack = self._existing(stack_name_or_id)
+        resources = ResourcePage()
+        for details in stack['instances'].values():
+            running = is_running(details)
+            resources.append(StackResourceSummary(details.get('logical_id'), details['instance_id'] if running else None, 'AWS::EC2::Instance',
+                                                  'CREATE_COMPLETE' if running else 'CREATE_IN_PROGRESS'))
+        return resources
+
+    def describe_stack_events(self, stack_name_or_id=None, next_token=None): #pylint: disable=W0613
+        self.api_call('DescribeStackEvents')
+        return EventPage()
+
+def connect_to_region(region_name, **_):
+    return CloudFormationConnection(region_name)
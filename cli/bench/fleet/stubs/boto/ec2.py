@@ -0,0 +1,94 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Simulated fleet stand in for boto.ec2. Instances are those of the stacks made with
+            the cloudformation stand in. Images made from them are kept in images.json and
+            become available after the configured number of seconds.
+
+"""
+
+import time
+
+from boto import _fleet
+from boto import cloudformation
+
+REGIONS = ['us-east-1', 'us-east-2', 'us-west-1', 'us-west-2', 'eu-west-1', 'eu-west-2', 'eu-central-1',
+           'ap-south-1', 'ap-southeast-1', 'ap-southeast-2', 'ap-northeast-1', 'sa-east-1']
+
+class RegionInfo(object): #pylint: disable=R0903
+    def __init__(self, name):
+        self.name = name
+
+class KeyPair(object): #pylint: disable=R0903
+    def __init__(self, name):
+        self.name = name
+
+class Instance(object): #pylint: disable=R0903
+    def __init__(self, details):
+        self.id = details['instance_id'] #pylint: disable=C0103
+        self.tags = details['tags']
+        self.private_ip_address = details['private_ip_address']
+        self.ip_address = details.get('ip_address')
+        self.public_dns_name = details.get('public_dns_name', '')
+        self.state = 'running' if cloudformation.is_running(details) else 'pending'
+
+class Image(object): #pylint: disable=R0903
+    def __init__(self, image_id, state):
+        self.id = image_id #pylint: disable=C0103
+        self.state = state
+
+class Reservation(object): #pylint: disable=R0903
+    def __init__(self, instances):
+        self.instances = instances
+
+class EC2Connection(_fleet.FakeConnection):
+
+    def __init__(self, region):
+        super(EC2Connection, self).__init__('ec2', region)
+
+    def get_all_reservations(self, instance_ids=None):
+        self.api_call('DescribeInstances')
+        reservations = []
+        for stack in cloudformation.read_stacks(self.config).values():
+            if stack['status'] != 'DELETE_COMPLETE':
+                reservations.append(Reservation([Instance(details) for details in stack['instances'].values()
+                                                 if instance_ids is None or details['instance_id'] in instance_ids]))
+        return reservations
+
+    def create_image(self, instance_id, name, description=None, no_reboot=False): #pylint: disable=W0613
+        self.api_call('CreateImage')
+        with _fleet.fleet_state.locked(self.config):
+            images = _fleet.fleet_state.read_json(self.config, 'images.json', {})
+            image_id = 'ami-%08x' % (len(images) + 1)
+            images[image_id] = {'name': name, 'instance_id': instance_id, 'created': time.time()}
+            _fleet.fleet_state.write_json(self.config, 'images.json', images)
+        return image_id
+
+    def get_all_images(self, image_ids=None, owners=None): #pylint: disable=W0613
+        self.api_call('DescribeImages')
+        images = _fleet.fleet_state.read_json(self.config, 'images.json', {})
+        now = time.time()
+        return [Image(image_id, 'available' if now - image['created'] >= self.config['image_create_s'] else 'pending')
+                for image_id, image in sorted(images.items()) if image_ids is None or image_id in image_ids]
+
+    def get_key_pair(self, keyname):
+        self.api_call('DescribeKeyPairs')
+        return KeyPair(keyname)
+
+def regions():
+    return [RegionInfo(name) for name in REGIONS]
+
+def connect_to_region(region_name, **_):
+    return EC2Connection(region_name)
@@ -0,0 +1,27 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Simulated fleet stand in for boto.exception
+
+"""
+
+class BotoServerError(Exception):
+
+    def __init__(self, status, reason, body=None, error_code=None):
+        super(BotoServerError, self).__init__('%s %s %s' % (status, reason, body or ''))
+        self.status = status
+        self.reason = reason
+        self.body = body
+        self.error_code = error_code
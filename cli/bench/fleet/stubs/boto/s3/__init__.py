@@ -0,0 +1,80 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Simulated fleet stand in for boto.s3. Objects are files under s3/<bucket>/ in the
+            fleet state_dir, and their URLs are file:// URLs.
+
+"""
+
+import os
+import shutil
+
+from boto import _fleet
+
+def object_path(config, bucket_name, key_name):
+    return os.path.join(config['state_dir'], 's3', bucket_name, key_name)
+
+class Key(object):
+
+    def __init__(self, connection, bucket_name, name):
+        self.connection = connection
+        self.bucket_name = bucket_name
+        self.name = name
+
+    def _path(self):
+        return object_path(self.connection.config, self.bucket_name, self.name)
+
+    def set_contents_from_filename(self, filename):
+        self.connection.api_call('PutObject')
+        _fleet.fleet_state.sleep_ms(os.path.getsize(filename) * 8 / float(self.connection.config['bandwidth_kbps']))
+        if not os.path.isdir(os.path.dirname(self._path())):
+            os.makedirs(os.path.dirname(self._path()))
+        shutil.copyfile(filename, self._path())
+
+    def set_contents_from_string(self, contents):
+        self.connection.api_call('PutObject')
+        if not os.path.isdir(os.path.dirname(self._path())):
+            os.makedirs(os.path.dirname(self._path()))
+        with open(self._path(), 'w') as object_file:
+            object_file.write(contents)
+
+    def generate_url(self, expires_in): #pylint: disable=W0613
+        return 'file://%s' % self._path()
+
+    def delete(self):
+        self.connection.api_call('DeleteObject')
+        if os.path.exists(self._path()):
+            os.remove(self._path())
+
+class Bucket(object):
+
+    def __init__(self, connection, name):
+        self.connection = connection
+        self.name = name
+
+    def new_key(self, key_name=None):
+        return Key(self.connection, self.name, key_name)
+
+class S3Connection(_fleet.FakeConnection):
+
+    def __init__(self, region):
+        super(S3Connection, self).__init__('s3', region)
+
+    def get_bucket(self, bucket_name):
+        self.api_call('HeadBucket')
+        return Bucket(self, bucket_name)
+
+def connect_to_region(region_name, **_):
+    return S3Connection(region_name)
@@ -0,0 +1,35 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Simulated fleet stand in for requests.head, used by the PNDA mirror check
+
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fleet_state #pylint: disable=C0413
+
+class Response(object): #pylint: disable=R0903
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+def head(url, **_):
+    config = fleet_state.load_config()
+    fleet_state.record_call(config, 'http', url)
+    fleet_state.sleep_ms(config['connect_latency_ms'])
+    return Response(200)
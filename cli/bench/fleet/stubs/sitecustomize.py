@@ -0,0 +1,30 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Imported automatically at interpreter start up while the stubs directory is on
+            PYTHONPATH. If $PNDA_FAKE_FLEET_SLEEP_SCALE is set, every time.sleep in the
+            process is scaled by it, so that the fixed waits in pnda-cli.py (bastion
+            staggering, stack polling, the pause before salt runs) can be shortened.
+            Latency simulated by the fleet itself is not scaled.
+
+"""
+
+import os
+import time
+
+if os.environ.get('PNDA_FAKE_FLEET_SLEEP_SCALE') and not hasattr(time, '_unscaled_sleep'):
+    _SCALE = float(os.environ['PNDA_FAKE_FLEET_SLEEP_SCALE'])
+    time._unscaled_sleep = time.sleep #pylint: disable=W0212
+    time.sleep = lambda seconds: time._unscaled_sleep(seconds * _SCALE) #pylint: disable=W0212
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+Purpose:    End to end benchmark of create, expand and destroy against a simulated fleet
+
+Usage:      python bench/fleet_benchmark.py [--nodes 10,100,1000] [--sleep-scale 0.1]
+                [--fleet-config fleet.json] [--python /path/to/python2] [--runs N] [--json]
+
+pnda-cli.py runs unmodified from a scratch copy of the repository, with fake ssh and scp
+executables first on PATH and stand ins for boto and requests first on PYTHONPATH (see
+bench/fleet). Each run covers:
+
+    - create, expand (+10% datanodes) and destroy of generated existing machines
+      definitions for each --nodes size
+    - create, expand and destroy of a pico flavor Cloud Formation stack, bootstrapped over
+      ssh, again with --self-bootstrap (-sb) and again with --overlap-stack (-ov)
+    - bake of pico flavor images, then create, expand and destroy of a stack using them (-bk)
+
+and reports wall clock time, CPU time (including the fake ssh/scp processes), peak RSS
+and the number of simulated ssh, scp and AWS API calls for each command.
+
+Latency, bandwidth, command durations, output volume and failure rates are set with
+--fleet-config, a JSON file overriding DEFAULTS in bench/fleet/fleet_state.py. The fixed
+waits in pnda-cli.py (bastion connection staggering, stack polling and the pause before
+running salt) are multiplied by --sleep-scale, set it to 1 for true wall clock times.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+
+import startup_benchmark
+
+FLEET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fleet')
+sys.path.insert(0, FLEET_DIR)
+
+import fleet_state #pylint: disable=C0413
+import generate_machines #pylint: disable=C0413
+
+KEYNAME = 'fleet-bench'
+
+def prepare_fleet(scratch, python, fleet_config, sleep_scale):
+    '''
+    Lay out a simulated fleet in a scratch tree and return the environment that points pnda-cli.py at it
+    '''
+    state_dir = os.path.join(scratch, 'fleet-state')
+    os.mkdir(state_dir)
+    bin_dir = os.path.join(scratch, 'bin')
+    os.mkdir(bin_dir)
+    for name in ['ssh', 'scp']:
+        wrapper = os.path.join(bin_dir, name)
+        with open(wrapper, 'w') as wrapper_file:
+            wrapper_file.write('#!/bin/sh\nexec "%s" "%s" "$@"\n' % (python, os.path.join(FLEET_DIR, 'fake_%s.py' % name)))
+        os.chmod(wrapper, 0o755)
+
+    config = dict(fleet_config)
+    config['state_dir'] = state_dir
+    config_path = os.path.join(scratch, 'fleet.json')
+    with open(config_path, 'w') as config_file:
+        json.dump(config, config_file, indent=4)
+
+    with open(os.path.join(scratch, '%s.pem' % KEYNAME), 'w') as key_file:
+        key_file.write('simulated fleet key\n')
+
+    pnda_env_path = os.path.join(scratch, 'pnda_env.yaml')
+    with open(pnda_env_path) as pnda_env_file:
+        pnda_env = pnda_env_file.read()
+    with open(pnda_env_path, 'w') as pnda_env_file:
+        pnda_env_file.write(pnda_env.replace('# BOOTSTRAP_BUCKET:', 'BOOTSTRAP_BUCKET:'))
+
+    env = dict(os.environ)
+    env['PATH'] = '%s%s%s' % (bin_dir, os.pathsep, env.get('PATH', ''))
+    env['PYTHONPATH'] = os.path.join(FLEET_DIR, 'stubs')
+    env[fleet_state.CONFIG_ENV] = config_path
+    env['PNDA_FAKE_FLEET_SLEEP_SCALE'] = str(sleep_scale)
+    return env, state_dir
+
+def run_cli(python, scratch, env, state_dir, args):
+    calls_before = fleet_state.count_calls(state_dir)
+    with open(os.devnull, 'w') as devnull:
+        start = time.time()
+        process = subprocess.Popen([python, os.path.join(scratch, 'cli', 'pnda-cli.py')] + args,
+                                   cwd=scratch, env=env, stdout=devnull, stderr=devnull)
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.time() - start
+    exit_code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    process.returncode = exit_code
+    if exit_code != 0:
+        raise Exception('pnda-cli.py %s exited with %s, see logs in %s' % (' '.join(args), exit_code, os.path.join(scratch, 'cli', 'logs')))
+    calls_after = fleet_state.count_calls(state_dir)
+    calls = dict((kind, calls_after.get(kind, 0) - calls_before.get(kind, 0)) for kind in ['ssh', 'scp', 'aws'])
+    return {'wall_s': wall,
+            'cpu_s': rusage.ru_utime + rusage.ru_stime,
+            'peak_rss_mb': rusage.ru_maxrss / 1024.0,
+            'ssh_calls': calls['ssh'],
+            'scp_calls': calls['scp'],
+            'aws_calls': calls['aws']}
+
+def existing_machines_commands(scratch, state_dir, nodes):
+    cluster = 'fleet-m%s' % nodes
+    definitions = []
+    for count in [nodes, nodes + max(1, nodes // 10)]:
+        machines = generate_machines.generate('pico', count)
+        generate_machines.register(machines, cluster, state_dir)
+        path = os.path.join('existing-machines', '%s-%s.json' % (cluster, count))
+        with open(os.path.join(scratch, path), 'w') as outfile:
+            json.dump(machines, outfile, indent=4)
+        definitions.append(path)
+    return [('create -m', nodes, ['create', '-e', cluster, '-f', 'pico', '-s', KEYNAME, '-m', definitions[0]]),
+            ('expand -m', nodes, ['expand', '-e', cluster, '-f', 'pico', '-s', KEYNAME, '-m', definitions[1]]),
+            ('destroy -m', nodes, ['destroy', '-e', cluster, '-m', definitions[1]])]
+
+def cloud_commands():
+    commands = []
+    # baking comes last, as creates of the flavor use the images from then on
+    for suffix, extra_args in [('', []), (' -sb', ['--self-bootstrap']), (' -ov', ['--overlap-stack']), (' -bk', [])]:
+        cluster = 'fleet-cfn%s' % suffix.replace(' ', '')
+        if suffix == ' -bk':
+            commands.append(('bake', 7, ['bake', '-f', 'pico', '-s', KEYNAME]))
+        create_args = ['create', '-e', cluster, '-f', 'pico', '-s', KEYNAME, '-n', '1', '-k', '1', '-o', '0', '-z', '0'] + extra_args
+        commands.extend([('create%s' % suffix, 5, create_args),
+                         ('expand%s' % suffix, 7, ['expand', '-e', cluster, '-f', 'pico', '-s', KEYNAME, '-n', '3', '-k', '1']),
+                         ('destroy%s' % suffix, 7, ['destroy', '-e', cluster])])
+    return commands
+
+def run_suite(python, node_sizes, fleet_config, sleep_scale, keep=False):
+    scratch = startup_benchmark.make_scratch_tree()
+    try:
+        env, state_dir = prepare_fleet(scratch, python, fleet_config, sleep_scale)
+        commands = []
+        for nodes in node_sizes:
+            commands.extend(existing_machines_commands(scratch, state_dir, nodes))
+        commands.extend(cloud_commands())
+
+        results = []
+        for name, nodes, args in commands:
+            result = run_cli(python, scratch, env, state_dir, args)
+            result.update({'command': name, 'nodes': nodes})
+            results.append(result)
+        return results
+    finally:
+        if keep:
+            print 'Scratch tree kept in %s' % scratch
+        else:
+            shutil.rmtree(scratch)
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pnda-cli.py create, expand and destroy against a simulated fleet')
+    parser.add_argument('--nodes', default='10,100', help='Comma separated existing machines cluster sizes')
+    parser.add_argument('--runs', type=int, default=1, help='Repetitions of the whole suite, medians are reported')
+    parser.add_argument('--sleep-scale', type=float, default=0.1, help='Multiplier for the fixed waits in pnda-cli.py')
+    parser.add_argument('--fleet-config', help='JSON file overriding the simulated fleet defaults')
+    parser.add_argument('--python', default=sys.executable, help='Interpreter used to run pnda-cli.py and the fake ssh/scp')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch tree, with its logs and fleet state')
+    args = parser.parse_args()
+
+    fleet_config = {}
+    if args.fleet_config:
+        with open(args.fleet_config) as config_file:
+            fleet_config = json.load(config_file)
+    node_sizes = [int(size) for size in args.nodes.split(',')]
+
+    runs = [run_suite(args.python, node_sizes, fleet_config, args.sleep_scale, args.keep) for _ in xrange(args.runs)]
+    results = []
+    for index, first in enumerate(runs[0]):
+        result = {'command': first['command'], 'nodes': first['nodes'], 'runs': args.runs}
+        for metric in ['wall_s', 'cpu_s', 'peak_rss_mb']:
+            result[metric] = round(median([run[index][metric] for run in runs]), 2)
+        for metric in ['ssh_calls', 'scp_calls', 'aws_calls']:
+            result[metric] = median([run[index][metric] for run in runs])
+        results.append(result)
+
+    if args.json:
+        print json.dumps({'sleep_scale': args.sleep_scale, 'results': results}, sort_keys=True, indent=4)
+        return
+
+    print 'Fixed waits in pnda-cli.py scaled by %s' % args.sleep_scale
+    print '%-12s %6s %9s %9s %12s %6s %6s %6s' % ('command', 'nodes', 'wall s', 'cpu s', 'peak rss MB', 'ssh', 'scp', 'aws')
+    for result in results:
+        print '%-12s %6s %9s %9s %12s %6s %6s %6s' % (result['command'], result['nodes'], result['wall_s'], result['cpu_s'],
+                                                      result['peak_rss_mb'], result['ssh_calls'], result['scp_calls'], result['aws_calls'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Measure cold start up time of pnda-cli.py for invocations that never touch AWS
+
+Usage:      python bench/startup_benchmark.py [--runs N] [--python /path/to/python2]
+
+The CLI is run from a scratch copy of the repository so that the benchmark never
+touches the real pnda_env.yaml, ssh configs or logs of the working tree.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+# -m paths are relative to the repository root, which is the working directory
+# pnda-cli.py switches to once the command line is parsed
+SCENARIOS = [
+    ('--help', ['--help'], [0]),
+    ('destroy -m', ['destroy', '-e', 'startup-bench', '-m', 'existing-machines/pico.json'], [0]),
+    ('bad argument', ['frobnicate'], [2])
+]
+
+def make_scratch_tree():
+    scratch = tempfile.mkdtemp(prefix='pnda-cli-bench-')
+    os.mkdir(os.path.join(scratch, 'cli'))
+    os.mkdir(os.path.join(scratch, 'cli', 'logs'))
+    for name in os.listdir(os.path.join(REPO_ROOT, 'cli')):
+        if name.endswith('.py'):
+            shutil.copy(os.path.join(REPO_ROOT, 'cli', name), os.path.join(scratch, 'cli', name))
+    for directory in ['cloud-formation', 'bootstrap-scripts', 'existing-machines']:
+        shutil.copytree(os.path.join(REPO_ROOT, directory), os.path.join(scratch, directory))
+    shutil.copy(os.path.join(REPO_ROOT, 'pnda_env_example.yaml'), os.path.join(scratch, 'pnda_env.yaml'))
+    return scratch
+
+def run_scenario(python, scratch, args, expected_codes, runs):
+    cli_dir = os.path.join(scratch, 'cli')
+    logs_dir = os.path.join(cli_dir, 'logs')
+    timings = []
+    logs_before = len(os.listdir(logs_dir))
+    with open(os.devnull, 'w') as devnull:
+        for _ in xrange(runs):
+            start = time.time()
+            ret_val = subprocess.call([python, 'pnda-cli.py'] + args, cwd=cli_dir, stdout=devnull, stderr=devnull)
+            timings.append(time.time() - start)
+            if ret_val not in expected_codes:
+                raise Exception('pnda-cli.py %s exited with %s' % (' '.join(args), ret_val))
+    timings.sort()
+    return {'runs': runs,
+            'min_ms': round(timings[0] * 1000, 1),
+            'median_ms': round(timings[len(timings) // 2] * 1000, 1),
+            'max_ms': round(timings[-1] * 1000, 1),
+            'log_files_created': len(os.listdir(logs_dir)) - logs_before}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cold start up of pnda-cli.py')
+    parser.add_argument('--runs', type=int, default=10, help='Invocations per scenario')
+    parser.add_argument('--python', default=sys.executable, help='Interpreter used to run pnda-cli.py')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    scratch = make_scratch_tree()
+    try:
+        results = {}
+        for name, cli_args, expected_codes in SCENARIOS:
+            results[name] = run_scenario(args.python, scratch, cli_args, expected_codes, args.runs)
+    finally:
+        shutil.rmtree(scratch)
+
+    if args.json:
+        print json.dumps(results, sort_keys=True, indent=4)
+        return
+
+    print '%-14s %10s %10s %10s %10s' % ('scenario', 'min ms', 'median ms', 'max ms', 'log files')
+    for name, _, _ in SCENARIOS:
+        result = results[name]
+        print '%-14s %10s %10s %10s %10s' % (name, result['min_ms'], result['median_ms'], result['max_ms'], result['log_files_created'])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Resumable bootstraps. Each bootstrap script a host runs is a phase that leaves a
+            marker on the host when it completes, so when a bootstrap is attempted again it
+            skips the phases an earlier attempt completed and resumes from the one that failed.
+            Timings the phases report, such as how long each volume took to prepare, are picked
+            out of the bootstrap output.
+
+"""
+
+import re
+
+# the commands that run a bootstrap script, e.g. (sudo -E /tmp/base.sh 2>&1) | tee ...
+PHASE_SCRIPT = re.compile(r'sudo -E /tmp/([\w.-]+)\.sh')
+# printed by volume-mappings.sh for each volume: device, mount point, what was done and seconds taken
+VOLUME_MARKER = 'PNDA_VOLUME'
+
+def marker_dir(token):
+    '''
+    Directory on a host for the phase markers of one bootstrap, which every attempt at it shares
+    '''
+    return '~/.bootstrap_phases/%s' % token
+
+def phases(cmds):
+    '''
+    Names of the phases among bootstrap commands, in the order they run
+    '''
+    return [match.group(1) for match in [PHASE_SCRIPT.search(cmd) for cmd in cmds] if match is not None]
+
+def resumable(cmds, markers):
+    '''
+    Bootstrap commands with each phase skipped if its marker in the markers directory exists,
+    and leaving the marker when it succeeds. Commands that are not phases, such as exports,
+    run on every attempt.
+    '''
+    wrapped = ['mkdir -p %s' % markers]
+    for cmd in cmds:
+        match = PHASE_SCRIPT.search(cmd)
+        if match is None:
+            wrapped.append(cmd)
+            continue
+        marker = '%s/%s' % (markers, match.group(1))
+        wrapped.append('if [ -f %s ]; then echo "Skipping %s, completed by an earlier attempt"; else %s; touch %s; fi' %
+                       (marker, match.group(1), cmd, marker))
+    return wrapped
+
+def parse_volume_timing(line):
+    '''
+    (device, timing) for a volume timing line of the bootstrap output, None for any other line
+    '''
+    parts = line.strip().split()
+    if len(parts) != 5 or parts[0] != VOLUME_MARKER:
+        return None
+    try:
+        seconds = float(parts[4])
+    except ValueError:
+        return None
+    return parts[1], {'mountpoint': parts[2], 'action': parts[3], 'seconds': seconds}
@@ -0,0 +1,112 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Order in which hosts are bootstrapped. Critical node types go first, then the rest
+            longest expected bootstrap first, so the slowest hosts do not start in the last
+            slice of the fan-out. Expected durations are learned per node type from previous
+            runs and kept in cli/logs/bootstrap-durations.json.
+
+"""
+
+import os
+import json
+import heapq
+import threading
+
+from cluster_context import repo_path
+
+# Hosts that take longest to bootstrap or that the rest of the cluster waits on
+CRITICAL_NODE_TYPES = frozenset(['saltmaster', 'hadoop-mgr', 'hadoop-mgr-1', 'hadoop-cm', 'hadoop-edge', 'tools'])
+# Expected bootstrap time of a node type when nothing has been learned about any node type
+DEFAULT_DURATION_S = 300.0
+# Weight of each new sample in the moving average of a node type's duration
+SAMPLE_WEIGHT = 0.3
+
+_HISTORY_LOCK = threading.Lock()
+
+def history_path():
+    return repo_path('cli', 'logs', 'bootstrap-durations.json')
+
+def load_history():
+    '''
+    Node type to {'mean_s': moving average duration, 'samples': number of samples}
+    '''
+    path = history_path()
+    if not os.path.isfile(path):
+        return {}
+    try:
+        with open(path) as history_file:
+            return json.load(history_file)
+    except ValueError:
+        return {}
+
+def record_durations(samples):
+    '''
+    Fold (node type, seconds) samples from a run into the history. Clusters run in one batch
+    share the file, so it is re-read and updated under a lock.
+    '''
+    if not samples:
+        return
+    with _HISTORY_LOCK:
+        history = load_history()
+        for node_type, duration in samples:
+            entry = history.get(node_type)
+            if entry is None:
+                history[node_type] = {'mean_s': duration, 'samples': 1}
+            else:
+                entry['mean_s'] += SAMPLE_WEIGHT * (duration - entry['mean_s'])
+                entry['samples'] += 1
+        path = history_path()
+        with open(path + '.tmp', 'w') as history_file:
+            json.dump(history, history_file, sort_keys=True, indent=4)
+        os.rename(path + '.tmp', path)
+
+def expected_durations(history, node_types):
+    '''
+    Expected seconds to bootstrap each node type. Types never seen take the median of the
+    types that have been, or DEFAULT_DURATION_S if none have.
+    '''
+    known = sorted(entry['mean_s'] for entry in history.values())
+    default = known[len(known) // 2] if known else DEFAULT_DURATION_S
+    return dict((node_type, history[node_type]['mean_s'] if node_type in history else default) for node_type in node_types)
+
+def is_critical(node_type):
+    return node_type in CRITICAL_NODE_TYPES
+
+def order(instances, expected):
+    '''
+    Instances in the order to start bootstrapping them: critical node types first, then longest
+    expected duration first, by name among equals so the order is stable
+    '''
+    return sorted(instances, key=lambda instance: (not is_critical(instance.node_type),
+                                                   -expected[instance.node_type],
+                                                   instance.name))
+
+def predicted_makespan(durations, slots, stagger_s=0):
+    '''
+    Seconds until the last of a list of operations finishes, when they are started in order as
+    soon as one of slots is free and no sooner than stagger_s after the one before
+    '''
+    if not durations:
+        return 0.0
+    free_at = [0.0] * max(1, slots)
+    finish = 0.0
+    last_start = -stagger_s
+    for duration in durations:
+        start = max(heapq.heappop(free_at), last_start + stagger_s)
+        last_start = start
+        finish = max(finish, start + duration)
+        heapq.heappush(free_at, start + duration)
+    return finish
@@ -0,0 +1,207 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    AWS connections and the Cloud Formation stack of a cluster: its template and
+            creating, waiting on and querying the stack
+
+"""
+
+import json
+import time
+
+import retry_policy
+import self_bootstrap
+import image_bake
+
+from cluster_context import MILLI_TIME, repo_path
+
+# largest template Cloud Formation accepts as a template body, larger ones must be passed by S3 URL
+MAX_TEMPLATE_BODY = 51200
+
+def ec2_connection(ctx):
+    import boto.ec2
+    ec2_access = ctx.pnda_env['ec2_access']
+    return boto.ec2.connect_to_region(ec2_access['AWS_REGION'],
+                                      aws_access_key_id=ec2_access['AWS_ACCESS_KEY_ID'],
+                                      aws_secret_access_key=ec2_access['AWS_SECRET_ACCESS_KEY'])
+
+def cfn_connection(ctx):
+    import boto.cloudformation
+    ec2_access = ctx.pnda_env['ec2_access']
+    return boto.cloudformation.connect_to_region(ec2_access['AWS_REGION'],
+                                                 aws_access_key_id=ec2_access['AWS_ACCESS_KEY_ID'],
+                                                 aws_secret_access_key=ec2_access['AWS_SECRET_ACCESS_KEY'])
+
+def s3_connection(ctx):
+    import boto.s3
+    ec2_access = ctx.pnda_env['ec2_access']
+    return boto.s3.connect_to_region(ec2_access['AWS_REGION'],
+                                     aws_access_key_id=ec2_access['AWS_ACCESS_KEY_ID'],
+                                     aws_secret_access_key=ec2_access['AWS_SECRET_ACCESS_KEY'])
+
+def bootstrap_bucket(ctx):
+    return retry_policy.AWS_API.call(ctx.log, s3_connection(ctx).get_bucket, ctx.pnda_env['ec2_access']['BOOTSTRAP_BUCKET'])
+
+def stack_template(ctx, template_data):
+    '''
+    Template arguments for create_stack and update_stack, and an S3 key to delete once the call
+    has been made. Templates too large to pass inline are uploaded to BOOTSTRAP_BUCKET if it is set.
+    '''
+    if len(template_data) <= MAX_TEMPLATE_BODY or 'BOOTSTRAP_BUCKET' not in ctx.pnda_env['ec2_access']:
+        return {'template_body': template_data}, None
+    key = bootstrap_bucket(ctx).new_key('%s/%s-template.json' % (ctx.name, MILLI_TIME()))
+    retry_policy.AWS_API.call(ctx.log, key.set_contents_from_string, template_data)
+    return {'template_url': key.generate_url(3600)}, key
+
+def create_stack(ctx, conn, cf_parameters, template_args):
+    '''
+    Create the stack, retrying errors AWS rejected it with. If an attempt was cut off after AWS
+    accepted it, the next one finds the stack already exists, which counts as success as long
+    as the stack is being or has been created.
+    '''
+    from boto.exception import BotoServerError
+    attempts = [0]
+    def attempt_create():
+        attempts[0] += 1
+        try:
+            conn.create_stack(ctx.name, parameters=cf_parameters, **template_args)
+        except BotoServerError as exception:
+            if attempts[0] == 1 or getattr(exception, 'error_code', None) != 'AlreadyExistsException':
+                raise
+            stacks = conn.describe_stacks(ctx.name)
+            if not stacks or stacks[0].stack_status not in ['CREATE_IN_PROGRESS', 'CREATE_COMPLETE']:
+                raise
+            ctx.log.info('Stack %s was created by an earlier attempt', ctx.name)
+    retry_policy.AWS_API.call(ctx.log, attempt_create)
+
+def save_cf_resources(ctx, operation, params, template):
+    params_file = repo_path('cli', 'logs', '%s_%s_cloud-formation-parameters.json' % (ctx.name, operation))
+    ctx.console.info('Writing Cloud Formation parameters for %s to %s', ctx.name, params_file)
+    with open(params_file, 'w') as outfile:
+        json.dump(params, outfile, sort_keys=True, indent=4)
+
+    template_file = repo_path('cli', 'logs', '%s_%s_cloud-formation-template.json' % (ctx.name, operation))
+    ctx.console.info('Writing Cloud Formation template for %s to %s', ctx.name, template_file)
+    with open(template_file, 'w') as outfile:
+        json.dump(json.loads(template), outfile, sort_keys=True, indent=4)
+
+def generate_instance_templates(template_data, instance_name, instance_count):
+    if instance_name not in template_data['Resources']:
+        return
+    instance_def = json.dumps(template_data['Resources'].pop(instance_name))
+
+    for instance_index in range(0, instance_count):
+        instance_def_n = instance_def.replace('$node_idx$', str(instance_index))
+        template_data['Resources']['%s%s' % (instance_name, instance_index)] = json.loads(instance_def_n)
+
+def generate_bastion_templates(template_data, bastion_count):
+    # the first bastion keeps the name it has always had, so existing clusters are unchanged
+    if 'instanceBastion' not in template_data['Resources']:
+        return
+    bastion_def = json.dumps(template_data['Resources']['instanceBastion'])
+    for bastion_index in range(1, bastion_count):
+        bastion_def_n = json.loads(bastion_def)
+        for tag in bastion_def_n['Properties']['Tags']:
+            if tag['Key'] == 'Name':
+                tag['Value']['Fn::Join'][1][-1] = 'bastion-%s' % bastion_index
+            elif tag['Key'] == 'node_idx':
+                tag['Value'] = str(bastion_index)
+        template_data['Resources']['instanceBastion%s' % bastion_index] = bastion_def_n
+
+def generate_template_file(flavor, datanodes, opentsdbs, kafkas, zookeepers, esmasters, esingests, esdatas, escoords, esmultis, logstashs,
+                           self_bootstrap_saltmaster=None, image_parameters=None, bastions=1, syndics=0):
+    '''
+    Cloud Formation template for a cluster. If self_bootstrap_saltmaster names the saltmaster node type,
+    instances bootstrap themselves at boot and the stack waits for them (see self_bootstrap.py).
+    Instances of node types with a parameter in image_parameters use baked images (see image_bake.py).
+    '''
+    common_filepath = repo_path('cloud-formation', 'cf-common.json')
+    with open(common_filepath, 'r') as template_file:
+        template_data = json.loads(template_file.read())
+
+    flavor_filepath = repo_path('cloud-formation', flavor, 'cf-flavor.json')
+    with open(flavor_filepath, 'r') as template_file:
+        flavor_data = json.loads(template_file.read())
+
+    for element in flavor_data:
+        if element not in template_data:
+            template_data[element] = flavor_data[element]
+        else:
+            for child in flavor_data[element]:
+                template_data[element][child] = flavor_data[element][child]
+
+    generate_instance_templates(template_data, 'instanceCdhDn', datanodes)
+    generate_instance_templates(template_data, 'instanceOpenTsdb', opentsdbs)
+    generate_instance_templates(template_data, 'instanceKafka', kafkas)
+    generate_instance_templates(template_data, 'instanceZookeeper', zookeepers)
+    generate_instance_templates(template_data, 'instanceESMaster', esmasters)
+    generate_instance_templates(template_data, 'instanceESData', esdatas)
+    generate_instance_templates(template_data, 'instanceESIngest', esingests)
+    generate_instance_templates(template_data, 'instanceESCoordinator', escoords)
+    generate_instance_templates(template_data, 'instanceESMulti', esmultis)
+    generate_instance_templates(template_data, 'instanceLogstash', logstashs)
+    generate_bastion_templates(template_data, bastions)
+    generate_instance_templates(template_data, 'instanceSaltSyndic', syndics)
+
+    if image_parameters:
+        image_bake.use_images(template_data, image_parameters)
+
+    if self_bootstrap_saltmaster is not None:
+        self_bootstrap.add_to_template(template_data, self_bootstrap_saltmaster)
+
+    return json.dumps(template_data)
+
+def stack_parameter_keys(ctx):
+    conn = cfn_connection(ctx)
+    stacks = retry_policy.AWS_API.call(ctx.log, conn.describe_stacks, ctx.name)
+    return [parameter.key for parameter in stacks[0].parameters] if len(stacks) > 0 else []
+
+def fetch_stack_events(ctx, cfn_cnxn, stack_name):
+    page_token = True
+    while page_token is not None:
+        event_page = retry_policy.AWS_API.call(ctx.log, cfn_cnxn.describe_stack_events, stack_name, page_token)
+        for event in event_page:
+            resource_id = event.logical_resource_id
+            resource_status = event.resource_status
+            reason = event.resource_status_reason
+            message = "%s: %s%s" % (resource_id, resource_status, '' if reason is None else ' - %s' % reason)
+            if resource_status in ['CREATE_FAILED', 'UPDATE_FAILED'] and reason != 'Resource creation cancelled':
+                ctx.console.error(message)
+            else:
+                ctx.log.debug(message)
+        page_token = event_page.next_token
+
+def wait_for_stack(ctx, conn, stack_status, in_progress, check=None):
+    # check, if given, is called on every poll and may end the wait by raising
+    while stack_status in in_progress:
+        time.sleep(5)
+        ctx.console.info('Stack is: ' + stack_status)
+        if check is not None:
+            check()
+        stacks = retry_policy.AWS_API.call(ctx.log, conn.describe_stacks, ctx.name)
+        if len(stacks) > 0:
+            stack_status = stacks[0].stack_status
+    return stack_status
+
+def get_stack_status(ctx):
+    from boto.exception import BotoServerError
+    conn = cfn_connection(ctx)
+    try:
+        stacks = retry_policy.AWS_API.call(ctx.log, conn.describe_stacks, ctx.name)
+    except BotoServerError as exception:
+        if 'does not exist' in str(exception):
+            return 'DOES_NOT_EXIST'
+        raise
+    return stacks[0].stack_status if len(stacks) > 0 else 'DOES_NOT_EXIST'
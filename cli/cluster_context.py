@@ -0,0 +1,237 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    State for one cluster operation, so that several clusters can be driven from
+            one process without sharing globals or depending on the working directory
+
+"""
+
+import os
+import re
+import json
+import time
+import tempfile
+import logging
+import threading
+
+import log_pipeline
+import bastion_routing
+import transfer_scheduler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MILLI_TIME = lambda: int(round(time.time() * 1000))
+
+class PNDAConfigException(Exception):
+    pass
+
+def repo_path(*parts):
+    '''
+    Absolute path of a file in the repository. Relative paths given by the user are
+    interpreted relative to the repository root, absolute paths are left unchanged.
+    '''
+    return os.path.join(ROOT, *parts)
+
+class ConnectionLimiter(object):
+    '''
+    Bounds the number of concurrent outbound ssh/scp sessions. One instance can be
+    shared between several ClusterContexts to apply a limit across all of them.
+    Up to reserved slots are kept free for critical operations that have been
+    announced with expect_critical and have not started yet.
+    '''
+
+    def __init__(self, limit, reserved=None):
+        self.limit = limit
+        self.reserved = min(limit // 10 if reserved is None else reserved, limit - 1)
+        self._condition = threading.Condition()
+        self._in_use = 0
+        self._pending_critical = 0
+
+    def expect_critical(self, count):
+        with self._condition:
+            self._pending_critical += count
+
+    def acquire(self, critical=False):
+        with self._condition:
+            while self._in_use >= self.limit - (0 if critical else min(self.reserved, self._pending_critical)):
+                self._condition.wait()
+            self._in_use += 1
+            if critical and self._pending_critical > 0:
+                self._pending_critical -= 1
+                # fewer slots are held back now
+                self._condition.notify_all()
+
+    def release(self):
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+class _ClusterLogAdapter(logging.LoggerAdapter):
+    def process(self, msg, kwargs):
+        return '[%s] %s' % (self.extra['cluster'], msg), kwargs
+
+class ClusterContext(object):
+    '''
+    Everything the CLI knows about one cluster: its configuration, inventory,
+    run journal, logging and the local files generated for it
+    '''
+
+    def __init__(self, name, flavor, pnda_env, existing_machines_def_file=None, shared_limiter=None):
+        self.name = name
+        self.flavor = flavor
+        self.pnda_env = pnda_env
+        self.existing_machines_def_file = repo_path(existing_machines_def_file) if existing_machines_def_file is not None else None
+        self.node_config = None
+        self.inventory = None
+        self.runfile = None
+        # the phase the operation has reached, as recorded in the run journal
+        self.phase = None
+        self._runfile_lock = threading.Lock()
+        self.log = logging.getLogger('everything')
+        self.console = logging.getLogger('console')
+        self.log_file_name = None
+        # set when the operation is being abandoned, remote commands in flight are stopped
+        self.aborted = threading.Event()
+        # which bastion each host is reached through, set once the bastions are known
+        self.bastion_ring = bastion_routing.BastionRing()
+
+        self.ssh_config = repo_path('cli', 'ssh_config-%s' % name)
+        self.socks_proxy = repo_path('cli', 'socks_proxy-%s' % name)
+        self.pnda_env_sh = repo_path('cli', 'pnda_env_%s.sh' % name)
+        self.salt_master_conf = repo_path('cli', 'salt_master_%s.conf' % name)
+        # the saltmaster's tree, fetched while salt syndics are bootstrapped or synced
+        self.salt_tree_tarball = os.path.join(tempfile.gettempdir(), 'salt_tree_%s.tar.gz' % name)
+
+        self.limiters = [ConnectionLimiter(pnda_env['cli']['MAX_SIMULTANEOUS_OUTBOUND_CONNECTIONS'],
+                                           pnda_env['cli'].get('RESERVED_CRITICAL_CONNECTIONS'))]
+        if shared_limiter is not None:
+            self.limiters.append(shared_limiter)
+        self.transfers = transfer_scheduler.TransferScheduler.from_config(pnda_env['cli'])
+
+    def use_own_log(self):
+        '''
+        Send this cluster's debug log to its own file and prefix its console output with the
+        cluster name, for when several clusters are being operated on at once
+        '''
+        self.log_file_name = log_pipeline.log_file_name(repo_path('cli', 'logs', 'pnda-cli.%s.%s.log' % (self.name, time.time())))
+        self.log = logging.getLogger('everything.%s' % self.name)
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.log.addHandler(log_pipeline.handler(self.log_file_name))
+        self.console = _ClusterLogAdapter(logging.getLogger('console'), {'cluster': self.name})
+
+    def is_existing_machines(self):
+        return self.existing_machines_def_file is not None
+
+    def instance_key(self, node_name):
+        return '%s-%s' % (self.name, node_name)
+
+    def clear_inventory_cache(self):
+        self.inventory = None
+
+    def abort(self):
+        '''
+        Abandon the operation: ssh and scp sessions in progress are terminated and no new ones start
+        '''
+        self.aborted.set()
+
+    def expect_critical(self, count):
+        '''
+        Announce critical operations about to be started, so every connection limiter holds slots back for them
+        '''
+        for limiter in self.limiters:
+            limiter.expect_critical(count)
+
+    def acquire_connection_slot(self, critical=False):
+        '''
+        Block until there is a free slot in every connection limiter that applies to this cluster
+        '''
+        for limiter in self.limiters:
+            limiter.acquire(critical)
+
+    def release_connection_slot(self):
+        for limiter in reversed(self.limiters):
+            limiter.release()
+
+    def init_runfile(self):
+        self.runfile = repo_path('cli', 'logs', '%s.%s.run' % (self.name, int(time.time())))
+
+    def _update_runfile(self, update):
+        with self._runfile_lock:
+            jrf = {}
+            if os.path.isfile(self.runfile):
+                with open(self.runfile, 'r') as runfile:
+                    jrf = json.load(runfile)
+            update(jrf)
+            with open(self.runfile, 'w') as runfile:
+                json.dump(jrf, runfile)
+
+    def to_runfile(self, pairs):
+        '''
+        Append arbitrary pairs to a JSON dict on disk from anywhere in the code
+        '''
+        self._update_runfile(lambda jrf: jrf.update(pairs))
+
+    def merge_to_runfile(self, key, pairs):
+        '''
+        Add pairs to the JSON dict held under key, for values recorded in more than one place
+        '''
+        self._update_runfile(lambda jrf: jrf.setdefault(key, {}).update(pairs))
+
+    def record_phase(self, phase):
+        '''
+        Note in the run journal that the operation has reached a new phase, for the status command
+        '''
+        self.phase = phase
+
+        def update(jrf):
+            jrf['phase'] = phase
+            jrf.setdefault('phases', []).append([phase, time.time()])
+        self._update_runfile(update)
+
+    def _runfiles(self):
+        '''
+        Paths of this cluster's run journals, most recent first
+        '''
+        pattern = re.compile(r'^%s\.(\d+)\.run$' % re.escape(self.name))
+        runs = []
+        for file_name in os.listdir(repo_path('cli', 'logs')):
+            match = pattern.match(file_name)
+            if match is not None:
+                runs.append((int(match.group(1)), file_name))
+        return [repo_path('cli', 'logs', file_name) for _, file_name in sorted(runs, reverse=True)]
+
+    def latest_runfile(self):
+        '''
+        Contents of the most recent run journal for this cluster, or None if there is none
+        '''
+        runs = self._runfiles()
+        if not runs:
+            return None
+        with open(runs[0]) as runfile:
+            return json.load(runfile)
+
+    def previous_runfile(self, command):
+        '''
+        Contents of the most recent run journal of an earlier run of command for this cluster,
+        or None if there is none
+        '''
+        for path in self._runfiles():
+            if path == self.runfile:
+                continue
+            with open(path) as runfile:
+                journal = json.load(runfile)
+            if journal.get('command') == command:
+                return journal
+        return None
@@ -0,0 +1,97 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The collect command, which gathers a diagnostic bundle from every host of a
+            cluster into one archive
+
+"""
+
+import os
+import time
+import traceback
+import shutil
+import tempfile
+import Queue
+
+from contextlib import contextmanager
+
+import diagnostics
+
+from cluster_context import MILLI_TIME, repo_path
+from host_access import get_inventory
+from remote_ops import fetch, ssh_output, wait_on_host_operations
+
+def collect_diagnostics(ctx):
+    '''
+    Fetch a bundle of log tails and system state from every host of the cluster, in parallel within the
+    connection limits, and put them in one archive in cli/logs with an index of the hosts. No host
+    contributes more than DIAGNOSTICS_MAX_KB_PER_HOST. Returns the path of the archive.
+    '''
+    cluster = get_inventory(ctx)
+    max_bytes = int(ctx.pnda_env['cli'].get('DIAGNOSTICS_MAX_KB_PER_HOST', diagnostics.MAX_KB_PER_HOST)) * 1024
+    remote_bundle = '/tmp/pnda-diagnostics-%s.tar.gz' % ctx.name
+    staging = tempfile.mkdtemp()
+    results = Queue.Queue()
+
+    def do_collect(host):
+        result = {'host': host.key, 'node_type': host.node_type, 'ip_address': host.private_ip_address}
+        try:
+            output = ssh_output([diagnostics.build_collect_command(remote_bundle, max_bytes)], ctx, host.private_ip_address)
+            size = diagnostics.parse_collect_output(output)
+            if size is None:
+                raise Exception('No diagnostic bundle was written on %s' % host.private_ip_address)
+            local_bundle = os.path.join(staging, '%s.tar.gz' % host.key)
+            fetch(remote_bundle, ctx, host.private_ip_address, local_bundle, size)
+            result['bundle'] = local_bundle
+        except Exception as exception:
+            ctx.log.info(traceback.format_exc())
+            result['error'] = str(exception)
+        results.put(result)
+
+    ctx.console.info('Collecting diagnostics from %s hosts', len(cluster))
+    start = time.time()
+    try:
+        wait_on_host_operations(ctx, 'collecting diagnostics', [(do_collect, [host], host.private_ip_address) for host in cluster],
+                                len(cluster.bastions) > 0, None)
+        collected = list(results.queue)
+        archive = diagnostics.write_archive(repo_path('cli', 'logs', '%s_%s_diagnostics.tar' % (ctx.name, MILLI_TIME())), ctx.name, collected)
+    finally:
+        shutil.rmtree(staging)
+
+    missing = sorted(result['host'] for result in collected if 'error' in result)
+    if missing:
+        ctx.console.warning('Could not collect diagnostics from %s', ', '.join(missing))
+    ctx.console.info('Collected diagnostics from %s of %s hosts in %.0f seconds to %s',
+                     len(collected) - len(missing), len(collected), time.time() - start, archive)
+    if ctx.runfile is not None:
+        ctx.to_runfile({'diagnostics': archive})
+    return archive
+
+@contextmanager
+def diagnostics_on_failure(ctx):
+    '''
+    Collect diagnostics from every host if the operation fails once hosts are being bootstrapped,
+    unless COLLECT_DIAGNOSTICS_ON_FAILURE is false. The failure is raised either way.
+    '''
+    try:
+        yield
+    except Exception:
+        if ctx.phase in ['bootstrap', 'salt'] and ctx.pnda_env['cli'].get('COLLECT_DIAGNOSTICS_ON_FAILURE', True):
+            try:
+                collect_diagnostics(ctx)
+            except:
+                ctx.log.info(traceback.format_exc())
+                ctx.console.warning('Failed to collect diagnostics, try again with: pnda-cli.py collect -e %s', ctx.name)
+        raise
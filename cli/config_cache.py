@@ -0,0 +1,151 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Parse configuration files once per process and share the results read only
+            between threads. Parsed YAML is also cached on disk, keyed by file mtime/size
+            and content hash, so later invocations can skip the YAML parser entirely. The
+            cache holds pnda_env.yaml and its credentials, so it is only readable by its
+            owner and holds JSON, which loading can not execute anything from.
+
+"""
+
+import os
+import json
+import hashlib
+import threading
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.config-cache')
+
+_PARSED = {}
+_LOCK = threading.Lock()
+
+class FrozenDict(dict):
+    '''
+    dict that rejects modification, safe to share between threads
+    '''
+
+    # keyword arguments, as update takes, are refused with a TypeError just the same
+    def _read_only(self, *_):
+        raise TypeError('configuration is read only')
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+def freeze(value):
+    '''
+    Recursively convert dicts to FrozenDicts and lists to tuples
+    '''
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(val)) for key, val in value.iteritems())
+    if isinstance(value, list):
+        return tuple(freeze(val) for val in value)
+    return value
+
+def _parse_yaml(content):
+    import yaml
+    # the libyaml backed loader is many times faster, but is only present if
+    # PyYAML was built against libyaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    return yaml.load(content, Loader=loader)
+
+def _cache_file(path):
+    return os.path.join(CACHE_DIR, '%s.json' % hashlib.sha1(path).hexdigest())
+
+def _as_str(value):
+    # json gives unicode where the YAML parser gives str for ASCII text
+    if isinstance(value, dict):
+        return dict((_as_str(key), _as_str(val)) for key, val in value.iteritems())
+    if isinstance(value, list):
+        return [_as_str(val) for val in value]
+    if isinstance(value, unicode):
+        try:
+            return value.encode('ascii')
+        except UnicodeEncodeError:
+            return value
+    return value
+
+def _read_cache(path):
+    try:
+        cache_path = _cache_file(path)
+        # a cache file anyone else could have written is not trusted
+        stat = os.stat(cache_path)
+        if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+            return None
+        with open(cache_path, 'r') as cache_file:
+            return _as_str(json.load(cache_file))
+    except Exception:
+        return None
+
+def _write_cache(path, entry):
+    try:
+        if not os.path.isdir(CACHE_DIR):
+            os.makedirs(CACHE_DIR, 0o700)
+        os.chmod(CACHE_DIR, 0o700)
+        serialized = json.dumps(entry)
+        # non-string keys, dates and the like would not come back as they were parsed
+        if _as_str(json.loads(serialized)) != entry:
+            return
+        tmp_path = '%s.%s.tmp' % (_cache_file(path), os.getpid())
+        with os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as cache_file:
+            cache_file.write(serialized)
+        os.rename(tmp_path, _cache_file(path))
+    except (IOError, OSError, TypeError, ValueError):
+        # the cache is an optimisation only, and YAML that has no JSON form is not cached
+        pass
+
+def _load_with_disk_cache(path, parse_func):
+    stat = os.stat(path)
+    cached = _read_cache(path)
+    if cached is not None and cached['mtime'] == stat.st_mtime and cached['size'] == stat.st_size:
+        return cached['data']
+
+    with open(path, 'r') as infile:
+        content = infile.read()
+    digest = hashlib.sha1(content).hexdigest()
+    if cached is not None and cached['digest'] == digest:
+        data = cached['data']
+    else:
+        data = parse_func(content)
+    _write_cache(path, {'mtime': stat.st_mtime, 'size': stat.st_size, 'digest': digest, 'data': data})
+    return data
+
+def _load(path, parse_func, use_disk_cache):
+    path = os.path.abspath(path)
+    with _LOCK:
+        if path not in _PARSED:
+            if use_disk_cache:
+                data = _load_with_disk_cache(path, parse_func)
+            else:
+                with open(path, 'r') as infile:
+                    data = parse_func(infile.read())
+            _PARSED[path] = freeze(data)
+        return _PARSED[path]
+
+def load_yaml(path):
+    '''
+    Parsed, read only contents of a YAML file
+    '''
+    return _load(path, _parse_yaml, True)
+
+def load_json(path):
+    '''
+    Parsed, read only contents of a JSON file
+    '''
+    return _load(path, json.loads, False)
@@ -0,0 +1,148 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Checks made before a cluster is created or changed: the topology preflight and
+            access to AWS, the key pair, the machines over ssh and the PNDA mirror
+
+"""
+
+import sys
+import os
+import json
+import traceback
+
+import retry_policy
+import connectivity_sweep
+import preflight
+
+from cloud_formation import ec2_connection, cfn_connection
+from host_access import get_inventory, sweep_from_bastion
+
+def run_preflight(ctx, template_data, counts, range_validator):
+    '''
+    Check the topology of the cluster, from its template or existing machines, and exit listing
+    every problem found before anything is created or bootstrapped
+    '''
+    if template_data is not None:
+        instances = preflight.template_instances(json.loads(template_data), ctx.name)
+    else:
+        instances = [(host.key, host.node_type) for host in get_inventory(ctx)]
+    problems = preflight.check_topology(ctx, instances, counts, range_validator)
+    if problems:
+        ctx.console.error('Preflight checks found %s problems:', len(problems))
+        for problem in problems:
+            ctx.console.error('  %s', problem)
+        sys.exit(1)
+    ctx.console.info('Preflight checks passed for %s instances', len(instances))
+    return instances
+
+def check_keypair(ctx, keyname, keyfile):
+    if not os.path.isfile(keyfile):
+        ctx.console.info('Keyfile.......... ERROR')
+        ctx.console.error('Did not find local file named %s', keyfile)
+        sys.exit(1)
+
+    if ctx.is_existing_machines():
+        ctx.console.info('Keyfile.......... OK')
+        check_ssh_access(ctx, keyfile)
+    else:
+        try:
+            ec2 = ec2_connection(ctx)
+            stored_key = retry_policy.AWS_API.call(ctx.log, ec2.get_key_pair, keyname)
+            if stored_key is None:
+                raise Exception("Key not found %s" % keyname)
+            ctx.console.info('Keyfile.......... OK')
+        except:
+            ctx.console.info('Keyfile.......... ERROR')
+            ctx.console.error('Failed to find key %s in ec2.', keyname)
+            ctx.console.error(traceback.format_exc())
+            sys.exit(1)
+
+def check_ssh_access(ctx, keyfile):
+    # One sweep for an SSH banner on every machine, from the bastion if there is one. This only
+    # shows an SSH server answers on each machine, it does not log in, so a key the machines do not
+    # accept is only found when the first ssh command runs on them.
+    cluster = get_inventory(ctx)
+    hosts = cluster.private_ips()
+    try:
+        if cluster.bastions:
+            unreachable = sweep_from_bastion(ctx, hosts, cluster.bastions[0].ip_address, keyfile, 0, lambda host: None)
+        else:
+            _, unreachable = connectivity_sweep.probe_locally(hosts)
+    except:
+        ctx.console.info('SSH server....... ERROR')
+        ctx.console.error('Failed to check for an SSH server on the machines in %s', ctx.existing_machines_def_file)
+        ctx.console.error(traceback.format_exc())
+        sys.exit(1)
+
+    if unreachable:
+        ctx.console.info('SSH server....... ERROR')
+        ctx.console.error('No SSH server reachable on %s', ', '.join(sorted(unreachable)))
+        sys.exit(1)
+    ctx.console.info('SSH server....... OK')
+
+def check_aws_connection(ctx):
+    import boto.ec2
+    region = ctx.pnda_env['ec2_access']['AWS_REGION']
+
+    valid_regions = [valid_region.name for valid_region in boto.ec2.regions()]
+    if region not in valid_regions:
+        ctx.console.info('AWS connection... ERROR')
+        ctx.console.error('Failed to connect to cloud formation API, ec2 region "%s" was not valid. Valid options are %s', region, json.dumps(valid_regions))
+        sys.exit(1)
+
+    conn = cfn_connection(ctx)
+    if conn is None:
+        ctx.console.info('AWS connection... ERROR')
+        ctx.console.error('Failed to connect to cloud formation API, verify ec2_access settings in "pnda_env.yaml" and try again.')
+        sys.exit(1)
+
+    try:
+        retry_policy.AWS_API.call(ctx.log, conn.list_stacks)
+        ctx.console.info('AWS connection... OK')
+    except:
+        ctx.console.info('AWS connection... ERROR')
+        ctx.console.error('Failed to query cloud formation API, verify ec2_access settings in "pnda_env.yaml" and try again.')
+        ctx.console.error(traceback.format_exc())
+        sys.exit(1)
+
+def check_pnda_mirror(ctx):
+    import requests
+
+    def raise_error(reason):
+        ctx.console.info('PNDA mirror...... ERROR')
+        ctx.console.error(reason)
+        ctx.console.error(traceback.format_exc())
+        sys.exit(1)
+
+    try:
+        mirror = ctx.pnda_env['mirrors']['PNDA_MIRROR']
+        response = requests.head(mirror)
+        # expect 200 (open mirror) 403 (no listing allowed)
+        # or any redirect (in case of proxy/redirect)
+        if response.status_code not in [200, 403, 301, 302, 303, 307, 308]:
+            raise_error("PNDA mirror configured and present "
+                        "but responded with unexpected status code (%s). " % response.status_code)
+        ctx.console.info('PNDA mirror...... OK')
+    except KeyError:
+        raise_error('PNDA mirror was not defined in pnda_env.yaml')
+    except:
+        raise_error("Failed to connect to PNDA mirror. Verify connection "
+                    "to %s, check mirror in pnda_env.yaml and try again." % mirror)
+
+def check_config(ctx, keyname, keyfile):
+    check_aws_connection(ctx)
+    check_keypair(ctx, keyname, keyfile)
+    check_pnda_mirror(ctx)
@@ -0,0 +1,109 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Find out which hosts have sshd accepting connections, by reading the SSH banner
+            from port 22 of many hosts in parallel. The sweep runs either in a single ssh
+            session on the bastion, reporting hosts as they come up, or from this machine.
+
+"""
+
+import socket
+import Queue
+
+from threading import Thread
+
+import remote_script
+
+SSH_PORT = 22
+UP_MARKER = 'PNDA_SWEEP_UP'
+DOWN_MARKER = 'PNDA_SWEEP_DOWN'
+
+# Runs on the bastion: $1 is the overall timeout in seconds, the remaining arguments are the
+# hosts to probe. Pending hosts are probed in parallel rounds until all are up or time runs out.
+SWEEP_SCRIPT = '''
+timeout_s=$1; shift
+parallel=%(parallel)s
+pending=$(printf '%%s\\n' "$@")
+end=$((SECONDS + timeout_s))
+probe() {
+    banner=$(timeout %(probe_timeout)s bash -c "exec 3<>/dev/tcp/$1/%(port)s && head -c 4 <&3" 2>/dev/null)
+    [ "$banner" = "SSH-" ] && echo "$1"
+}
+export -f probe
+while [ -n "$pending" ]; do
+    up=$(printf '%%s\\n' $pending | xargs -P $parallel -I{} bash -c 'probe {}')
+    for host in $up; do echo "%(up)s $host"; done
+    if [ -n "$up" ]; then
+        pending=$(printf '%%s\\n' $pending | grep -vxF "$up")
+    fi
+    [ -z "$pending" ] || [ $SECONDS -ge $end ] && break
+    sleep 2
+done
+for host in $pending; do echo "%(down)s $host"; done
+'''
+
+def build_sweep_command(hosts, timeout, parallel=64, probe_timeout=3):
+    '''
+    Shell command that runs the sweep script on a remote host
+    '''
+    script = SWEEP_SCRIPT % {'parallel': parallel, 'probe_timeout': probe_timeout, 'port': SSH_PORT,
+                             'up': UP_MARKER, 'down': DOWN_MARKER}
+    return remote_script.encoded_script_command(script, [str(int(timeout))] + list(hosts))
+
+def parse_sweep_line(line):
+    '''
+    ('up', host), ('down', host) or None for a line of sweep output
+    '''
+    parts = line.strip().split()
+    if len(parts) == 2 and parts[0] == UP_MARKER:
+        return 'up', parts[1]
+    if len(parts) == 2 and parts[0] == DOWN_MARKER:
+        return 'down', parts[1]
+    return None
+
+def has_ssh_banner(host, timeout=3):
+    try:
+        connection = socket.create_connection((host, SSH_PORT), timeout)
+        try:
+            return connection.recv(4) == 'SSH-'
+        finally:
+            connection.close()
+    except (socket.error, socket.timeout):
+        return False
+
+def probe_locally(hosts, parallel=64, timeout=3):
+    '''
+    Probe hosts directly from this machine, returning (up, down) sets
+    '''
+    pending = Queue.Queue()
+    for host in hosts:
+        pending.put(host)
+    up_hosts = set()
+
+    def do_probe():
+        while True:
+            try:
+                host = pending.get_nowait()
+            except Queue.Empty:
+                return
+            if has_ssh_banner(host, timeout):
+                up_hosts.add(host)
+
+    threads = [Thread(target=do_probe) for _ in xrange(min(parallel, len(hosts)))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return up_hosts, set(hosts) - up_hosts
@@ -0,0 +1,55 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The destroy command, which deletes the Cloud Formation stack of a cluster and the
+            files generated for reaching it
+
+"""
+
+import os
+import time
+
+import retry_policy
+
+from cloud_formation import cfn_connection
+
+def destroy(ctx, detach=False):
+    ctx.console.info('Removing ssh access scripts')
+    for generated_file in [ctx.socks_proxy, ctx.ssh_config, ctx.pnda_env_sh, ctx.salt_master_conf]:
+        if os.path.exists(generated_file):
+            os.remove(generated_file)
+
+    if not ctx.is_existing_machines():
+        ctx.console.info('Deleting Cloud Formation stack')
+        conn = cfn_connection(ctx)
+        stack_status = 'DELETING'
+        ctx.record_phase('stack')
+        retry_policy.AWS_API.call(ctx.log, conn.delete_stack, ctx.name)
+        if detach:
+            ctx.console.info('Stack deletion started, follow it with: pnda-cli.py status -e %s', ctx.name)
+            return
+        while stack_status in ['DELETE_IN_PROGRESS', 'DELETING']:
+            time.sleep(5)
+            ctx.console.info('Stack is: ' + stack_status)
+            try:
+                stacks = retry_policy.AWS_API.call(ctx.log, conn.describe_stacks, ctx.name)
+            except:
+                stacks = []
+
+            if len(stacks) > 0:
+                stack_status = stacks[0].stack_status
+            else:
+                stack_status = None
+    ctx.record_phase('complete')
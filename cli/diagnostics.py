@@ -0,0 +1,109 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Diagnostic bundles for finding out why a bootstrap or salt run failed. A script run on
+            each host packs the tails of the bootstrap, salt and minion logs and the output of a
+            few commands describing the state of the host into a tarball of bounded size. The
+            tarballs fetched from the hosts are put in one archive with an index of what came
+            from where.
+
+"""
+
+import os
+import json
+import time
+import StringIO
+
+import remote_script
+
+BUNDLE_MARKER = 'PNDA_DIAGNOSTICS'
+# default for the cli section of pnda_env.yaml
+MAX_KB_PER_HOST = 512
+
+# logs collected from each host, those that do not exist on a host are skipped
+LOG_FILES = ['~/pnda-bootstrap.log', '~/pnda-salt.log', '~/pnda-bake.log', '/var/log/salt/minion', '/var/log/salt/master',
+             '/var/log/salt/syndic', '/var/log/cloud-init-output.log']
+# (name, command) for the state of each host
+STATE_COMMANDS = [('uptime', 'uptime'),
+                  ('disk', 'df -h'),
+                  ('memory', 'free -m'),
+                  ('processes', 'ps aux --sort=-%cpu | head -n 30'),
+                  ('salt-minion', 'sudo systemctl status salt-minion --no-pager -l || sudo service salt-minion status'),
+                  ('failed-units', 'sudo systemctl --failed --no-pager'),
+                  ('bootstrap-phases', 'ls -la ~/.bootstrap_phases/* ~/.bootstrap_complete'),
+                  ('jobs', 'ls -la ~/pnda-jobs'),
+                  ('dmesg', 'sudo dmesg | tail -n 200')]
+
+# $1 is the path of the bundle to write, $2 the most bytes kept from each log or command output.
+# The bundle is written afresh each time, so the collection can safely be retried.
+COLLECT_SCRIPT = '''
+bundle=$1
+keep=$2
+work=$(mktemp -d) || exit 1
+mkdir -p $work/logs $work/state
+for log in %(logs)s; do
+    [ -f $log ] && sudo tail -c $keep $log > $work/logs/$(basename $log)
+done
+%(state)s
+rm -f $bundle
+tar czf $bundle -C $work logs state
+rm -rf $work
+echo "%(marker)s $(stat -c %%s $bundle)"
+'''
+
+def build_collect_command(bundle_path, max_bytes):
+    '''
+    Command that writes a host's bundle to bundle_path and reports its size. Each log file and
+    command output gets an equal share of max_bytes, so a bundle is never larger than that.
+    '''
+    keep = max(1024, max_bytes // (len(LOG_FILES) + len(STATE_COMMANDS)))
+    state = '\n'.join('(%s) 2>&1 | head -c $keep > $work/state/%s.txt' % (command, name) for name, command in STATE_COMMANDS)
+    script = COLLECT_SCRIPT % {'logs': ' '.join(LOG_FILES), 'state': state, 'marker': BUNDLE_MARKER}
+    return remote_script.encoded_script_command(script, [bundle_path, str(int(keep))])
+
+def parse_collect_output(lines):
+    '''
+    Size in bytes of the bundle the collect command wrote, or None if it did not report one
+    '''
+    for line in lines:
+        parts = line.strip().split()
+        if len(parts) == 2 and parts[0] == BUNDLE_MARKER and parts[1].isdigit():
+            return int(parts[1])
+    return None
+
+def write_archive(path, cluster_name, results):
+    '''
+    Write the archive of the bundles fetched from a cluster's hosts. results has a dict for each
+    host with its key, node_type and ip_address, and the local path of its bundle or the error
+    that stopped it being collected. The archive holds hosts/<key>.tar.gz for each bundle and
+    index.json listing every host. The bundles are already compressed, so the archive is not.
+    '''
+    # tarfile is slow to import, so it is loaded only when an archive is written
+    import tarfile
+    index = {'cluster': cluster_name, 'collected': time.time(), 'hosts': []}
+    with tarfile.open(path, 'w') as archive:
+        for result in sorted(results, key=lambda result: result['host']):
+            entry = dict((key, value) for key, value in result.items() if key != 'bundle')
+            if result.get('bundle') is not None:
+                entry['file'] = 'hosts/%s.tar.gz' % result['host']
+                entry['bytes'] = os.path.getsize(result['bundle'])
+                archive.add(result['bundle'], arcname=entry['file'])
+            index['hosts'].append(entry)
+        index_text = StringIO.StringIO(json.dumps(index, indent=2, sort_keys=True))
+        index_info = tarfile.TarInfo(name='index.json')
+        index_info.size = len(index_text.buf)
+        index_info.mtime = int(index['collected'])
+        archive.addfile(tarinfo=index_info, fileobj=index_text)
+    return path
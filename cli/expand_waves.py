@@ -0,0 +1,83 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Waves of hosts for expand, so that adding many hosts does not run highstate on all of
+            them at once. Each wave is bootstrapped, highstated in salt batches sized from the wave
+            and orchestrated if it adds datanodes. The state of each wave is kept in the run journal,
+            so that an expand that was interrupted carries on from the waves it did not finish.
+
+"""
+
+# default for the cli section of pnda_env.yaml, 0 puts every new host in one wave
+WAVE_SIZE = 10
+# most minions of a wave highstate runs on at once
+MAX_SALT_BATCH = 5
+JOURNAL_KEY = 'expand_waves'
+
+PENDING = 'pending'
+BOOTSTRAPPED = 'bootstrapped'
+COMPLETE = 'complete'
+FAILED = 'failed'
+# salt for the wave was left running as a detached job
+DETACHED = 'detached'
+
+# waves with datanodes need orchestrate to add them to the hadoop cluster
+ORCHESTRATED_NODE_TYPES = ['hadoop-dn']
+
+def plan(hosts, wave_size):
+    '''
+    Waves of at most wave_size hosts, in the order given
+    '''
+    if not hosts:
+        return []
+    if wave_size <= 0:
+        return [list(hosts)]
+    return [list(hosts[start:start + wave_size]) for start in range(0, len(hosts), wave_size)]
+
+def unfinished(journal):
+    '''
+    Host keys of each wave a previous expand's run journal shows was not finished
+    '''
+    if not journal:
+        return []
+    return [wave['hosts'] for wave in journal.get(JOURNAL_KEY, []) if wave['state'] not in [COMPLETE, DETACHED]]
+
+def resume_plan(cluster, hosts, previous_waves, wave_size):
+    '''
+    Waves for expanding cluster by hosts, after the unfinished waves of a previous expand. Those waves
+    are kept as they were, with any of their hosts that were bootstrapped, and come first.
+    '''
+    waves = []
+    planned = set()
+    for keys in previous_waves:
+        wave = [cluster[key] for key in keys if key in cluster and key not in planned]
+        if wave:
+            waves.append(wave)
+            planned.update(host.key for host in wave)
+    return waves + plan([host for host in hosts if host.key not in planned], wave_size)
+
+def salt_batch(count):
+    '''
+    Minions highstate runs on at once in a wave of count hosts. The wave is split into as few batches
+    of at most MAX_SALT_BATCH as it can be, of sizes as even as they can be.
+    '''
+    batches = -(-count // MAX_SALT_BATCH)
+    return max(1, -(-count // max(1, batches)))
+
+def needs_orchestrate(wave):
+    return any(host.node_type in ORCHESTRATED_NODE_TYPES for host in wave)
+
+def journal_entry(wave, state):
+    return {'hosts': [host.key for host in wave], 'state': state}
@@ -0,0 +1,323 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Reach the hosts of a cluster: the ssh configuration through its bastions, waiting
+            until hosts accept connections, and the inventory of which hosts exist and are bootstrapped
+
+"""
+
+import sys
+import os
+import json
+import traceback
+import Queue
+
+from threading import Thread
+
+import subprocess_to_log
+import config_cache
+import retry_policy
+import connectivity_sweep
+import inventory
+
+from cloud_formation import ec2_connection
+from remote_ops import RemoteCommandError, check_not_aborted, ssh, ssh_output, start_host_operation, join_host_operations, wait_on_host_operations
+
+def get_accepted_minions(ctx, saltmaster_ip):
+    # A single round trip to the saltmaster lists every minion that has registered with it
+    output = ssh_output(['sudo salt-key --list=accepted --out=json'], ctx, saltmaster_ip)
+    return set(json.loads('\n'.join(output)).get('minions', []))
+
+def check_hosts_bootstrapped(ctx, cluster, bastion_used):
+    # Minion ids are set to the instance name by the bootstrap scripts, so any instance
+    # with an accepted salt key is live. Minions assigned to a salt syndic are accepted
+    # there rather than on the saltmaster, so every syndic is asked as well. Instances
+    # no master knows about, or all of them if no master can be queried, are checked
+    # over ssh instead.
+    if cluster.saltmaster is not None:
+        for master in [cluster.saltmaster] + cluster.syndics:
+            try:
+                ctx.console.info('Listing minions accepted by %s', 'the saltmaster' if master is cluster.saltmaster else master.name)
+                minions = get_accepted_minions(ctx, master.private_ip_address)
+                cluster.mark_bootstrapped([minion for minion in minions if minion in cluster])
+            except:
+                ctx.console.warning('Failed to list minions on %s, checking bootstrap status of its hosts instead', master.name)
+                ctx.log.info(traceback.format_exc())
+
+    unmatched = [host for host in cluster if not host.bootstrapped]
+    if unmatched:
+        check_bootstrapped_over_ssh(ctx, cluster, unmatched, bastion_used)
+
+def check_bootstrapped_over_ssh(ctx, cluster, hosts, bastion_used):
+    check_operations = []
+    check_results = Queue.Queue()
+
+    def do_check(host_key, host, check_results):
+        try:
+            ctx.console.info('Checking bootstrap status for %s', host)
+            ssh(['ls ~/.bootstrap_complete'], ctx, host)
+            ctx.console.debug('Host is bootstrapped: %s.', host)
+            check_results.put(host_key)
+        except:
+            ctx.console.debug('Host is not bootstrapped: %s.', host)
+
+    for host in hosts:
+        check_operations.append((do_check, [host.key, host.private_ip_address, check_results], host.private_ip_address))
+
+    wait_on_host_operations(ctx, 'checking bootstrap status', check_operations, bastion_used, None)
+
+    cluster.mark_bootstrapped(list(check_results.queue))
+
+def get_inventory(ctx, check_bootstrapped=False):
+    '''
+    The hosts of the cluster, from the existing machines file or the running EC2 instances tagged
+    with its name, loaded once and cached on the context until clear_inventory_cache is called
+    '''
+    if ctx.inventory is None:
+        node_config = ctx.node_config or {}
+        saltmaster_key = ctx.instance_key(node_config.get('salt-master-instance', ''))
+        console_key = ctx.instance_key(node_config.get('console-instance', ''))
+        if ctx.is_existing_machines():
+            existing_machines = config_cache.load_json(ctx.existing_machines_def_file)
+            hosts = [inventory.from_existing_machine(ctx.instance_key(node), node, details) for node, details in existing_machines.items()]
+        else:
+            ctx.console.debug('Checking details of created instances')
+            ec2 = ec2_connection(ctx)
+            reservations = retry_policy.AWS_API.call(ctx.log, ec2.get_all_reservations)
+            hosts = []
+            for reservation in reservations:
+                for instance in reservation.instances:
+                    if 'pnda_cluster' in instance.tags and instance.tags['pnda_cluster'] == ctx.name and instance.state == 'running':
+                        ctx.console.debug(instance.private_ip_address + ' ' + instance.tags['Name'])
+                        hosts.append(inventory.from_ec2(instance, saltmaster_key))
+        cluster = inventory.Inventory(hosts, saltmaster_key, console_key)
+
+        if check_bootstrapped:
+            check_hosts_bootstrapped(ctx, cluster, len(cluster.bastions) > 0)
+
+        ctx.inventory = cluster
+
+    return ctx.inventory
+
+def get_requested_node_counts(ctx):
+    # This function counts the number of machines that exist for each node type
+    return get_node_counts(ctx, False)
+
+def get_live_node_counts(ctx):
+    # This function counts the number of machines that have been bootstrapped into a salt cluster for each node type
+    return get_node_counts(ctx, True)
+
+def get_node_counts(ctx, live_only):
+    # This function counts the number of machines for each node type, optionally limiting to live (bootstrapped) nodes only
+    ctx.console.debug('Counting %s instances', 'live' if live_only else 'all')
+
+    node_counts = {'zk':0, 'kafka':0, 'hadoop-dn':0, 'opentsdb':0}
+    node_counts.update(get_inventory(ctx, live_only).counts(live_only))
+    return node_counts
+
+def write_ssh_config(ctx, bastions, os_user, keyfile, hosts=()):
+    '''
+    Write the ssh config for the cluster. When there are bastions, each of hosts is reached through
+    the bastion the ring assigns it and any other host through the first bastion. The socks proxy
+    script goes through the first bastion.
+    '''
+    ctx.bastion_ring.set_bastions(bastions)
+
+    def proxy_command(bastion_ip):
+        return ('    ProxyCommand ssh -i %s -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null %s@%s exec nc %%h %%p\n'
+                % (keyfile, os_user, bastion_ip))
+
+    # ssh may be reading the config while it is rewritten as hosts are added
+    with open(ctx.ssh_config + '.tmp', 'w') as config_file:
+        if bastions:
+            for host in sorted(set(hosts)):
+                config_file.write('host %s\n' % host)
+                config_file.write(proxy_command(ctx.bastion_ring.bastion_for(host)))
+        config_file.write('host *\n')
+        config_file.write('    User %s\n' % os_user)
+        config_file.write('    IdentityFile %s\n' % keyfile)
+        config_file.write('    StrictHostKeyChecking no\n')
+        config_file.write('    UserKnownHostsFile /dev/null\n')
+        if bastions:
+            config_file.write(proxy_command(bastions[0]))
+    os.rename(ctx.ssh_config + '.tmp', ctx.ssh_config)
+    if not bastions:
+        return
+    bastion_ip = bastions[0]
+
+    socks_file_path = ctx.socks_proxy
+    with open(socks_file_path, 'w') as config_file:
+        config_file.write('''
+unset SSH_AUTH_SOCK
+unset SSH_AGENT_PID
+
+for FILE in $(find /tmp/ssh-* -type s -user ${LOGNAME} -name "agent.[0-9]*" 2>/dev/null)
+do
+    SOCK_PID=${FILE##*.}
+
+    PID=$(ps -fu${LOGNAME}|awk '/ssh-agent/ && ( $2=='${SOCK_PID}' || $3=='${SOCK_PID}' || $2=='${SOCK_PID}' +1 ) {print $2}')
+
+    if [ -z "$PID" ]
+    then
+        continue
+    fi
+
+    export SSH_AUTH_SOCK=${FILE}
+    export SSH_AGENT_PID=${PID}
+    break
+done
+
+if [ -z "$SSH_AGENT_PID" ]
+then
+    echo "Starting a new SSH Agent..."
+    eval `ssh-agent`
+else
+    echo "Using existing SSH Agent with pid: ${SSH_AGENT_PID}, sock file: ${SSH_AUTH_SOCK}"
+fi\n''')
+        config_file.write('eval `ssh-agent`\n')
+        config_file.write('ssh-add %s\n' % keyfile)
+        config_file.write('ssh -i %s -o StrictHostKeyChecking=no -o UserKnownHostsFile=/dev/null -A -D 9999 %s@%s\n' % (keyfile, os_user, bastion_ip))
+    mode = os.stat(socks_file_path).st_mode
+    os.chmod(socks_file_path, mode | (mode & 292) >> 2)
+
+def bastion_command(ctx, bastion_ip, keyfile, cmd):
+    return ['ssh', '-i', keyfile, '-o', 'StrictHostKeyChecking=no', '-o', 'UserKnownHostsFile=/dev/null',
+            '%s@%s' % (ctx.pnda_env['ec2_access']['OS_USER'], bastion_ip), cmd]
+
+def sweep_from_bastion(ctx, hosts, bastion_ip, keyfile, timeout, on_up):
+    # A single session to the bastion probes every host for an SSH banner. Hosts are queued up as
+    # soon as they are seen and on_up is called for each from its own thread, so an on_up that waits
+    # for a connection slot does not hold up reading the sweep. Returns the hosts that did not come up in time.
+    reported = set()
+    up_hosts = Queue.Queue()
+
+    def handle_line(line):
+        result = connectivity_sweep.parse_sweep_line(line)
+        if result is not None and result[0] == 'up' and result[1] not in reported:
+            reported.add(result[1])
+            up_hosts.put(result[1])
+
+    def start_up_hosts():
+        for host in iter(up_hosts.get, None):
+            on_up(host)
+
+    starter = Thread(target=start_up_hosts)
+    starter.start()
+    try:
+        sweep_cmd = bastion_command(ctx, bastion_ip, keyfile, connectivity_sweep.build_sweep_command(hosts, timeout))
+        ret_val = subprocess_to_log.call(sweep_cmd, ctx.log, bastion_ip, stdout_handler=handle_line)
+    finally:
+        up_hosts.put(None)
+        starter.join()
+    if ret_val != 0:
+        raise RemoteCommandError("Error running connectivity sweep on bastion %s. See debug log (%s) for details." % (bastion_ip, ctx.log_file_name), ret_val)
+    return set(hosts) - reported
+
+def wait_for_host_connectivity(ctx, cluster, bastion_used, keyfile):
+    hosts = cluster.private_ips()
+    wait_operations = []
+    wait_errors = Queue.Queue()
+
+    def do_wait(host, wait_errors):
+        try:
+            ctx.console.info('Checking connectivity to %s', host)
+            ssh(['ls ~'], ctx, host, policy=retry_policy.SSH_CONNECT)
+        except:
+            ctx.log.info(traceback.format_exc())
+            ret_val = 'Giving up waiting for connectivity to %s' % host
+            wait_errors.put(ret_val)
+            ctx.console.error(ret_val)
+
+    if not bastion_used:
+        for host in hosts:
+            wait_operations.append((do_wait, [host, wait_errors], host))
+        wait_on_host_operations(ctx, 'waiting for host connectivity', wait_operations, False, wait_errors)
+        return
+
+    # Rather than every host being polled over its own ssh session through its bastion, each
+    # bastion sweeps the hosts routed through it and full ssh checks start only for hosts reported up
+    threads = []
+    started = set()
+
+    def on_up(host):
+        started.add(host)
+        start_host_operation(ctx, do_wait, [host, wait_errors], host, True, threads)
+
+    def sweep(bastion_ip, bastion_hosts):
+        try:
+            ctx.console.info('Sweeping %s hosts for SSH from the bastion %s', len(bastion_hosts), bastion_ip)
+            for host in sweep_from_bastion(ctx, bastion_hosts, bastion_ip, keyfile, 10 * 60, on_up):
+                ret_val = 'Giving up waiting for connectivity to %s' % host
+                wait_errors.put(ret_val)
+                ctx.console.error(ret_val)
+        except:
+            ctx.log.info(traceback.format_exc())
+            ctx.console.warning('Connectivity sweep from the bastion %s failed, checking each of its hosts over ssh instead', bastion_ip)
+            for host in bastion_hosts:
+                if host not in started:
+                    on_up(host)
+
+    sweeps = [Thread(target=sweep, args=[bastion_ip, bastion_hosts]) for bastion_ip, bastion_hosts in cluster.hosts_by_bastion(ctx.bastion_ring).items()]
+    for sweep_thread in sweeps:
+        sweep_thread.start()
+    for sweep_thread in sweeps:
+        sweep_thread.join()
+    join_host_operations(ctx, 'waiting for host connectivity', threads, wait_errors)
+
+def prepare_host_access(ctx, cluster, keyfile):
+    '''
+    Write the ssh config for the instances and wait until all of them accept connections.
+    Returns the public IP of the first bastion, or None if there are no bastions.
+    '''
+    bastions = cluster.bastion_ips()
+    write_ssh_config(ctx, bastions, ctx.pnda_env['ec2_access']['OS_USER'], keyfile, cluster.private_ips())
+
+    failed = Queue.Queue()
+
+    def prepare(bastion_ip):
+        try:
+            prepare_bastion(ctx, bastion_ip, keyfile)
+        except:
+            ctx.log.info(traceback.format_exc())
+            failed.put(bastion_ip)
+
+    preparations = [Thread(target=prepare, args=[bastion_ip]) for bastion_ip in bastions]
+    for preparation in preparations:
+        preparation.start()
+    for preparation in preparations:
+        preparation.join()
+    if not failed.empty():
+        ctx.console.error('Giving up waiting for connectivity to %s', ', '.join(sorted(failed.queue)))
+        sys.exit(-1)
+
+    ctx.record_phase('connectivity')
+    wait_for_host_connectivity(ctx, cluster, len(bastions) > 0, keyfile)
+    return bastions[0] if bastions else None
+
+def prepare_bastion(ctx, bastion_ip, keyfile):
+    '''
+    Wait until a bastion accepts connections and has nc installed for proxying
+    '''
+    nc_install_cmd = bastion_command(ctx, bastion_ip, keyfile, 'sudo yum install -y nc || echo nc already installed')
+
+    def install_nc():
+        check_not_aborted(ctx, bastion_ip)
+        ret_val = subprocess_to_log.call(nc_install_cmd, ctx.log, bastion_ip, cancel=ctx.aborted)
+        check_not_aborted(ctx, bastion_ip)
+        if ret_val != 0:
+            ctx.console.info('Still waiting for connectivity to bastion %s. See debug log (%s) for details.', bastion_ip, ctx.log_file_name)
+            raise RemoteCommandError("Error running ssh commands on host %s. See debug log (%s) for details." % (bastion_ip, ctx.log_file_name), ret_val)
+
+    retry_policy.SSH_CONNECT.call(ctx.log, install_nc)
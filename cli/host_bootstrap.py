@@ -0,0 +1,619 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Bootstrap the hosts of a cluster: the saltmaster, then any salt syndics and then
+            every other host over ssh, optionally as instances come up while the stack is still
+            being created, or through a bundle that self bootstrapping instances download
+
+"""
+
+import os
+import time
+import traceback
+import tempfile
+import Queue
+import StringIO
+
+from threading import Thread
+
+import config_cache
+import retry_policy
+import self_bootstrap
+import stack_watch
+import preflight
+import bastion_routing
+import bootstrap_schedule
+import bootstrap_phases
+import background_stage
+import inventory
+import salt_tuning
+import salt_syndic
+
+from cluster_context import ROOT, MILLI_TIME, PNDAConfigException, repo_path
+from cloud_formation import ec2_connection, bootstrap_bucket
+from host_access import write_ssh_config, prepare_bastion
+from remote_ops import THROW_BASH_ERROR, scp, fetch, ssh, ssh_output, process_thread_errors, start_host_operation, wait_on_host_operations
+
+def get_volume_info(node_type, config_file):
+    volumes = None
+    if len(node_type) > 0:
+        volume_config = config_cache.load_yaml(config_file)
+        volume_class = volume_config['instances'][node_type]
+        volumes = volume_config['classes'][volume_class]
+    return volumes
+
+def export_bootstrap_resources(ctx, files, commands):
+    import tarfile
+    with tarfile.open(repo_path('cli', 'logs', '%s_%s_bootstrap-resources.tar.gz' % (ctx.name, MILLI_TIME())), "w:gz") as tar:
+        for resource_file in files:
+            tar.add(resource_file, arcname=os.path.relpath(resource_file, ROOT))
+        command_text = StringIO.StringIO()
+        command_text.write('\n'.join([command for command in commands if command.startswith('export')]))
+        command_text.seek(0)
+        command_info = tarfile.TarInfo(name="cli/additional_exports.sh")
+        command_info.size = len(command_text.buf)
+        tar.addfile(tarinfo=command_info, fileobj=command_text)
+
+def bootstrap_plan(ctx, node_type, node_idx, saltmaster, branch, salt_tarball, certs_tarball, is_saltmaster, is_syndic=False, syndic_ip=None):
+    '''
+    Files a host of node_type needs in /tmp and the commands that bootstrap it once they are there.
+    A host with syndic_ip registers its minion with that syndic instead of the saltmaster.
+    '''
+    type_script = repo_path('bootstrap-scripts', ctx.flavor, '%s.sh' % node_type)
+    if not os.path.isfile(type_script):
+        type_script = repo_path('bootstrap-scripts', '%s.sh' % node_type)
+    files_to_scp = [ctx.pnda_env_sh,
+                    repo_path('bootstrap-scripts', 'outbound-firewall.sh'),
+                    repo_path('bootstrap-scripts', 'package-install.sh'),
+                    repo_path('bootstrap-scripts', 'base.sh'),
+                    repo_path('bootstrap-scripts', 'volume-mappings.sh'),
+                    type_script]
+
+    volume_config = repo_path('bootstrap-scripts', ctx.flavor, 'volume-config.yaml')
+    requested_volumes = get_volume_info(node_type, volume_config)
+    cmds_to_run = ['source /tmp/pnda_env_%s.sh' % ctx.name,
+                   'export PNDA_SALTMASTER_IP=%s' % saltmaster,
+                   'export PNDA_CLUSTER=%s' % ctx.name,
+                   'export PNDA_FLAVOR=%s' % ctx.flavor,
+                   'export PNDA_SYNDIC_IP=%s' % syndic_ip if syndic_ip is not None else ':',
+                   'export PLATFORM_GIT_BRANCH=%s' % branch,
+                   'export PLATFORM_SALT_TARBALL=%s' % salt_tarball if salt_tarball is not None else ':',
+                   'export SECURITY_CERTS_TARBALL=%s' % certs_tarball if certs_tarball is not None else ':',
+                   'sudo chmod a+x /tmp/outbound-firewall.sh',
+                   'sudo chmod a+x /tmp/package-install.sh',
+                   'sudo chmod a+x /tmp/base.sh',
+                   'sudo chmod a+x /tmp/volume-mappings.sh']
+
+    if requested_volumes is not None and 'partitions' in requested_volumes:
+        cmds_to_run.append('sudo mkdir -p /etc/pnda/disk-config && echo \'%s\' | sudo tee /etc/pnda/disk-config/partitions' % '\n'.join(
+            requested_volumes['partitions']))
+    if requested_volumes is not None and 'volumes' in requested_volumes:
+        cmds_to_run.append('sudo mkdir -p /etc/pnda/disk-config && echo \'%s\' | sudo tee /etc/pnda/disk-config/requested-volumes' % '\n'.join(
+            requested_volumes['volumes']))
+
+    cmds_to_run.append('(sudo -E /tmp/base.sh 2>&1) | tee -a pnda-bootstrap.log; %s' % THROW_BASH_ERROR)
+
+    if is_saltmaster:
+        files_to_scp.append(repo_path('bootstrap-scripts', 'saltmaster-common.sh'))
+        files_to_scp.append(ctx.salt_master_conf)
+        cmds_to_run.append('sudo chmod a+x /tmp/saltmaster-common.sh')
+        cmds_to_run.append('(sudo -E /tmp/saltmaster-common.sh 2>&1) | tee -a pnda-bootstrap.log; %s' % THROW_BASH_ERROR)
+        if os.path.isfile(repo_path('git.pem')):
+            files_to_scp.append(repo_path('git.pem'))
+
+    if is_syndic:
+        # the tarball of the saltmaster's tree is sent by bootstrap_syndics, as it is not a bootstrap resource
+        files_to_scp.append(repo_path('bootstrap-scripts', 'syndic-common.sh'))
+        cmds_to_run.append('export PNDA_SALT_TREE_TARBALL=%s' % os.path.basename(ctx.salt_tree_tarball))
+        cmds_to_run.append('sudo chmod a+x /tmp/syndic-common.sh')
+        cmds_to_run.append('(sudo -E /tmp/syndic-common.sh 2>&1) | tee -a pnda-bootstrap.log; %s' % THROW_BASH_ERROR)
+
+    cmds_to_run.append('sudo chmod a+x /tmp/%s.sh' % node_type)
+    cmds_to_run.append('(sudo -E /tmp/%s.sh %s 2>&1) | tee -a pnda-bootstrap.log; %s' % (node_type, node_idx, THROW_BASH_ERROR))
+    return files_to_scp, cmds_to_run, volume_config
+
+def bootstrap(instance, saltmaster, ctx, branch, salt_tarball, certs_tarball, error_queue, bootstrap_files=None, bootstrap_commands=None,
+              durations=None, attempts=None):
+    # Failed attempts are retried by the bootstrap retry policy, each one resuming from the
+    # phase that failed. The number of attempts made is put on the attempts queue.
+    ret_val = None
+    start = time.time()
+    attempt = [0]
+    volumes = {}
+
+    def note_volume(line):
+        timing = bootstrap_phases.parse_volume_timing(line)
+        if timing is not None:
+            volumes[timing[0]] = timing[1]
+
+    try:
+        ip_address = instance.private_ip_address
+        ctx.console.debug('bootstrapping %s', ip_address)
+        node_type = instance.node_type
+        if len(node_type) <= 0:
+            return
+
+        is_saltmaster = node_type == ctx.node_config['salt-master-instance'] or instance.is_saltmaster
+        files_to_scp, cmds_to_run, volume_config = bootstrap_plan(ctx, node_type, instance.node_idx, saltmaster, branch,
+                                                                  salt_tarball, certs_tarball, is_saltmaster, instance.is_syndic, instance.syndic_ip)
+        cmds_to_run.append('touch ~/.bootstrap_complete')
+        resumable_cmds = bootstrap_phases.resumable(cmds_to_run, bootstrap_phases.marker_dir(MILLI_TIME()))
+
+        def attempt_bootstrap():
+            attempt[0] += 1
+            if attempt[0] > 1:
+                ctx.console.info('Bootstrapping %s again, attempt %s of %s', instance.name, attempt[0], retry_policy.BOOTSTRAP.max_attempts)
+            # the bootstrap policy owns the retries, resuming from the last phase completed
+            scp(files_to_scp, ctx, ip_address, policy=retry_policy.SINGLE_ATTEMPT)
+            ssh(resumable_cmds, ctx, ip_address, stdout_handler=note_volume, policy=retry_policy.SINGLE_ATTEMPT, stream='bootstrap')
+
+        retry_policy.BOOTSTRAP.call(ctx.log, attempt_bootstrap)
+        # resumed attempts only take part of the time, so only first attempts go in the history
+        if durations is not None and attempt[0] == 1:
+            durations.put((node_type, time.time() - start))
+
+        if bootstrap_files is not None:
+            map(bootstrap_files.put, files_to_scp)
+            bootstrap_files.put(volume_config)
+        if bootstrap_commands is not None:
+            map(bootstrap_commands.put, cmds_to_run)
+
+    except retry_policy.Aborted:
+        ctx.console.info('Abandoned bootstrapping %s', instance.name)
+        error_queue.put('Bootstrap of %s aborted' % instance.name)
+    except:
+        ret_val = 'Error for host %s after %s attempts. %s' % (instance.name, attempt[0], traceback.format_exc())
+        ctx.console.error(ret_val)
+        error_queue.put(ret_val)
+    finally:
+        if attempts is not None and attempt[0] > 0:
+            attempts.put((instance.name, attempt[0]))
+        if volumes:
+            ctx.log.info('Prepared %s volumes on %s, slowest took %.1f seconds', len(volumes), instance.name,
+                         max(timing['seconds'] for timing in volumes.values()))
+            ctx.merge_to_runfile('volume_timings', {instance.name: volumes})
+
+def report_attempts(ctx, attempts):
+    '''
+    Log the hosts that took more than one attempt to bootstrap and record every host's attempts in the run journal
+    '''
+    by_host = dict(attempts)
+    retried = sorted((name, count) for name, count in by_host.items() if count > 1)
+    if retried:
+        ctx.console.info('Hosts that took more than one bootstrap attempt: %s', ', '.join('%s (%s)' % (name, count) for name, count in retried))
+    ctx.merge_to_runfile('bootstrap_attempts', by_host)
+
+def prepare_artifacts(ctx, node_types):
+    '''
+    Make the certificates and platform salt tarballs the saltmaster is bootstrapped with and load
+    the volume config of every node type, so none of it is left to do once hosts are reachable.
+    Returns the local paths of the tarballs, either of which may be None.
+    '''
+    volume_config = repo_path('bootstrap-scripts', ctx.flavor, 'volume-config.yaml')
+    for node_type in node_types:
+        get_volume_info(node_type, volume_config)
+    platform_certs_tarball_path = make_certs_tarball(ctx) if ctx.pnda_env['security']['SECURITY_MODE'] != 'disabled' else None
+    try:
+        platform_salt_tarball_path = make_platform_salt_tarball(ctx)
+    except:
+        discard_artifacts([platform_certs_tarball_path])
+        raise
+    return platform_salt_tarball_path, platform_certs_tarball_path
+
+def discard_artifacts(paths):
+    for path in paths:
+        if path is not None and os.path.exists(path):
+            os.remove(path)
+
+def abandon_artifacts(artifacts):
+    # remove whatever a background preparation made and nothing consumed
+    try:
+        paths = artifacts.result()
+    except Exception: #pylint: disable=W0703
+        return
+    discard_artifacts(paths)
+
+def start_preparing_artifacts(ctx, node_types):
+    '''
+    Run prepare_artifacts in the background, for bootstrap_saltmaster to pick up
+    '''
+    return background_stage.BackgroundStage(ctx.log, 'Preparing bootstrap artifacts', prepare_artifacts, ctx, sorted(set(node_types)))
+
+def bootstrap_saltmaster(ctx, saltmaster, branch, bootstrap_files=None, bootstrap_commands=None, artifacts=None):
+    '''
+    Ship the platform salt and certificates tarballs to the saltmaster and bootstrap it. The tarballs
+    are made here unless artifacts, from start_preparing_artifacts, has them ready.
+    Returns the name of the platform salt tarball, which the other hosts are bootstrapped with.
+    '''
+    saltmaster_ip = saltmaster.private_ip_address
+    if artifacts is not None:
+        platform_salt_tarball_path, platform_certs_tarball_path = artifacts.result()
+    else:
+        platform_salt_tarball_path, platform_certs_tarball_path = prepare_artifacts(ctx, [])
+
+    platform_salt_tarball = None
+    platform_certs_tarball = None
+    try:
+        if platform_salt_tarball_path is not None:
+            platform_salt_tarball = os.path.basename(platform_salt_tarball_path)
+            scp([platform_salt_tarball_path], ctx, saltmaster_ip)
+        if platform_certs_tarball_path is not None:
+            platform_certs_tarball = os.path.basename(platform_certs_tarball_path)
+            scp([platform_certs_tarball_path], ctx, saltmaster_ip)
+    finally:
+        discard_artifacts([platform_salt_tarball_path, platform_certs_tarball_path])
+
+    errors = Queue.Queue()
+    duration = Queue.Queue()
+    attempts = Queue.Queue()
+    bootstrap(saltmaster, saltmaster_ip, ctx, branch, platform_salt_tarball, platform_certs_tarball, errors, bootstrap_files, bootstrap_commands,
+              duration, attempts)
+    report_attempts(ctx, list(attempts.queue))
+    process_thread_errors(ctx, 'bootstrapping saltmaster', errors)
+    bootstrap_schedule.record_durations(list(duration.queue))
+    return platform_salt_tarball
+
+def fetch_salt_tree(ctx, saltmaster_ip):
+    '''
+    Bring a tarball of the saltmaster's platform-salt tree and master configuration to ctx.salt_tree_tarball
+    '''
+    tarball_name = os.path.basename(ctx.salt_tree_tarball)
+    output = ssh_output([salt_syndic.build_pack_command(tarball_name)], ctx, saltmaster_ip)
+    size = salt_syndic.parse_pack_output(output)
+    if size is None:
+        raise Exception('No salt tree tarball was written on the saltmaster')
+    try:
+        fetch('/tmp/%s' % tarball_name, ctx, saltmaster_ip, ctx.salt_tree_tarball, size)
+    finally:
+        ssh(['rm -f /tmp/%s' % tarball_name], ctx, saltmaster_ip)
+
+def send_salt_tree(ctx, saltmaster_ip, syndics, bastion_used, apply_tree=False):
+    '''
+    Send each of syndics the saltmaster's platform-salt tree and master configuration. It is left in /tmp
+    for syndic-common.sh, or with apply_tree replaces the platform-salt tree of a running syndic.
+    '''
+    fetch_salt_tree(ctx, saltmaster_ip)
+    tarball_name = os.path.basename(ctx.salt_tree_tarball)
+    errors = Queue.Queue()
+
+    def do_send(syndic):
+        try:
+            scp([ctx.salt_tree_tarball], ctx, syndic.private_ip_address)
+            if apply_tree:
+                ssh([salt_syndic.build_apply_command(tarball_name)], ctx, syndic.private_ip_address)
+        except:
+            ret_val = 'Error for syndic %s. %s' % (syndic.name, traceback.format_exc())
+            ctx.console.error(ret_val)
+            errors.put(ret_val)
+
+    try:
+        wait_on_host_operations(ctx, 'sending the salt tree to syndics', [(do_send, [syndic], syndic.private_ip_address) for syndic in syndics],
+                                bastion_used, errors)
+    finally:
+        discard_artifacts([ctx.salt_tree_tarball])
+
+def bootstrap_syndics(ctx, syndics, saltmaster_ip, branch, salt_tarball, bastion_used, errors, bootstrap_files=None, bootstrap_commands=None):
+    '''
+    Bootstrap salt syndics, once the saltmaster is bootstrapped and before any host that registers with them.
+    Each syndic serves a copy of the saltmaster's platform-salt tree and master configuration.
+    '''
+    ctx.console.info('Bootstrapping %s salt syndics', len(syndics))
+    send_salt_tree(ctx, saltmaster_ip, syndics, bastion_used)
+    bootstrap_hosts(ctx, syndics, saltmaster_ip, branch, salt_tarball, bastion_used, errors, bootstrap_files, bootstrap_commands)
+
+def bootstrap_hosts(ctx, instances, saltmaster_ip, branch, salt_tarball, bastion_used, errors, bootstrap_files=None, bootstrap_commands=None):
+    '''
+    Bootstrap instances in parallel, critical node types first and the rest longest expected first
+    (see bootstrap_schedule.py). How long each host took is added to the history the expected
+    durations come from, and the predicted and actual time to bootstrap them all is reported.
+    '''
+    expected = bootstrap_schedule.expected_durations(bootstrap_schedule.load_history(), set(instance.node_type for instance in instances))
+    ordered = bootstrap_schedule.order(instances, expected)
+    ctx.console.debug('Bootstrap order: %s', ', '.join(instance.name for instance in ordered))
+    # staggering is per bastion, so with several the gap between starts is shorter overall
+    stagger_s = bastion_routing.STAGGER_S / float(max(1, len(ctx.bastion_ring.bastions))) if bastion_used else 0
+    predicted = bootstrap_schedule.predicted_makespan([expected[instance.node_type] for instance in ordered],
+                                                      min(limiter.limit for limiter in ctx.limiters), stagger_s)
+
+    durations = Queue.Queue()
+    attempts = Queue.Queue()
+    operations = [(bootstrap, [instance, saltmaster_ip, ctx, branch, salt_tarball, None, errors, bootstrap_files, bootstrap_commands, durations, attempts],
+                   instance.private_ip_address, bootstrap_schedule.is_critical(instance.node_type)) for instance in ordered]
+    start = time.time()
+    try:
+        wait_on_host_operations(ctx, 'bootstrapping host', operations, bastion_used, errors)
+    finally:
+        bootstrap_schedule.record_durations(list(durations.queue))
+        report_attempts(ctx, list(attempts.queue))
+    actual = time.time() - start
+    ctx.console.info('Bootstrapped %s hosts in %.0f seconds, %.0f seconds were predicted', len(ordered), actual, predicted)
+    ctx.to_runfile({'bootstrap_makespan': {'predicted_s': round(predicted, 1), 'actual_s': round(actual, 1)}})
+
+def prepare_bootstrap_bundle(ctx, template, branch):
+    '''
+    Build the bundle self bootstrapping instances download at boot and upload it to BOOTSTRAP_BUCKET.
+    Returns the S3 key, the bootstrap files and commands (for export_bootstrap_resources) and the
+    number of instances that will signal the stack.
+    '''
+    instances = self_bootstrap.instance_resources(template)
+    saltmaster_type = ctx.node_config['salt-master-instance']
+    salt_tarball_path = make_platform_salt_tarball(ctx)
+    certs_tarball_path = make_certs_tarball(ctx) if ctx.pnda_env['security']['SECURITY_MODE'] != 'disabled' else None
+    salt_tarball = os.path.basename(salt_tarball_path) if salt_tarball_path is not None else None
+    certs_tarball = os.path.basename(certs_tarball_path) if certs_tarball_path is not None else None
+    bundle_path = os.path.join(tempfile.gettempdir(), '%s-%s-bootstrap.tar.gz' % (ctx.name, MILLI_TIME()))
+
+    files = []
+    volume_configs = []
+    commands = []
+    node_scripts = {}
+    for _, node_type, _ in instances:
+        if node_type in node_scripts:
+            continue
+        is_saltmaster = node_type == saltmaster_type
+        node_files, cmds, volume_config = bootstrap_plan(ctx, node_type, '$2', '$1', branch, salt_tarball,
+                                                         certs_tarball if is_saltmaster else None, is_saltmaster)
+        files.extend(node_files)
+        volume_configs.append(volume_config)
+        commands.extend(cmds)
+        node_scripts[node_type] = self_bootstrap.node_script(ctx.pnda_env['ec2_access']['OS_USER'], cmds)
+    files = sorted(set(files))
+
+    try:
+        self_bootstrap.write_bundle(bundle_path, files + [path for path in [salt_tarball_path, certs_tarball_path] if path is not None], node_scripts)
+        key = bootstrap_bucket(ctx).new_key('%s/%s' % (ctx.name, os.path.basename(bundle_path)))
+        retry_policy.AWS_API.call(ctx.log, key.set_contents_from_filename, bundle_path)
+    finally:
+        for path in [bundle_path, salt_tarball_path, certs_tarball_path]:
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+    return key, files + sorted(set(volume_configs)), commands, len(instances)
+
+def write_pnda_env_sh(ctx):
+    client_only = ['AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY', 'PLATFORM_GIT_BRANCH']
+    pnda_env = ctx.pnda_env
+    with open(ctx.pnda_env_sh, 'w') as pnda_env_sh_file:
+        for section in pnda_env:
+            for setting in pnda_env[section]:
+                if setting not in client_only:
+                    val = '"%s"' % list(pnda_env[section][setting]) if isinstance(pnda_env[section][setting], (list, tuple)) else pnda_env[section][setting]
+                    pnda_env_sh_file.write('export %s=%s\n' % (setting, val))
+
+def write_salt_master_conf(ctx, node_types, syndics=0):
+    '''
+    Write the saltmaster settings for a cluster of hosts of node_types with a number of salt syndics, for the
+    saltmaster bootstrap to install
+    '''
+    minions = salt_tuning.minion_count(node_types)
+    with open(ctx.salt_master_conf, 'w') as conf_file:
+        conf_file.write(salt_tuning.render_master_conf(minions, syndics))
+    ctx.log.info('Saltmaster settings for %s minions and %s syndics: %s', minions, syndics, salt_tuning.master_settings(minions, syndics))
+
+def update_salt_master_conf(ctx, saltmaster_ip):
+    '''
+    Install the saltmaster settings on a running saltmaster, restarting it only if they changed
+    '''
+    scp([ctx.salt_master_conf], ctx, saltmaster_ip)
+    output = ssh_output([salt_tuning.build_update_command(os.path.basename(ctx.salt_master_conf))], ctx, saltmaster_ip)
+    if salt_tuning.was_updated(output):
+        ctx.console.info('Updated the saltmaster settings for the size of the cluster')
+
+def salt_timeout(cluster):
+    return salt_tuning.salt_timeout(salt_tuning.minion_count(host.node_type for host in cluster.typed))
+
+def bootstrap_during_stack_create(ctx, conn, template, keyfile, branch, errors, bootstrap_files, bootstrap_commands, artifacts=None):
+    '''
+    Bootstrap instances as soon as they are running while the stack is still being created: each
+    bastion is prepared as soon as it is up, once they all are the saltmaster is bootstrapped and
+    then every other instance, critical and longest expected first among those waiting. If the
+    stack fails, bootstraps in progress are aborted. Returns the final stack status and the IP of
+    the first bastion.
+    '''
+    instances = [(name, node_type) for name, node_type in preflight.template_instances(template, ctx.name) if node_type]
+    bastion_names = set(name for name, node_type in instances if node_type == 'bastion')
+    saltmaster_key = ctx.instance_key(ctx.node_config['salt-master-instance'])
+    expected = bootstrap_schedule.expected_durations(bootstrap_schedule.load_history(), set(node_type for _, node_type in instances))
+    critical_count = len([name for name, node_type in instances if bootstrap_schedule.is_critical(node_type)])
+    ctx.expect_critical(critical_count)
+
+    # the watcher thread reports instances as they start running and then the stack status, the
+    # saltmaster operation reports the outcome of its bootstrap, all through one queue
+    events = Queue.Queue()
+    durations = Queue.Queue()
+    attempts = Queue.Queue()
+
+    def on_running(instance):
+        events.put(('running', inventory.from_ec2(instance, saltmaster_key)))
+
+    def watch():
+        stack_status = 'CREATING'
+        try:
+            stack_status = stack_watch.watch(ctx, conn, ec2_connection(ctx), on_running,
+                                             check=artifacts.raise_if_failed if artifacts is not None else None)
+        except Exception as exception:
+            ctx.log.info(traceback.format_exc())
+            errors.put('Stopped watching the stack: %s' % exception)
+        if stack_status != 'CREATE_COMPLETE':
+            ctx.abort()
+        events.put(('stack', stack_status))
+
+    def bastion_operation(bastion):
+        try:
+            prepare_bastion(ctx, bastion.ip_address, keyfile)
+            events.put(('bastion', bastion))
+        except Exception as exception:
+            ctx.log.info(traceback.format_exc())
+            errors.put('Giving up waiting for connectivity to %s: %s' % (bastion.ip_address, exception))
+            ctx.abort()
+            events.put(('bastion_failed', bastion))
+
+    def wait_for_connectivity(host):
+        ctx.console.info('Checking connectivity to %s', host)
+        ssh(['ls ~'], ctx, host, policy=retry_policy.SSH_CONNECT)
+
+    def saltmaster_operation(saltmaster):
+        try:
+            wait_for_connectivity(saltmaster.private_ip_address)
+            ctx.console.info('Bootstrapping saltmaster. Expect this to take a few minutes, check the debug log for progress (%s).', ctx.log_file_name)
+            events.put(('saltmaster', bootstrap_saltmaster(ctx, saltmaster, branch, bootstrap_files, bootstrap_commands, artifacts)))
+        except Exception as exception:
+            ctx.log.info(traceback.format_exc())
+            errors.put(str(exception))
+            ctx.abort()
+            events.put(('saltmaster_failed', None))
+
+    def host_operation(instance, saltmaster_ip, salt_tarball):
+        try:
+            wait_for_connectivity(instance.private_ip_address)
+        except:
+            ctx.log.info(traceback.format_exc())
+            errors.put('Giving up waiting for connectivity to %s' % instance.private_ip_address)
+            return
+        bootstrap(instance, saltmaster_ip, ctx, branch, salt_tarball, None, errors, bootstrap_files, bootstrap_commands, durations, attempts)
+
+    threads = []
+    started = []
+    waiting = []
+    stack_status = None
+    stack_complete = None
+    bastions = {}
+    preparing = []
+    saltmaster_state = 'waiting'
+    saltmaster_ip = None
+    salt_tarball = None
+
+    def route():
+        # hosts are added to the ssh config, each behind its bastion, before anything connects to them
+        write_ssh_config(ctx, [bastions[name] for name in sorted(bastions)], ctx.pnda_env['ec2_access']['OS_USER'], keyfile,
+                         [instance.private_ip_address for instance in started])
+
+    def start(func, args, instance):
+        start_host_operation(ctx, func, args, instance.private_ip_address, len(bastion_names) > 0, threads,
+                             bootstrap_schedule.is_critical(instance.node_type))
+
+    ctx.record_phase('bootstrap')
+    watcher = Thread(target=watch)
+    watcher.start()
+    try:
+        while stack_status is None or ((saltmaster_state == 'running' or preparing) and not ctx.aborted.is_set()):
+            kind, value = events.get()
+            if kind == 'stack':
+                stack_status = value
+                stack_complete = time.time()
+            elif kind == 'saltmaster':
+                saltmaster_state, salt_tarball = 'done', value
+                ctx.console.info('Bootstrapping other instances as they come up. Check the debug log for progress (%s).', ctx.log_file_name)
+            elif kind == 'saltmaster_failed':
+                saltmaster_state = 'failed'
+            elif kind == 'bastion':
+                preparing.remove(value.key)
+                bastions[value.key] = value.ip_address
+            elif kind == 'bastion_failed':
+                preparing.remove(value.key)
+            elif value.key in bastion_names:
+                ctx.console.info('Bastion %s is running, waiting for it to accept connections', value.key)
+                waiting.append(value)
+                preparing.append(value.key)
+                preparation = Thread(target=bastion_operation, args=[value])
+                preparation.start()
+                threads.append(preparation)
+            else:
+                ctx.console.debug('%s is running', value.key)
+                waiting.append(value)
+
+            if ctx.aborted.is_set() or len(bastions) < len(bastion_names):
+                continue
+            saltmaster = next((instance for instance in waiting if instance.is_saltmaster), None)
+            if saltmaster_state == 'waiting' and saltmaster is not None:
+                waiting.remove(saltmaster)
+                saltmaster_ip = saltmaster.private_ip_address
+                saltmaster_state = 'running'
+                started.append(saltmaster)
+                route()
+                start(saltmaster_operation, [saltmaster], saltmaster)
+            elif saltmaster_state == 'done' and waiting:
+                ordered = bootstrap_schedule.order(waiting, expected)
+                started.extend(ordered)
+                route()
+                for instance in ordered:
+                    if ctx.aborted.is_set():
+                        break
+                    start(host_operation, [instance, saltmaster_ip, salt_tarball], instance)
+                waiting = []
+    finally:
+        ctx.expect_critical(-(critical_count - len([instance for instance in started if bootstrap_schedule.is_critical(instance.node_type)])))
+        for thread in threads:
+            thread.join()
+        watcher.join()
+        bootstrap_schedule.record_durations(list(durations.queue))
+        report_attempts(ctx, list(attempts.queue))
+
+    if stack_status in stack_watch.CREATING + ['CREATE_COMPLETE']:
+        # not a failed stack, which the caller reports, so anything that went wrong is in errors
+        missed = set(name for name, _ in instances) - set(instance.name for instance in started)
+        if stack_status == 'CREATE_COMPLETE' and missed and errors.empty():
+            errors.put('Instances %s were not seen running while the stack was created' % ', '.join(sorted(missed)))
+        process_thread_errors(ctx, 'bootstrapping hosts', errors)
+        ctx.console.info('Bootstrapped %s hosts, the last %.0f seconds after the stack was complete', len(started), time.time() - stack_complete)
+        ctx.to_runfile({'bootstrap_after_stack_s': round(time.time() - stack_complete, 1)})
+    return stack_status, bastions[min(bastions)] if bastions else None
+
+def check_artifacts(ctx, artifacts):
+    if artifacts is None:
+        return
+    try:
+        artifacts.raise_if_failed()
+    except:
+        ctx.console.error('Could not prepare the artifacts to bootstrap with. The stack is still being created, '
+                          'once the problem is fixed destroy it with: pnda-cli.py destroy -e %s', ctx.name)
+        raise
+
+def make_platform_salt_tarball(ctx):
+    '''
+    Local path of a tarball of PLATFORM_SALT_LOCAL, if it is set
+    '''
+    if 'PLATFORM_SALT_LOCAL' not in ctx.pnda_env['platform_salt']:
+        return None
+    import tarfile
+    import uuid
+    local_salt_path = repo_path(ctx.pnda_env['platform_salt']['PLATFORM_SALT_LOCAL'])
+    platform_salt_tarball_path = os.path.join(tempfile.gettempdir(), '%s.tmp' % str(uuid.uuid1()))
+    with tarfile.open(platform_salt_tarball_path, mode='w:gz') as archive:
+        archive.add(local_salt_path, arcname='platform-salt', recursive=True)
+    return platform_salt_tarball_path
+
+def make_certs_tarball(ctx):
+    '''
+    Local path of a tarball of SECURITY_MATERIAL_PATH, or None if it can not be made in permissive mode
+    '''
+    import tarfile
+    import uuid
+    platform_certs_tarball_path = None
+    try:
+        local_certs_path = repo_path(ctx.pnda_env['security']['SECURITY_MATERIAL_PATH'])
+        platform_certs_tarball_path = os.path.join(tempfile.gettempdir(), '%s.tar.gz' % str(uuid.uuid1()))
+        with tarfile.open(platform_certs_tarball_path, mode='w:gz') as archive:
+            archive.add(local_certs_path, arcname='security-certs', recursive=True)
+    except Exception as exception:
+        if platform_certs_tarball_path is not None and os.path.exists(platform_certs_tarball_path):
+            os.remove(platform_certs_tarball_path)
+        if ctx.pnda_env['security']['SECURITY_MODE'] == 'permissive':
+            ctx.log.warning(exception)
+            return None
+        else:
+            ctx.console.error(exception)
+            raise PNDAConfigException("Error: %s must contain certificates" % local_certs_path)
+    return platform_certs_tarball_path
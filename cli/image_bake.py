@@ -0,0 +1,105 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Machine images baked per node type by the bake command. The image ids are kept in
+            a manifest per flavor, cloud-formation/<flavor>/images.json, by region and by the
+            imageId they were baked from. Templates for clusters using baked images take the
+            image of each node type as a parameter, so expand can keep the images used at
+            create time and never replace existing instances.
+
+"""
+
+import os
+import json
+import time
+
+import config_cache
+
+from cluster_context import repo_path
+
+PARAMETER_PREFIX = 'imageId'
+
+def bake_packages(flavor, node_type):
+    '''
+    Packages to pre-install on the image for a node type, from the optional
+    bootstrap-scripts/<flavor>/bake-packages.yaml listing the packages salt installs for each
+    '''
+    path = repo_path('bootstrap-scripts', flavor, 'bake-packages.yaml')
+    if not os.path.isfile(path):
+        return []
+    return list(config_cache.load_yaml(path).get(node_type) or [])
+
+def manifest_path(flavor):
+    return repo_path('cloud-formation', flavor, 'images.json')
+
+def load_manifest(flavor):
+    path = manifest_path(flavor)
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+def record_images(flavor, region, source_image, images):
+    '''
+    Replace the images recorded for a flavor in a region
+    '''
+    manifest = load_manifest(flavor)
+    manifest[region] = {'source_image': source_image,
+                        'baked': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                        'images': images}
+    with open(manifest_path(flavor), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, sort_keys=True, indent=4)
+
+def baked_images(flavor, region, source_image):
+    '''
+    Node type to image id for the images baked for a flavor in a region, or None if there are
+    none or they were baked from a different imageId than the one now configured
+    '''
+    baked = load_manifest(flavor).get(region)
+    if baked is None or baked['source_image'] != source_image:
+        return None
+    return baked['images']
+
+def image_parameter(node_type):
+    return PARAMETER_PREFIX + ''.join(part.capitalize() for part in node_type.split('-'))
+
+def use_images(template_data, parameter_names):
+    '''
+    Take the ImageId of every instance from the image parameter for its node type, for those
+    node types whose parameter is one of parameter_names, and declare the parameters used
+    '''
+    used = {}
+    for resource in template_data['Resources'].values():
+        if resource['Type'] != 'AWS::EC2::Instance':
+            continue
+        tags = dict((tag['Key'], tag['Value']) for tag in resource['Properties'].get('Tags', []))
+        if not tags.get('node_type'):
+            continue
+        parameter = image_parameter(tags['node_type'])
+        if parameter in parameter_names:
+            used[parameter] = tags['node_type']
+            resource['Properties']['ImageId'] = {'Ref': parameter}
+
+    for parameter, node_type in used.iteritems():
+        template_data['Parameters'][parameter] = {
+            'Type': 'String',
+            'Description': 'Image baked for %s instances' % node_type
+        }
+
+def stack_image_parameters(stack_parameters):
+    '''
+    The image parameters of an existing stack, from its parameter keys
+    '''
+    return [key for key in stack_parameters if key.startswith(PARAMETER_PREFIX) and key != PARAMETER_PREFIX]
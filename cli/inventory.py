@@ -0,0 +1,175 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The hosts of a cluster, loaded from EC2 or from an existing machines file, as typed
+            records with indexes by key, role, node type, bootstrap state and bastion route, so
+            that finding the saltmaster or the hosts left to bootstrap does not rebuild instance
+            keys or scan every host. Each host is given the salt syndic it registers with, if any.
+
+"""
+
+import salt_syndic
+
+class Host(object):
+    '''
+    One instance or machine of a cluster. key is the cluster-qualified name the inventory is
+    indexed by, node_idx is always a string, empty for node types with a single host. syndic_ip is
+    the address of the salt syndic the host registers with, None for the saltmaster.
+    '''
+    __slots__ = ('key', 'name', 'node_type', 'node_idx', 'private_ip_address', 'ip_address', 'instance_id',
+                 'is_bastion', 'is_saltmaster', 'is_syndic', 'syndic_for', 'syndic_ip', 'bootstrapped')
+
+    def __init__(self, key, name, node_type, node_idx, private_ip_address, ip_address=None, instance_id=None,
+                 is_bastion=False, is_saltmaster=False, is_syndic=False, syndic_for=None):
+        self.key = key
+        self.name = name
+        self.node_type = node_type or ''
+        self.node_idx = '' if node_idx is None else str(node_idx)
+        self.private_ip_address = private_ip_address
+        self.ip_address = ip_address
+        self.instance_id = instance_id
+        self.is_bastion = is_bastion
+        self.is_saltmaster = is_saltmaster
+        self.is_syndic = is_syndic
+        self.syndic_for = list(syndic_for or [])
+        self.syndic_ip = None
+        self.bootstrapped = False
+
+    def __repr__(self):
+        return 'Host(%s, %s, %s)' % (self.key, self.node_type, self.private_ip_address)
+
+def from_ec2(instance, saltmaster_key=None):
+    '''
+    Host for a boto EC2 instance tagged by the cluster's Cloud Formation template
+    '''
+    name = instance.tags['Name']
+    node_type = instance.tags['node_type']
+    return Host(name, name, node_type, instance.tags['node_idx'], instance.private_ip_address, instance.ip_address, instance.id,
+                is_bastion=node_type == 'bastion', is_saltmaster=name == saltmaster_key, is_syndic=node_type == salt_syndic.NODE_TYPE)
+
+def from_existing_machine(key, node, details):
+    '''
+    Host for the entry named node in an existing machines file. Nodes are named <node type>-<index>
+    when there are several of a node type. A machine with is_syndic set is a salt syndic, for the
+    node types in its syndic_for or for any node type if it has none.
+    '''
+    try:
+        node_idx = int(node.split('-')[-1])
+    except ValueError:
+        node_idx = ''
+    is_bastion = details.get('is_bastion') is True
+    return Host(key, details['ip_address'], details['node_type'], node_idx, details['ip_address'],
+                details['public_ip_address'] if is_bastion else None,
+                is_bastion=is_bastion, is_saltmaster=details.get('is_saltmaster') is True,
+                is_syndic=details.get('is_syndic') is True or details['node_type'] == salt_syndic.NODE_TYPE,
+                syndic_for=details.get('syndic_for', []))
+
+class Inventory(object):
+    '''
+    Hosts of a cluster indexed by key, with the saltmaster and console found by their keys.
+    Hosts are assigned their syndics once. Views by node type and role are built once, views by bootstrap state whenever hosts are
+    marked bootstrapped and the bastion routes whenever the bastions change.
+    '''
+
+    def __init__(self, hosts, saltmaster_key=None, console_key=None):
+        self._hosts = sorted(hosts, key=lambda host: host.key)
+        self._by_key = dict((host.key, host) for host in self._hosts)
+        self._by_type = {}
+        for host in self._hosts:
+            if host.node_type:
+                self._by_type.setdefault(host.node_type, []).append(host)
+        self.typed = [host for host in self._hosts if host.node_type]
+        self.bastions = [host for host in self._hosts if host.is_bastion]
+        self.saltmaster = self._by_key.get(saltmaster_key)
+        if self.saltmaster is None:
+            self.saltmaster = next((host for host in self._hosts if host.is_saltmaster), None)
+        self.console = self._by_key.get(console_key)
+        self.syndics = [host for host in self._hosts if host.is_syndic and host is not self.saltmaster]
+        for key, syndic in salt_syndic.assign(self._hosts, self.syndics).items():
+            self._by_key[key].syndic_ip = syndic.private_ip_address
+        self._by_state = None
+        self._routes = (None, None)
+
+    def __len__(self):
+        return len(self._hosts)
+
+    def __iter__(self):
+        return iter(self._hosts)
+
+    def __contains__(self, key):
+        return key in self._by_key
+
+    def __getitem__(self, key):
+        return self._by_key[key]
+
+    def get(self, key):
+        return self._by_key.get(key)
+
+    def of_type(self, node_type):
+        return self._by_type.get(node_type, [])
+
+    def node_types(self):
+        return sorted(self._by_type)
+
+    def private_ips(self):
+        return [host.private_ip_address for host in self._hosts]
+
+    def bastion_ips(self):
+        '''
+        Public IPs of the bastions, in order of key
+        '''
+        return [host.ip_address for host in self.bastions if host.ip_address]
+
+    def mark_bootstrapped(self, keys):
+        for key in keys:
+            self._by_key[key].bootstrapped = True
+        self._by_state = None
+
+    def _states(self):
+        if self._by_state is None:
+            self._by_state = {True: [], False: []}
+            for host in self.typed:
+                self._by_state[host.bootstrapped].append(host)
+        return self._by_state
+
+    def bootstrapped(self):
+        return self._states()[True]
+
+    def unbootstrapped(self):
+        '''
+        Hosts with a node type that are not bootstrapped
+        '''
+        return self._states()[False]
+
+    def counts(self, live_only=False):
+        '''
+        Number of hosts of each node type, only counting bootstrapped hosts if live_only
+        '''
+        if not live_only:
+            return dict((node_type, len(hosts)) for node_type, hosts in self._by_type.items())
+        counts = {}
+        for host in self.bootstrapped():
+            counts[host.node_type] = counts.get(host.node_type, 0) + 1
+        return counts
+
+    def hosts_by_bastion(self, ring):
+        '''
+        Private IPs of every host grouped by the bastion ring routes them through
+        '''
+        bastions, routes = self._routes
+        if bastions != ring.bastions:
+            routes = ring.hosts_by_bastion(self.private_ips())
+            self._routes = (list(ring.bastions), routes)
+        return routes
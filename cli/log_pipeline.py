@@ -0,0 +1,177 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Asynchronous debug logging. Threads only put records on a queue, one writer
+            thread writes them to disk in batches. Records tagged with a host (see
+            subprocess_to_log) also go to a log file for that host, and the records of
+            each stream (bootstrap, salt, ...) reach the summary log only at or above
+            the level configured for that stream. At most MAX_OPEN_FILES log files are
+            kept open, the least recently written is closed to make room for another.
+
+"""
+
+import os
+import gzip
+import Queue
+import logging
+import threading
+
+from collections import OrderedDict
+
+STREAMS = ['cli', 'remote', 'bootstrap', 'salt']
+BATCH_SIZE = 1000
+MAX_OPEN_FILES = 64
+FORMATTER = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+_PIPELINE = None
+
+def parse_levels(level_args):
+    '''
+    Parse STREAM=LEVEL strings, e.g. salt=WARNING, into a dict of stream to level number
+    '''
+    levels = {}
+    for level_arg in level_args or []:
+        stream, _, level_name = level_arg.partition('=')
+        level = logging.getLevelName(level_name.upper())
+        if stream not in STREAMS or not isinstance(level, int):
+            raise ValueError('log level must be STREAM=LEVEL with STREAM one of %s, not %s' % (STREAMS, level_arg))
+        levels[stream] = level
+    return levels
+
+def host_log_dir(summary_path):
+    base = summary_path[:-3] if summary_path.endswith('.gz') else summary_path
+    return base[:-4] if base.endswith('.log') else base
+
+class QueueHandler(logging.Handler):
+    '''
+    Puts records for one summary log on the pipeline queue
+    '''
+
+    def __init__(self, pipeline, summary_path):
+        logging.Handler.__init__(self)
+        self.pipeline = pipeline
+        self.summary_path = summary_path
+
+    def emit(self, record):
+        try:
+            # render the message now, while its arguments are as the caller left them
+            record.msg = record.getMessage()
+            record.args = None
+            if record.exc_info:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+                record.exc_info = None
+            self.pipeline.queue.put((self, record))
+        except Exception: #pylint: disable=W0703
+            self.handleError(record)
+
+class LogPipeline(object):
+
+    def __init__(self, levels=None, compress=False):
+        self.levels = levels or {}
+        self.compress = compress
+        self.queue = Queue.Queue()
+        self._files = OrderedDict()
+        self._writer = threading.Thread(target=self._run, name='log-writer')
+        self._writer.daemon = True
+
+    def start(self):
+        self._writer.start()
+
+    def stop(self):
+        if self._writer.is_alive():
+            self.queue.put(None)
+            self._writer.join()
+
+    def _open(self, path):
+        log_file = self._files.pop(path, None)
+        if log_file is None:
+            if len(self._files) >= MAX_OPEN_FILES:
+                self._files.popitem(last=False)[1].close()
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            log_file = gzip.open(path, 'ab') if path.endswith('.gz') else open(path, 'a')
+        # most recently written last
+        self._files[path] = log_file
+        return log_file
+
+    def _host_log(self, summary_path, host):
+        return os.path.join(host_log_dir(summary_path), '%s.log%s' % (host, '.gz' if self.compress else ''))
+
+    def _route(self, queue_handler, record, pending):
+        line = queue_handler.format(record) + '\n'
+        if isinstance(line, unicode):
+            line = line.encode('utf-8')
+        stream = getattr(record, 'stream', 'cli')
+        if record.levelno >= self.levels.get(stream, logging.NOTSET):
+            pending.setdefault(queue_handler.summary_path, []).append(line)
+        host = getattr(record, 'host', None)
+        if host:
+            pending.setdefault(self._host_log(queue_handler.summary_path, host), []).append(line)
+
+    def _write(self, pending):
+        for path, lines in pending.iteritems():
+            log_file = self._open(path)
+            log_file.write(''.join(lines))
+            log_file.flush()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            pending = {}
+            for item in batch:
+                if item is None:
+                    stopping = True
+                else:
+                    self._route(item[0], item[1], pending)
+            try:
+                self._write(pending)
+            except (IOError, OSError) as exception:
+                logging.getLogger('console').error('Failed to write debug log: %s', exception)
+        for log_file in self._files.values():
+            log_file.close()
+
+def start(levels=None, compress=False):
+    global _PIPELINE
+    _PIPELINE = LogPipeline(levels, compress)
+    _PIPELINE.start()
+    return _PIPELINE
+
+def stop():
+    if _PIPELINE is not None:
+        _PIPELINE.stop()
+
+def log_file_name(path):
+    '''
+    Name of the summary log file for path, with .gz appended when logs are compressed
+    '''
+    return '%s.gz' % path if _PIPELINE is not None and _PIPELINE.compress else path
+
+def handler(summary_path):
+    '''
+    Handler for a summary log, through the pipeline if it is running and directly otherwise
+    '''
+    if _PIPELINE is not None:
+        log_handler = QueueHandler(_PIPELINE, summary_path)
+    else:
+        log_handler = logging.FileHandler(summary_path)
+    log_handler.setFormatter(FORMATTER)
+    return log_handler
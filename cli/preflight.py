@@ -0,0 +1,101 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Static checks of a cluster's topology, made before any stack is created or host
+            bootstrapped: every node type must resolve to a bootstrap script and a volume
+            class, the instances named in the flavor config must exist and node counts must
+            be within the flavor's validation rules. All problems are reported at once.
+
+"""
+
+import os
+
+import config_cache
+
+from cluster_context import repo_path
+
+GENERIC_SCRIPTS = ['outbound-firewall.sh', 'package-install.sh', 'base.sh', 'volume-mappings.sh', 'saltmaster-common.sh', 'syndic-common.sh']
+REQUIRED_INSTANCES = [('salt-master-instance', 'is_saltmaster'), ('console-instance', 'is_console')]
+
+def template_instances(template_data, cluster):
+    '''
+    (instance name, node type) for every instance in a Cloud Formation template, with names as
+    the instances will be tagged in cluster
+    '''
+    instances = []
+    for resource in template_data['Resources'].values():
+        if resource['Type'] != 'AWS::EC2::Instance':
+            continue
+        tags = dict((tag['Key'], tag['Value']) for tag in resource['Properties'].get('Tags', []))
+        name = tags.get('Name')
+        if isinstance(name, dict) and 'Fn::Join' in name:
+            separator, parts = name['Fn::Join']
+            name = separator.join([cluster if part == {'Ref': 'pndaCluster'} else part for part in parts])
+        instances.append((name, tags.get('node_type', '')))
+    return instances
+
+def _check_node_type(flavor, node_type, volume_config):
+    problems = []
+    if not os.path.isfile(repo_path('bootstrap-scripts', flavor, '%s.sh' % node_type)) and \
+       not os.path.isfile(repo_path('bootstrap-scripts', '%s.sh' % node_type)):
+        problems.append('No bootstrap script for node type %s: expected bootstrap-scripts/%s/%s.sh or bootstrap-scripts/%s.sh' %
+                        (node_type, flavor, node_type, node_type))
+    if volume_config is not None:
+        volume_class = (volume_config.get('instances') or {}).get(node_type)
+        if volume_class is None:
+            problems.append('Node type %s is not in the instances map of bootstrap-scripts/%s/volume-config.yaml' % (node_type, flavor))
+        elif volume_class not in (volume_config.get('classes') or {}):
+            problems.append('Volume class %s of node type %s is not defined in bootstrap-scripts/%s/volume-config.yaml' % (volume_class, node_type, flavor))
+    return problems
+
+def check_topology(ctx, instances, counts, range_validator):
+    '''
+    Every problem found with the topology of a cluster, as a list of messages. instances are
+    (instance name, node type) pairs and counts maps count fields, such as datanodes, to the
+    number requested, which is checked against the flavor's validation rules.
+    '''
+    problems = []
+    for script in GENERIC_SCRIPTS:
+        if not os.path.isfile(repo_path('bootstrap-scripts', script)):
+            problems.append('Missing generic bootstrap script bootstrap-scripts/%s' % script)
+
+    volume_config = None
+    volume_config_file = repo_path('bootstrap-scripts', ctx.flavor, 'volume-config.yaml')
+    if os.path.isfile(volume_config_file):
+        volume_config = config_cache.load_yaml(volume_config_file)
+    else:
+        problems.append('Missing bootstrap-scripts/%s/volume-config.yaml' % ctx.flavor)
+
+    names = set(name for name, _ in instances)
+    for key, flag in REQUIRED_INSTANCES:
+        if not ctx.node_config.get(key):
+            if ctx.is_existing_machines():
+                problems.append('No machine has %s set in %s' % (flag, ctx.existing_machines_def_file))
+            else:
+                problems.append('No %s in cloud-formation/%s/config.json' % (key, ctx.flavor))
+        elif ctx.instance_key(ctx.node_config[key]) not in names:
+            problems.append('The %s, %s, is not one of the instances of the cluster' % (key, ctx.node_config[key]))
+    bastion = ctx.node_config.get('bastion-instance')
+    if bastion and ctx.instance_key(bastion) not in names:
+        problems.append('The bastion-instance, %s, is not one of the instances of the cluster' % bastion)
+
+    for node_type in sorted(set(node_type for _, node_type in instances if node_type)):
+        problems.extend(_check_node_type(ctx.flavor, node_type, volume_config))
+
+    for field, count in sorted(counts.items()):
+        if count is not None and range_validator is not None and not range_validator.validate_field(field, count):
+            problems.append('%s is %s, it must be in range (%s) for the %s flavor' % (field, count, range_validator.get_validation_rule(field), ctx.flavor))
+
+    return problems
@@ -0,0 +1,117 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The reapply command, which brings platform-salt on the saltmaster up to date and
+            runs salt on the minions targeted
+
+"""
+
+import sys
+import os
+import tempfile
+
+import retry_policy
+import salt_reapply
+
+from cluster_context import repo_path
+from host_access import get_inventory
+from host_bootstrap import send_salt_tree, salt_timeout
+from remote_ops import THROW_BASH_ERROR, scp, ssh, ssh_output, run_salt
+
+def sync_platform_salt(ctx, saltmaster_ip, local_salt_path):
+    '''
+    Send the files of a local platform-salt tree that differ from those on the saltmaster, and remove the
+    ones the local tree no longer has. Returns the paths changed.
+    '''
+    import uuid
+    output = ssh_output([salt_reapply.build_manifest_command()], ctx, saltmaster_ip)
+    send, remove = salt_reapply.diff_manifests(salt_reapply.local_manifest(local_salt_path), salt_reapply.parse_manifest_output(output))
+    if not send and not remove:
+        return []
+
+    tarball_name = None
+    if send:
+        tarball_path = salt_reapply.make_tarball(local_salt_path, send, os.path.join(tempfile.gettempdir(), '%s.tar.gz' % str(uuid.uuid1())))
+        try:
+            scp([tarball_path], ctx, saltmaster_ip)
+        finally:
+            os.remove(tarball_path)
+        tarball_name = os.path.basename(tarball_path)
+    ssh([salt_reapply.build_apply_command(tarball_name, remove)], ctx, saltmaster_ip)
+    ctx.console.info('Sent %s changed files of platform-salt to the saltmaster and removed %s', len(send), len(remove))
+    return send + remove
+
+def reapply(ctx, branch, states, roles, minions, test, detach=False):
+    '''
+    Bring platform-salt on the saltmaster up to date, from PLATFORM_GIT_REPO_URI at branch or from
+    PLATFORM_SALT_LOCAL, then run highstate, or the states given, on the minions targeted by roles and
+    minion ids. Orchestrate runs as well when the changes or the states affect what it applies. With
+    test, salt only reports what it would change. Nothing is run if nothing changed and no states are given.
+    '''
+    states, roles, minions = states or [], roles or [], minions or []
+    cluster = get_inventory(ctx)
+    saltmaster_ip = cluster.saltmaster.private_ip_address
+    platform_salt = ctx.pnda_env['platform_salt']
+
+    ctx.record_phase('sync')
+    if platform_salt.get('PLATFORM_GIT_REPO_URI'):
+        ctx.console.info('Checking out %s of platform-salt on the saltmaster', branch)
+        # not retried: an attempt cut off after the checkout would leave nothing to diff
+        output = ssh_output([salt_reapply.build_git_command(branch)], ctx, saltmaster_ip, policy=retry_policy.SINGLE_ATTEMPT)
+        changed = salt_reapply.parse_changed_output(output)
+    elif platform_salt.get('PLATFORM_SALT_LOCAL'):
+        ctx.console.info('Syncing platform-salt from %s to the saltmaster', platform_salt['PLATFORM_SALT_LOCAL'])
+        changed = sync_platform_salt(ctx, saltmaster_ip, repo_path(platform_salt['PLATFORM_SALT_LOCAL']))
+    else:
+        ctx.console.error('reapply needs PLATFORM_GIT_REPO_URI or PLATFORM_SALT_LOCAL in the platform_salt section of pnda_env.yaml')
+        sys.exit(1)
+
+    if not changed and not states:
+        ctx.console.info('platform-salt on the saltmaster is up to date and no states were given, nothing to reapply')
+        ctx.record_phase('complete')
+        return
+    ctx.console.info('%s files changed, in states: %s', len(changed), ', '.join(salt_reapply.changed_states(changed)) or 'none')
+    if changed and cluster.syndics:
+        ctx.console.info('Sending the platform-salt tree to %s salt syndics', len(cluster.syndics))
+        send_salt_tree(ctx, saltmaster_ip, cluster.syndics, len(cluster.bastions) > 0, apply_tree=True)
+
+    orchestrate_text = ssh_output(['cat %s/%s 2>/dev/null || true' % (salt_reapply.PLATFORM_SALT_DIR, salt_reapply.ORCHESTRATE_SLS)],
+                                  ctx, saltmaster_ip)
+    orchestrate = salt_reapply.needs_orchestrate(changed, states, '\n'.join(orchestrate_text))
+
+    target = salt_reapply.target_args(roles, minions)
+    test_arg = ' test=True' if test else ''
+    timeout = salt_timeout(cluster)
+    cmds = []
+    if salt_reapply.needs_module_sync(changed):
+        cmds.append('(sudo salt -v --log-level=debug --timeout=%s %s saltutil.sync_all 2>&1) | tee -a pnda-salt.log; %s'
+                    % (timeout, target, THROW_BASH_ERROR))
+    if salt_reapply.needs_pillar_refresh(changed):
+        cmds.append('(sudo salt -v --log-level=debug --timeout=%s %s saltutil.refresh_pillar 2>&1) | tee -a pnda-salt.log; %s'
+                    % (timeout, target, THROW_BASH_ERROR))
+    if states:
+        cmds.append('(sudo salt -v --log-level=debug --timeout=%s --state-output=mixed %s state.sls %s%s queue=True 2>&1) | tee -a pnda-salt.log; %s'
+                    % (timeout, target, ','.join(states), test_arg, THROW_BASH_ERROR))
+    else:
+        cmds.append('(sudo salt -v --log-level=debug --timeout=%s --state-output=mixed %s state.highstate%s queue=True 2>&1) | tee -a pnda-salt.log; %s'
+                    % (timeout, target, test_arg, THROW_BASH_ERROR))
+    if orchestrate:
+        ctx.console.info('Including orchestrate because the changes affect states it applies')
+        cmds.append('(sudo CLUSTER=%s salt-run --log-level=debug state.orchestrate orchestrate.pnda%s 2>&1) | tee -a pnda-salt.log; %s'
+                    % (ctx.name, test_arg, THROW_BASH_ERROR))
+    ctx.to_runfile({'reapply': {'changed_files': changed, 'states': states, 'target': target, 'test': test, 'orchestrate': orchestrate}})
+
+    ctx.console.info('Running salt%s. Check the debug log for progress (%s).', ' in test mode' if test else '', ctx.log_file_name)
+    run_salt(ctx, saltmaster_ip, 'reapply', cmds, detach)
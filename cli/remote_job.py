@@ -0,0 +1,92 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Run long remote commands, such as salt highstate and orchestrate, as detached jobs
+            that carry on when the ssh session that started them goes away, and query their
+            state later. Each job keeps its script, pid, output and exit code in ~/pnda-jobs.
+
+"""
+
+import base64
+
+import remote_script
+
+JOBS_DIR = '~/pnda-jobs'
+STARTED_MARKER = 'PNDA_JOB_STARTED'
+STATE_MARKER = 'PNDA_JOB_STATE'
+
+# $1 is the job id, $2 the base64 encoded job script. Starting a job that already has a pid
+# file does nothing, so the launch can safely be retried after a dropped connection.
+LAUNCH_SCRIPT = '''
+job_id=$1
+mkdir -p %(jobs_dir)s && cd %(jobs_dir)s || exit 1
+if [ -e $job_id.pid ]; then
+    echo "%(started)s $job_id already started"
+    exit 0
+fi
+echo $2 | base64 -d > $job_id.sh
+nohup bash $job_id.sh > $job_id.log 2>&1 < /dev/null &
+echo $! > $job_id.pid
+echo "%(started)s $job_id"
+'''
+
+# $1 is the job id, $2 the number of lines of job output to report
+STATUS_SCRIPT = '''
+job_id=$1
+cd %(jobs_dir)s 2>/dev/null || { echo "%(state)s unknown"; exit 0; }
+if [ -e $job_id.exit ]; then
+    echo "%(state)s finished $(cat $job_id.exit)"
+elif [ -e $job_id.pid ] && kill -0 $(cat $job_id.pid) 2>/dev/null; then
+    echo "%(state)s running"
+elif [ -e $job_id.pid ]; then
+    echo "%(state)s lost"
+else
+    echo "%(state)s unknown"
+fi
+tail -n $2 $job_id.log 2>/dev/null
+'''
+
+def build_job_script(job_id, cmds):
+    '''
+    The script a job runs: the commands in order from the home directory, recording the exit
+    code of the script when it finishes, however it finishes
+    '''
+    return '\n'.join(["trap 'echo $? > %s/%s.exit' EXIT" % (JOBS_DIR, job_id), 'cd ~'] + cmds) + '\n'
+
+def build_launch_command(job_id, cmds):
+    script = LAUNCH_SCRIPT % {'jobs_dir': JOBS_DIR, 'started': STARTED_MARKER}
+    return remote_script.encoded_script_command(script, [job_id, base64.b64encode(build_job_script(job_id, cmds))])
+
+def build_status_command(job_id, tail_lines=5):
+    script = STATUS_SCRIPT % {'jobs_dir': JOBS_DIR, 'state': STATE_MARKER}
+    return remote_script.encoded_script_command(script, [job_id, str(int(tail_lines))])
+
+def parse_status_output(lines):
+    '''
+    (state, exit code, last lines of job output) from the output of the status command. State is
+    running, finished, lost (the job stopped without recording an exit code) or unknown.
+    '''
+    state = 'unknown'
+    exit_code = None
+    tail = []
+    for line in lines:
+        parts = line.strip().split()
+        if len(parts) >= 2 and parts[0] == STATE_MARKER:
+            state = parts[1]
+            if len(parts) > 2 and parts[2].isdigit():
+                exit_code = int(parts[2])
+        else:
+            tail.append(line.rstrip())
+    return state, exit_code, tail
@@ -0,0 +1,163 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Run commands on the hosts of a cluster and transfer files to and from them over
+            ssh, and run an operation on many hosts in parallel within the connection limits
+
+"""
+
+import os
+import json
+
+from threading import Thread
+
+import subprocess_to_log
+import retry_policy
+import remote_job
+
+from cluster_context import MILLI_TIME
+
+THROW_BASH_ERROR = "cmd_result=${PIPESTATUS[0]} && if [ ${cmd_result} != '0' ]; then exit ${cmd_result}; fi"
+
+class RemoteCommandError(Exception):
+    def __init__(self, message, exit_code):
+        super(RemoteCommandError, self).__init__(message)
+        self.exit_code = exit_code
+
+def check_not_aborted(ctx, host):
+    if ctx.aborted.is_set():
+        raise retry_policy.Aborted('Operation aborted, abandoned ssh session to %s' % host)
+
+def scp(files, ctx, host, policy=retry_policy.SCP):
+    # transfers are scheduled by size, so bulk ones wait behind small ones (see transfer_scheduler.py)
+    size = sum(os.path.getsize(local_file) for local_file in files if os.path.isfile(local_file))
+
+    def do_scp():
+        check_not_aborted(ctx, host)
+        with ctx.transfers.transfer(size) as options:
+            parts = ['scp', '-F', ctx.ssh_config] + options + files + ['%s:%s' % (host, '/tmp')]
+            ctx.console.debug(' '.join(parts))
+            ret_val = subprocess_to_log.call(parts, ctx.log, host, cancel=ctx.aborted)
+        check_not_aborted(ctx, host)
+        if ret_val != 0:
+            raise RemoteCommandError("Error transferring files to new host %s via SCP. See debug log (%s) for details." % (host, ctx.log_file_name), ret_val)
+
+    policy.call(ctx.log, do_scp)
+
+def fetch(remote_file, ctx, host, local_file, size):
+    # the reverse of scp, for bringing a file of known size back from a host
+    def do_fetch():
+        check_not_aborted(ctx, host)
+        with ctx.transfers.transfer(size) as options:
+            parts = ['scp', '-F', ctx.ssh_config] + options + ['%s:%s' % (host, remote_file), local_file]
+            ctx.console.debug(' '.join(parts))
+            ret_val = subprocess_to_log.call(parts, ctx.log, host, cancel=ctx.aborted)
+        check_not_aborted(ctx, host)
+        if ret_val != 0:
+            raise RemoteCommandError("Error transferring %s from host %s via SCP. See debug log (%s) for details."
+                                     % (remote_file, host, ctx.log_file_name), ret_val)
+
+    retry_policy.SCP.call(ctx.log, do_fetch)
+
+def report_transfers(ctx):
+    report = ctx.transfers.report()
+    if report['transfers'] > 0:
+        ctx.console.info('Made %s scp transfers, %.1f MB at %.2f Mbit/s while any was in flight, %.1f seconds were spent waiting to start them',
+                         report['transfers'], report['bytes'] / 1048576.0, report['mbps'], report['waited_s'])
+    ctx.to_runfile({'transfers': report})
+
+def ssh(cmds, ctx, host, stdout_handler=None, policy=retry_policy.SSH_COMMAND, stream='remote'):
+    parts = ['ssh', '-F', ctx.ssh_config, host]
+    parts.append(';'.join(cmds))
+    ctx.console.debug(json.dumps(parts))
+
+    def do_ssh():
+        check_not_aborted(ctx, host)
+        ret_val = subprocess_to_log.call(parts, ctx.log, host, scan_for_errors=[r'lost connection', r'\s*Failed:\s*[1-9].*'],
+                                         stdout_handler=stdout_handler, stream=stream, cancel=ctx.aborted)
+        check_not_aborted(ctx, host)
+        if ret_val != 0:
+            raise RemoteCommandError("Error running ssh commands on host %s. See debug log (%s) for details." % (host, ctx.log_file_name), ret_val)
+
+    policy.call(ctx.log, do_ssh)
+
+def ssh_output(cmds, ctx, host, policy=retry_policy.SSH_COMMAND):
+    '''
+    Run the commands on host and return the lines they printed. Each attempt collects its own
+    output, so lines printed by an attempt that was retried are not mixed into the result.
+    '''
+    def attempt():
+        output = []
+        ssh(cmds, ctx, host, stdout_handler=output.append, policy=retry_policy.SINGLE_ATTEMPT)
+        return output
+
+    return policy.call(ctx.log, attempt)
+
+def process_thread_errors(ctx, action, errors):
+    while not errors.empty():
+        error_message = errors.get()
+        raise Exception("Error %s, error msg: %s. See debug log (%s) for details." % (action, error_message, ctx.log_file_name))
+
+def start_host_operation(ctx, func, args, host, bastion_used, threads, critical=False):
+    # Run a (function, args) operation on host in its own thread, holding a connection slot
+    # for as long as it runs. This bounds the number of simultaneous outbound connections
+    # for this cluster, and across clusters when the context has a shared limiter.
+    # Critical operations may use the slots limiters hold back for them.
+    def run_operation():
+        try:
+            if bastion_used:
+                # If there is no bastion, start all operations at once. Otherwise leave a gap
+                # between starting each one through the same bastion to avoid overloading it with
+                # too many inbound connections and possibly having one rejected.
+                ctx.bastion_ring.admit(host)
+            func(*args)
+        finally:
+            ctx.release_connection_slot()
+
+    ctx.acquire_connection_slot(critical)
+    thread = Thread(target=run_operation)
+    thread.start()
+    threads.append(thread)
+
+def join_host_operations(ctx, action, threads, errors):
+    for thread in threads:
+        thread.join()
+
+    if errors is not None:
+        process_thread_errors(ctx, action, errors)
+
+def wait_on_host_operations(ctx, action, operations, bastion_used, errors):
+    # operations are (function, args, host) or (function, args, host, critical)
+    threads = []
+    ctx.expect_critical(len([operation for operation in operations if len(operation) > 3 and operation[3]]))
+    for operation in operations:
+        start_host_operation(ctx, operation[0], operation[1], operation[2], bastion_used, threads, *operation[3:])
+    join_host_operations(ctx, action, threads, errors)
+
+def run_salt(ctx, saltmaster_ip, operation, cmds, detach):
+    '''
+    Run salt commands on the saltmaster, either over this ssh session or as a detached job that
+    carries on without it and can be followed with the status command
+    '''
+    ctx.record_phase('salt')
+    if not detach:
+        ssh(cmds, ctx, saltmaster_ip, policy=retry_policy.SINGLE_ATTEMPT, stream='salt')
+        ctx.record_phase('complete')
+        return
+
+    job_id = '%s-%s' % (operation, MILLI_TIME())
+    ssh([remote_job.build_launch_command(job_id, cmds)], ctx, saltmaster_ip, policy=retry_policy.SINGLE_ATTEMPT)
+    ctx.to_runfile({'salt_job': job_id, 'saltmaster_ip': saltmaster_ip})
+    ctx.console.info('Salt is running on the saltmaster as job %s, follow it with: pnda-cli.py status -e %s', job_id, ctx.name)
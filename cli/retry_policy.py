@@ -0,0 +1,129 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Retry policies for AWS API calls and remote operations: exponential backoff with
+            full jitter, classification of which errors are worth retrying, overall deadlines
+            and per policy retry metrics
+
+"""
+
+import ssl
+import time
+import socket
+import random
+import threading
+
+# error codes returned by AWS APIs when a request was rejected without being applied
+AWS_RETRYABLE_CODES = frozenset(['Throttling', 'ThrottlingException', 'RequestLimitExceeded', 'RequestThrottled',
+                                 'TooManyRequestsException', 'ProvisionedThroughputExceededException',
+                                 'ServiceUnavailable', 'InternalError', 'InternalFailure', 'RequestTimeout'])
+
+# exit code ssh and scp use for their own errors, as opposed to errors from the remote command
+SSH_CONNECTION_FAILURE = 255
+
+def is_retryable_aws_error(exception):
+    '''
+    Throttling, server side and network errors. Anything else, such as a validation
+    error or a stack that already exists, fails straight away.
+    '''
+    if isinstance(exception, (ssl.SSLError, socket.error)):
+        return True
+    if getattr(exception, 'error_code', None) in AWS_RETRYABLE_CODES:
+        return True
+    status = getattr(exception, 'status', None)
+    return isinstance(status, int) and status >= 500
+
+def is_connection_failure(exception):
+    '''
+    ssh could not connect or lost the connection, so the remote command may never have run
+    '''
+    return getattr(exception, 'exit_code', None) == SSH_CONNECTION_FAILURE or 'lost connection' in str(exception)
+
+def is_any_error(_):
+    return True
+
+def is_never_retryable(_):
+    return False
+
+class Aborted(Exception):
+    '''
+    Raised by calls abandoned because the operation they are part of was aborted. Never retried.
+    '''
+    pass
+
+class RetryPolicy(object):
+    '''
+    Retries a call while it raises retryable errors, sleeping a random time between zero and an
+    exponentially growing cap between attempts, until it succeeds, max_attempts is reached or
+    the next attempt would start after the deadline (in seconds from the first attempt)
+    '''
+
+    def __init__(self, name, is_retryable, base_delay, max_delay, max_attempts=None, deadline=None):
+        self.name = name
+        self.is_retryable = is_retryable
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.deadline = deadline
+        self._lock = threading.Lock()
+        self.metrics = {'calls': 0, 'retries': 0, 'gave_up': 0, 'waited': 0.0}
+
+    def _record(self, metric, amount=1):
+        with self._lock:
+            self.metrics[metric] += amount
+
+    def delay(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def call(self, log, func, *args, **kwargs):
+        self._record('calls')
+        start = time.time()
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as exception: #pylint: disable=W0703
+                attempt += 1
+                if isinstance(exception, Aborted) or not self.is_retryable(exception):
+                    raise
+                delay = self.delay(attempt - 1)
+                out_of_attempts = self.max_attempts is not None and attempt >= self.max_attempts
+                out_of_time = self.deadline is not None and time.time() - start + delay > self.deadline
+                if out_of_attempts or out_of_time:
+                    self._record('gave_up')
+                    log.warning('%s: giving up after %s attempts in %.1fs: %s', self.name, attempt, time.time() - start, exception)
+                    raise
+                log.warning('%s: attempt %s failed, retrying in %.1fs: %s', self.name, attempt, delay, exception)
+                self._record('retries')
+                self._record('waited', delay)
+                time.sleep(delay)
+
+AWS_API = RetryPolicy('aws-api', is_retryable_aws_error, base_delay=1, max_delay=20, max_attempts=8, deadline=5 * 60)
+SSH_CONNECT = RetryPolicy('ssh-connect', is_any_error, base_delay=2, max_delay=30, deadline=10 * 60)
+SSH_COMMAND = RetryPolicy('ssh-command', is_connection_failure, base_delay=2, max_delay=20, max_attempts=3)
+SCP = RetryPolicy('scp', is_any_error, base_delay=2, max_delay=20, max_attempts=4)
+# attempts at bootstrapping each host, each resuming from the last phase that completed
+BOOTSTRAP = RetryPolicy('bootstrap', is_any_error, base_delay=10, max_delay=60, max_attempts=3)
+# for commands that must not run twice, such as salt runs, and for calls made
+# inside an operation that already has its own retry policy
+SINGLE_ATTEMPT = RetryPolicy('single-attempt', is_never_retryable, base_delay=0, max_delay=0, max_attempts=1)
+
+POLICIES = [AWS_API, SSH_CONNECT, SSH_COMMAND, SCP, BOOTSTRAP]
+
+def log_metrics(log):
+    for policy in POLICIES:
+        if policy.metrics['calls'] > 0:
+            log.info('Retry metrics for %s: %s calls, %s retries, %s gave up, %.1fs spent waiting',
+                     policy.name, policy.metrics['calls'], policy.metrics['retries'], policy.metrics['gave_up'], policy.metrics['waited'])
@@ -0,0 +1,187 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Bring the platform-salt tree on a running cluster's saltmaster up to date and work out
+            what has to be run again because of it. A local tree is synced by comparing checksums
+            of every file, so only changed files are sent. A git checkout is fetched and moved to
+            the branch. Files the saltmaster bootstrap generated are never touched. The changed
+            files decide whether pillar has to be refreshed, custom modules synced and
+            orchestrate run.
+
+"""
+
+import os
+import re
+import base64
+import hashlib
+
+import remote_script
+
+PLATFORM_SALT_DIR = '/srv/salt/platform-salt'
+MANIFEST_MARKER = 'PNDA_MANIFEST'
+CHANGED_MARKER = 'PNDA_CHANGED'
+# orchestration a cluster is created with, run again when the states it applies change
+ORCHESTRATE_SLS = 'salt/orchestrate/pnda.sls'
+
+# written into the tree by saltmaster-common.sh, so they differ from any source tree
+GENERATED = [re.compile(r'^pillar/env_parameters\.sls$'),
+             re.compile(r'^pillar/certs\.sls$'),
+             re.compile(r'^pillar/roles/[^/]+/[^/]+-key\.sls$')]
+
+# $1 is the platform-salt directory, prints the md5 of every file in it
+MANIFEST_SCRIPT = '''
+cd $1 2>/dev/null || exit 0
+sudo find . -type f -not -path './.git/*' -print0 | sudo xargs -0 -r md5sum | sed 's#^\\([0-9a-f]*\\)  \\./#%(marker)s \\1 #'
+'''
+
+# $1 is the platform-salt directory, $2 the tarball of changed files in /tmp, $3 the base64
+# encoded list of files to remove, one per line
+APPLY_SCRIPT = '''
+cd $1 || exit 1
+if [ -n "$2" ]; then
+    sudo tar zxf /tmp/$2 -C $1 || exit 1
+    rm -f /tmp/$2
+fi
+echo $3 | base64 -d | while read -r path; do
+    [ -n "$path" ] && sudo rm -f -- "$path"
+done
+exit 0
+'''
+
+# $1 is the platform-salt directory, $2 the branch. Prints the files that differ between the
+# checkout and the head of the branch, then checks the branch out.
+GIT_SCRIPT = '''
+cd $1 || exit 1
+sudo git fetch -q origin $2 || exit 1
+sudo git diff --name-only HEAD FETCH_HEAD | sed 's#^#%(marker)s #'
+sudo git checkout -q -B $2 FETCH_HEAD
+'''
+
+def is_generated(path):
+    return any(pattern.match(path) for pattern in GENERATED)
+
+def local_manifest(root):
+    '''
+    Relative path to md5 of every file in a local platform-salt tree, leaving out git metadata
+    and the files the saltmaster bootstrap generates
+    '''
+    manifest = {}
+    for directory, subdirs, files in os.walk(root):
+        if '.git' in subdirs:
+            subdirs.remove('.git')
+        for name in files:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            if is_generated(relative):
+                continue
+            with open(path, 'rb') as source:
+                manifest[relative] = hashlib.md5(source.read()).hexdigest()
+    return manifest
+
+def build_manifest_command():
+    return remote_script.encoded_script_command(MANIFEST_SCRIPT % {'marker': MANIFEST_MARKER}, [PLATFORM_SALT_DIR])
+
+def parse_manifest_output(lines):
+    manifest = {}
+    for line in lines:
+        parts = line.strip().split(' ', 2)
+        if len(parts) == 3 and parts[0] == MANIFEST_MARKER:
+            manifest[parts[2]] = parts[1]
+    return manifest
+
+def diff_manifests(local, remote):
+    '''
+    (files to send, files to remove) to make the remote tree match the local one. Generated
+    files on the remote side are left alone.
+    '''
+    send = sorted(path for path, digest in local.items() if remote.get(path) != digest)
+    remove = sorted(path for path in remote if path not in local and not is_generated(path))
+    return send, remove
+
+def make_tarball(root, paths, tarball_path):
+    # tarfile is slow to import, so it is loaded only when a tarball is made
+    import tarfile
+    with tarfile.open(tarball_path, mode='w:gz') as archive:
+        for path in paths:
+            archive.add(os.path.join(root, path), arcname=path, recursive=False)
+    return tarball_path
+
+def build_apply_command(tarball_name, remove):
+    removed = base64.b64encode(''.join(path + '\n' for path in remove))
+    return remote_script.encoded_script_command(APPLY_SCRIPT, [PLATFORM_SALT_DIR, tarball_name or '""', removed or '""'])
+
+def build_git_command(branch):
+    return remote_script.encoded_script_command(GIT_SCRIPT % {'marker': CHANGED_MARKER}, [PLATFORM_SALT_DIR, branch])
+
+def parse_changed_output(lines):
+    changed = []
+    for line in lines:
+        parts = line.strip().split(' ', 1)
+        if len(parts) == 2 and parts[0] == CHANGED_MARKER:
+            changed.append(parts[1])
+    return changed
+
+def changed_states(paths):
+    '''
+    Names of the top level state directories under salt/ with changed files, leaving out the
+    _<type> directories of custom modules
+    '''
+    return sorted(set(path.split('/')[1] for path in paths if path.startswith('salt/') and path.count('/') >= 2 and path[5] != '_'))
+
+def orchestrated_states(orchestrate_text):
+    '''
+    States an orchestrate sls applies, from its sls: arguments, whether single or listed
+    '''
+    states = set()
+    listing = False
+    for line in orchestrate_text.splitlines():
+        match = re.match(r'^\s*-?\s*sls:\s*([\w.-]*)\s*$', line)
+        if match:
+            if match.group(1):
+                states.add(match.group(1))
+            listing = not match.group(1)
+            continue
+        item = re.match(r'^\s*-\s*([\w.-]+)\s*$', line)
+        if listing and item:
+            states.add(item.group(1))
+        else:
+            listing = False
+    return states
+
+def needs_orchestrate(paths, states, orchestrate_text):
+    '''
+    Whether the changed files, or the states being applied, affect what orchestrate applies. Pillar
+    is used by every state, so a pillar change counts as affecting all of them.
+    '''
+    if any(path.startswith('salt/orchestrate/') or path.startswith('pillar/') for path in paths):
+        return True
+    orchestrated = set(state.split('.')[0] for state in orchestrated_states(orchestrate_text))
+    return any(state.split('.')[0] in orchestrated for state in list(states) + changed_states(paths))
+
+def needs_pillar_refresh(paths):
+    return any(path.startswith('pillar/') for path in paths)
+
+def needs_module_sync(paths):
+    # custom modules, grains, states and the like live in salt/_<type>
+    return any(path.startswith('salt/_') for path in paths)
+
+def target_args(roles, minions):
+    '''
+    Salt target for the roles grains and minion ids given, all minions if neither is
+    '''
+    terms = ['G@roles:%s' % role for role in roles] + (['L@%s' % ','.join(minions)] if minions else [])
+    if not terms:
+        return '"*"'
+    return '-C "%s"' % ' or '.join(terms)
@@ -0,0 +1,91 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Salt syndics between the saltmaster and the minions of very large clusters. Each syndic
+            runs a salt master that minions register with and passes on jobs from the saltmaster,
+            which becomes the master of masters, so the saltmaster only talks to the syndics and
+            the minions left with it. Minions are assigned to a syndic by node type, or by index
+            among the syndics that take any node type. A syndic serves files and pillar itself, so
+            it is given a copy of the saltmaster's platform-salt tree and master configuration.
+
+"""
+
+import zlib
+
+import remote_script
+
+# node type of instances that are only syndics, any existing machine can be one with is_syndic
+NODE_TYPE = 'salt-syndic'
+TREE_MARKER = 'PNDA_SALT_TREE'
+PLATFORM_SALT_DIR = 'srv/salt/platform-salt'
+
+# $1 is the name of the tarball to write in /tmp. Paths are relative to / so the tarball
+# unpacks to the same places on a syndic.
+PACK_SCRIPT = '''
+sudo tar czf /tmp/$1 -C / --exclude=%(salt_dir)s/.git %(salt_dir)s etc/salt/master etc/salt/master.d || exit 1
+sudo chown $(id -u) /tmp/$1
+echo "%(marker)s $(stat -c %%s /tmp/$1)"
+'''
+
+# $1 is the tarball in /tmp, of which only platform-salt is replaced
+APPLY_SCRIPT = '''
+sudo rm -rf /%(salt_dir)s
+sudo tar zxf /tmp/$1 -C / %(salt_dir)s || exit 1
+rm -f /tmp/$1
+'''
+
+def _index(host):
+    if host.node_idx.isdigit():
+        return int(host.node_idx)
+    return zlib.crc32(host.key) & 0xffffffff
+
+def assign(hosts, syndics):
+    '''
+    Syndic each of hosts registers with, by key. A host of a node type listed in the syndic_for
+    of any syndics goes to one of those, any other host to one of the syndics with no syndic_for,
+    picked by the host's index so that a host keeps its syndic when others are added. The
+    saltmaster, the syndics, bastions and hosts no syndic takes register with the saltmaster.
+    '''
+    syndics = sorted(syndics, key=lambda syndic: syndic.key)
+    general = [syndic for syndic in syndics if not syndic.syndic_for]
+    by_node_type = {}
+    for syndic in syndics:
+        for node_type in syndic.syndic_for:
+            by_node_type.setdefault(node_type, []).append(syndic)
+
+    assigned = {}
+    for host in hosts:
+        if host.is_saltmaster or host.is_syndic or host.is_bastion:
+            continue
+        candidates = by_node_type.get(host.node_type, general)
+        if candidates:
+            assigned[host.key] = candidates[_index(host) % len(candidates)]
+    return assigned
+
+def build_pack_command(tarball_name):
+    return remote_script.encoded_script_command(PACK_SCRIPT % {'salt_dir': PLATFORM_SALT_DIR, 'marker': TREE_MARKER}, [tarball_name])
+
+def parse_pack_output(lines):
+    '''
+    Size in bytes of the tarball the pack command wrote, or None if it did not report one
+    '''
+    for line in lines:
+        parts = line.strip().split()
+        if len(parts) == 2 and parts[0] == TREE_MARKER and parts[1].isdigit():
+            return int(parts[1])
+    return None
+
+def build_apply_command(tarball_name):
+    return remote_script.encoded_script_command(APPLY_SCRIPT % {'salt_dir': PLATFORM_SALT_DIR}, [tarball_name])
@@ -0,0 +1,101 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Saltmaster settings sized for the number of minions in a cluster. Salt's defaults suit
+            a handful of minions. With many more, the master runs out of worker threads while every
+            minion returns highstate results or runs the sync_all reactor at start, minions are
+            reported as not responding before they answer and the job cache grows with every job.
+            The settings are written to a file the saltmaster bootstrap puts in
+            /etc/salt/master.d, and the salt commands the CLI runs wait longer to match. With
+            salt syndics, the saltmaster is also made a master of masters.
+
+"""
+
+import remote_script
+
+# where saltmaster-common.sh puts the settings, salt-master reads master.d/*.conf after /etc/salt/master
+MASTER_CONF = '/etc/salt/master.d/pnda-tuning.conf'
+UPDATED_MARKER = 'PNDA_MASTER_UPDATED'
+
+# clusters of up to this many minions keep the timeout salt commands have always had
+SMALL_CLUSTER = 50
+# how long the CLI's salt commands wait for minions that have not returned yet, for a small cluster
+SALT_TIMEOUT_S = 120
+MAX_SALT_TIMEOUT_S = 600
+
+# $1 is the file of settings in /tmp. The master is restarted only if they changed.
+UPDATE_SCRIPT = '''
+if sudo cmp -s /tmp/$1 %(conf)s; then
+    rm -f /tmp/$1
+    exit 0
+fi
+sudo mkdir -p $(dirname %(conf)s)
+sudo mv /tmp/$1 %(conf)s
+sudo service salt-master restart
+# give minions time to reconnect before anything is run on them
+sleep 10
+echo %(marker)s
+'''
+
+def _bounded(value, lowest, highest):
+    return max(lowest, min(value, highest))
+
+def minion_count(node_types):
+    '''
+    Number of salt minions among hosts of node_types, every host with a node type runs one
+    '''
+    return len([node_type for node_type in node_types if node_type])
+
+def master_settings(minions, syndics=0):
+    '''
+    /etc/salt/master settings for a cluster of minions, some of which may register with syndics
+    '''
+    settings = {
+        # a worker thread serves one request at a time: a job return, a file or the sync_all
+        # reactor of a starting minion
+        'worker_threads': _bounded(5 + minions // 20, 5, 32),
+        # how long the master waits for a minion to say it is still running a job
+        'gather_job_timeout': _bounded(10 + minions // 10, 10, 120),
+        # the job cache holds a return for every minion of every job, so it is kept for less
+        # time the more minions there are
+        'keep_jobs': _bounded(2400 // max(1, minions), 6, 24),
+        'job_cache': True,
+        # every minion lists the file server for each state it runs during highstate
+        'fileserver_list_cache_time': _bounded(minions, 20, 300)
+    }
+    if syndics:
+        # jobs are passed on to the syndics, which need longer to gather the returns of their minions
+        settings['order_masters'] = True
+        settings['syndic_wait'] = _bounded(5 + minions // (50 * syndics), 5, 30)
+    return settings
+
+def salt_timeout(minions):
+    '''
+    --timeout for the salt commands the CLI runs on a cluster of minions
+    '''
+    return _bounded(SALT_TIMEOUT_S + 30 * (max(0, minions - SMALL_CLUSTER) // 25), SALT_TIMEOUT_S, MAX_SALT_TIMEOUT_S)
+
+def render_master_conf(minions, syndics=0):
+    lines = ['# Generated by pnda-cli.py for a cluster of %s minions and %s syndics' % (minions, syndics)]
+    for setting, value in sorted(master_settings(minions, syndics).items()):
+        lines.append('%s: %s' % (setting, value))
+    return '\n'.join(lines) + '\n'
+
+def build_update_command(conf_file_name):
+    script = UPDATE_SCRIPT % {'conf': MASTER_CONF, 'marker': UPDATED_MARKER}
+    return remote_script.encoded_script_command(script, [conf_file_name])
+
+def was_updated(lines):
+    return any(line.strip() == UPDATED_MARKER for line in lines)
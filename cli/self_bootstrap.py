@@ -0,0 +1,144 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Self bootstrapping AWS instances. Each instance's UserData downloads a bundle of
+            bootstrap scripts, runs the script for its node type at boot and signals a
+            Cloud Formation wait condition, so the stack only completes once every instance
+            is bootstrapped and the CLI does not have to bootstrap hosts over ssh.
+
+"""
+
+import os
+import tarfile
+import StringIO
+
+BUNDLE_URL_PARAMETER = 'bootstrapBundleUrl'
+WAIT_COUNT_PARAMETER = 'bootstrapWaitCount'
+WAIT_HANDLE = 'bootstrapWaitHandle'
+WAIT_CONDITION = 'bootstrapWaitCondition'
+WAIT_TIMEOUT_S = 3600
+LOG_FILE = '/var/log/pnda-self-bootstrap.log'
+
+# Appended to the UserData of every instance, passed through Fn::Sub so ${...} refers to template
+# parameters and resources while plain $VAR is left for bash. Kept to one line as it is repeated
+# for every instance in a template that has to stay within the Cloud Formation size limit.
+USERDATA_STUB = ("curl -sf --retry 20 '${%(bundle_url)s}' | tar xz -C /tmp && "
+                 "bash /tmp/%(wrapper)s %(node_type)s '%(node_idx)s' %(saltmaster_ip)s '${%(wait_handle)s}' %(resource)s || "
+                 "curl -s -X PUT -H 'Content-Type:' --data-binary "
+                 "'{\"Status\":\"FAILURE\",\"Reason\":\"bundle download failed\",\"UniqueId\":\"%(resource)s\",\"Data\":\"\"}' "
+                 "'${%(wait_handle)s}'")
+
+WRAPPER = 'self-bootstrap.sh'
+
+# In the bundle: runs the script for a node type and signals the wait condition with the outcome.
+# $1 node type, $2 node index, $3 saltmaster IP, $4 wait condition handle URL, $5 unique id
+WRAPPER_SCRIPT = '''#!/bin/bash
+if bash /tmp/self-bootstrap-$1.sh $3 $2 >> %(log_file)s 2>&1; then status=SUCCESS; else status=FAILURE; fi
+curl -s --retry 10 -X PUT -H 'Content-Type:' --data-binary \\
+  "{\\"Status\\": \\"$status\\", \\"Reason\\": \\"$5 bootstrap $status, see %(log_file)s\\", \\"UniqueId\\": \\"$5\\", \\"Data\\": \\"$status\\"}" "$4"
+''' % {'log_file': LOG_FILE}
+
+OWN_IP = '$(curl -s http://169.254.169.254/latest/meta-data/local-ipv4)'
+
+def node_script_name(node_type):
+    return 'self-bootstrap-%s.sh' % node_type
+
+def _tags(resource):
+    return dict((tag['Key'], tag['Value']) for tag in resource['Properties'].get('Tags', []))
+
+def instance_resources(template_data):
+    '''
+    (resource name, node type, node index) for every instance with a node type in the template
+    '''
+    instances = []
+    for name, resource in sorted(template_data['Resources'].items()):
+        if resource['Type'] == 'AWS::EC2::Instance':
+            tags = _tags(resource)
+            if tags.get('node_type'):
+                instances.append((name, tags['node_type'], tags.get('node_idx', '')))
+    return instances
+
+def add_to_template(template_data, saltmaster_type):
+    '''
+    Add the bootstrap stub to the UserData of every instance, and a wait condition the stack
+    waits on for their signals. The bundle URL and the number of signals are template
+    parameters, so an expand can keep the values used at create time and leave the UserData
+    of existing instances unchanged.
+    '''
+    instances = instance_resources(template_data)
+    saltmaster_resources = [name for name, node_type, _ in instances if node_type == saltmaster_type]
+    if len(saltmaster_resources) != 1:
+        raise ValueError('Expected one %s instance to act as saltmaster, found %s' % (saltmaster_type, len(saltmaster_resources)))
+
+    template_data['Parameters'][BUNDLE_URL_PARAMETER] = {
+        'Type': 'String',
+        'NoEcho': 'true',
+        'Description': 'Pre-signed URL of the bootstrap bundle instances download at boot'
+    }
+    template_data['Parameters'][WAIT_COUNT_PARAMETER] = {
+        'Type': 'Number',
+        'Description': 'Number of instances bootstrapped at stack creation'
+    }
+    template_data['Resources'][WAIT_HANDLE] = {'Type': 'AWS::CloudFormation::WaitConditionHandle'}
+    template_data['Resources'][WAIT_CONDITION] = {
+        'Type': 'AWS::CloudFormation::WaitCondition',
+        'Properties': {
+            'Handle': {'Ref': WAIT_HANDLE},
+            'Timeout': str(WAIT_TIMEOUT_S),
+            'Count': {'Ref': WAIT_COUNT_PARAMETER}
+        }
+    }
+
+    for name, node_type, node_idx in instances:
+        saltmaster_ip = OWN_IP if name == saltmaster_resources[0] else '${%s.PrivateIp}' % saltmaster_resources[0]
+        stub = {'Fn::Sub': USERDATA_STUB % {'bundle_url': BUNDLE_URL_PARAMETER, 'wait_handle': WAIT_HANDLE, 'wrapper': WRAPPER,
+                                            'node_type': node_type, 'node_idx': node_idx, 'saltmaster_ip': saltmaster_ip, 'resource': name}}
+        properties = template_data['Resources'][name]['Properties']
+        if 'UserData' in properties:
+            properties['UserData']['Fn::Base64']['Fn::Join'][1].append(stub)
+        else:
+            properties['UserData'] = {'Fn::Base64': {'Fn::Join': ['\n', ['#!/bin/bash', stub]]}}
+
+    return len(instances)
+
+def is_self_bootstrap_template(template_data):
+    return WAIT_CONDITION in template_data['Resources']
+
+def write_bundle(bundle_path, files, node_scripts):
+    '''
+    Write the bundle instances download: every file they need, flattened into one directory
+    as they would be in /tmp after an scp, a script per node type and the wrapper that runs it
+    '''
+    with tarfile.open(bundle_path, 'w:gz') as bundle:
+        added = set()
+        for bundle_file in files:
+            arcname = os.path.basename(bundle_file)
+            if arcname not in added:
+                bundle.add(bundle_file, arcname=arcname)
+                added.add(arcname)
+        scripts = [(node_script_name(node_type), script) for node_type, script in sorted(node_scripts.items())]
+        for name, script in scripts + [(WRAPPER, WRAPPER_SCRIPT)]:
+            info = tarfile.TarInfo(name=name)
+            info.size = len(script)
+            info.mode = 0o755
+            bundle.addfile(tarinfo=info, fileobj=StringIO.StringIO(script))
+
+def node_script(os_user, cmds):
+    '''
+    Script that bootstraps one node type, from the commands that would have been run over ssh.
+    It is called with the saltmaster IP and the node index as arguments.
+    '''
+    return '\n'.join(['#!/bin/bash', 'cd ~%s' % os_user] + cmds +
+                     ['touch ~%s/.bootstrap_complete' % os_user, 'chown %s ~%s/.bootstrap_complete' % (os_user, os_user)]) + '\n'
@@ -0,0 +1,87 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Watch the instances of a Cloud Formation stack while it is being created, so that
+            each can be bootstrapped as soon as it is running instead of once every resource
+            of the stack, including ones no host waits on, is complete.
+
+"""
+
+import time
+
+import retry_policy
+
+INSTANCE_RESOURCE = 'AWS::EC2::Instance'
+CREATING = ['CREATE_IN_PROGRESS', 'CREATING']
+# EC2 is eventually consistent, an instance Cloud Formation has just created may not be described yet
+INSTANCE_NOT_FOUND = 'InvalidInstanceID.NotFound'
+
+def instance_ids(log, cfn, stack_name):
+    '''
+    Physical ids of the instance resources of a stack that have one and have not failed
+    '''
+    ids = []
+    next_token = None
+    while True:
+        page = retry_policy.AWS_API.call(log, cfn.list_stack_resources, stack_name, next_token)
+        for resource in page:
+            if resource.resource_type == INSTANCE_RESOURCE and resource.physical_resource_id and \
+               resource.resource_status != 'CREATE_FAILED':
+                ids.append(resource.physical_resource_id)
+        next_token = page.next_token
+        if next_token is None:
+            return ids
+
+def running_instances(log, ec2, ids):
+    '''
+    Those of the instances with ids that are running, have an address and are tagged
+    '''
+    running = []
+    try:
+        reservations = retry_policy.AWS_API.call(log, ec2.get_all_reservations, instance_ids=ids)
+    except Exception as exception: #pylint: disable=W0703
+        if getattr(exception, 'error_code', None) != INSTANCE_NOT_FOUND:
+            raise
+        log.debug('Some of %s are not known to EC2 yet: %s', ids, exception)
+        return running
+    for reservation in reservations:
+        for instance in reservation.instances:
+            if instance.state == 'running' and instance.private_ip_address and 'node_type' in instance.tags:
+                running.append(instance)
+    return running
+
+def watch(ctx, cfn, ec2, on_running, poll_s=5, check=None):
+    '''
+    Poll a stack being created until it is no longer in progress or the operation is aborted,
+    calling on_running once for each of its instances, with the boto instance, as soon as it is
+    running, and check, if given, on every poll so that it can stop the watch by raising.
+    Returns the last status of the stack.
+    '''
+    seen = set()
+    while True:
+        # read the status before the resources, so when it is complete no instance is missed
+        stacks = retry_policy.AWS_API.call(ctx.log, cfn.describe_stacks, ctx.name)
+        stack_status = stacks[0].stack_status if len(stacks) > 0 else 'CREATING'
+        new_ids = [instance_id for instance_id in instance_ids(ctx.log, cfn, ctx.name) if instance_id not in seen]
+        if new_ids:
+            for instance in running_instances(ctx.log, ec2, new_ids):
+                seen.add(instance.id)
+                on_running(instance)
+        if stack_status not in CREATING or ctx.aborted.is_set():
+            return stack_status
+        ctx.console.info('Stack is: %s, %s instances running', stack_status, len(seen))
+        if check is not None:
+            check()
+        time.sleep(poll_s)
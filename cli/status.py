@@ -0,0 +1,60 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    The status command, which reports on the last operation on a cluster without
+            changing anything
+
+"""
+
+import os
+import time
+
+import remote_job
+import expand_waves
+
+from cloud_formation import get_stack_status
+from remote_ops import ssh_output
+
+def status(ctx):
+    '''
+    Report on the last operation on a cluster from its run journal, the state of its Cloud
+    Formation stack and of any detached salt job, without changing anything
+    '''
+    journal = ctx.latest_runfile()
+    if journal is None:
+        ctx.console.info('No operations recorded for %s', ctx.name)
+        return
+
+    ctx.console.info('Last operation: %s', journal.get('command', 'create'))
+    ctx.console.info('Phase: %s', journal.get('phase', 'unknown'))
+    for phase, started in journal.get('phases', []):
+        ctx.console.info('  %s started at %s', phase, time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(started)))
+    for index, wave in enumerate(journal.get(expand_waves.JOURNAL_KEY, [])):
+        ctx.console.info('Wave %s: %s hosts, %s', index + 1, len(wave['hosts']), wave['state'])
+
+    if not journal.get('existing_machines', False):
+        ctx.console.info('Stack: %s', get_stack_status(ctx))
+
+    if 'salt_job' in journal:
+        if not os.path.isfile(ctx.ssh_config):
+            ctx.console.info('Salt job %s: no ssh config for %s to query it with', journal['salt_job'], ctx.name)
+            return
+        output = ssh_output([remote_job.build_status_command(journal['salt_job'])], ctx, journal['saltmaster_ip'])
+        state, exit_code, tail = remote_job.parse_status_output(output)
+        if exit_code is not None:
+            state = '%s (exit code %s)' % (state, exit_code)
+        ctx.console.info('Salt job %s: %s', journal['salt_job'], state)
+        for line in tail:
+            ctx.console.info('  %s', line)
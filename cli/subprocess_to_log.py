@@ -4,30 +4,43 @@ import re
 from logging import INFO
 
 
-def call(cmd_to_run, logger, log_id=None, stdout_log_level=INFO, stderr_log_level=INFO, scan_for_errors=None, **kwargs):
+def call(cmd_to_run, logger, log_id=None, stdout_log_level=INFO, stderr_log_level=INFO, scan_for_errors=None, stdout_handler=None, stream='remote',
+         cancel=None, **kwargs):
     if scan_for_errors is None:
         scan_for_errors = []
 
     child_process = subprocess.Popen(cmd_to_run, stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
 
     log_level = {child_process.stdout: stdout_log_level, child_process.stderr: stderr_log_level}
-
-    def fetch_child_output():
-        child_output_streams = select.select([child_process.stdout, child_process.stderr], [], [], 1000)[0]
+    # lets the log pipeline route output to per host logs and filter it by stream
+    extra = {'host': log_id, 'stream': stream}
+
+    def handle_line(child_output_stream, line):
+        msg = line[:-1] if line.endswith('\n') else line
+        msg = msg.decode('utf-8')
+        msg_with_id = msg
+        if log_id is not None:
+            msg_with_id = '%s %s' % (log_id, msg)
+        logger.log(log_level[child_output_stream], msg_with_id, extra=extra)
+        if stdout_handler is not None and child_output_stream is child_process.stdout:
+            stdout_handler(msg)
+        for pattern in scan_for_errors:
+            if re.match(pattern, msg):
+                raise Exception(msg_with_id)
+
+    # read until both streams are closed, so that output written just before the
+    # child exits is not lost. The child is terminated if the cancel event is set.
+    open_streams = [child_process.stdout, child_process.stderr]
+    while open_streams:
+        if cancel is not None and cancel.is_set() and child_process.poll() is None:
+            logger.info('%s cancelled, terminating %s', log_id, cmd_to_run[0], extra=extra)
+            child_process.terminate()
+        child_output_streams = select.select(open_streams, [], [], 1000 if cancel is None else 1)[0]
         for child_output_stream in child_output_streams:
             line = child_output_stream.readline()
-            msg = line[:-1]
-            msg = msg.decode('utf-8')
-            if log_id is not None:
-                msg_with_id = '%s %s' % (log_id, msg)
-            logger.log(log_level[child_output_stream], msg_with_id)
-            for pattern in scan_for_errors:
-                if re.match(pattern, msg):
-                    raise Exception(msg_with_id)
-
-    while child_process.poll() is None:
-        fetch_child_output()
-
-    fetch_child_output()
+            if line:
+                handle_line(child_output_stream, line)
+            else:
+                open_streams.remove(child_output_stream)
 
     return child_process.wait()
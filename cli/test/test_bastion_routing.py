@@ -0,0 +1,58 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for the assignment of hosts to bastions
+
+"""
+
+import unittest
+
+from bastion_routing import BastionRing
+
+HOSTS = ['10.0.%d.%d' % (subnet, index) for subnet in range(4) for index in range(50)]
+
+class BastionRingTest(unittest.TestCase):
+
+    def test_no_bastions(self):
+        self.assertIsNone(BastionRing().bastion_for('10.0.0.1'))
+
+    def test_stable_across_rings(self):
+        first = BastionRing(['b1', 'b2', 'b3'])
+        second = BastionRing(['b3', 'b1', 'b2'])
+        for host in HOSTS:
+            self.assertEqual(first.bastion_for(host), second.bastion_for(host))
+
+    def test_every_bastion_used(self):
+        by_bastion = BastionRing(['b1', 'b2', 'b3']).hosts_by_bastion(HOSTS)
+        self.assertEqual(sorted(by_bastion), ['b1', 'b2', 'b3'])
+
+    def test_adding_moves_hosts_to_it(self):
+        ring = BastionRing(['b1', 'b2'])
+        before = dict((host, ring.bastion_for(host)) for host in HOSTS)
+        ring.set_bastions(['b1', 'b2', 'b3'])
+        moved = [host for host in HOSTS if ring.bastion_for(host) != before[host]]
+        self.assertTrue(moved)
+        self.assertTrue(all(ring.bastion_for(host) == 'b3' for host in moved))
+
+    def test_removing_moves_its_hosts(self):
+        ring = BastionRing(['b1', 'b2', 'b3'])
+        before = dict((host, ring.bastion_for(host)) for host in HOSTS)
+        ring.set_bastions(['b1', 'b2'])
+        for host in HOSTS:
+            if before[host] != 'b3':
+                self.assertEqual(ring.bastion_for(host), before[host])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for resuming bootstraps from the phase that failed
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import bootstrap_phases
+
+THROW_BASH_ERROR = "cmd_result=${PIPESTATUS[0]} && if [ ${cmd_result} != '0' ]; then exit ${cmd_result}; fi"
+
+def phase_command(script):
+    return '(sudo -E /tmp/%s.sh 2>&1) | tee -a pnda-bootstrap.log; %s' % (script, THROW_BASH_ERROR)
+
+class PhasesTest(unittest.TestCase):
+
+    def test_phases_in_order(self):
+        cmds = ['export PNDA_CLUSTER=test', phase_command('base'), 'sudo chmod a+x /tmp/kafka.sh', phase_command('kafka')]
+        self.assertEqual(bootstrap_phases.phases(cmds), ['base', 'kafka'])
+
+    def test_other_commands_kept(self):
+        wrapped = bootstrap_phases.resumable(['export PNDA_CLUSTER=test', phase_command('base')], '~/markers')
+        self.assertEqual(wrapped[:2], ['mkdir -p ~/markers', 'export PNDA_CLUSTER=test'])
+        self.assertIn('~/markers/base', wrapped[2])
+
+class ResumeTest(unittest.TestCase):
+    '''
+    Runs wrapped bootstrap commands with bash the way ssh runs them, with sudo standing in for
+    running the scripts from a temporary directory
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write_script('base', 'echo base >> %s/runs' % self.directory)
+        # fails the first time it runs
+        self.write_script('kafka', 'echo kafka >> {0}/runs; [ -e {0}/failed ] || {{ touch {0}/failed; exit 1; }}'.format(self.directory))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_script(self, name, content):
+        with open(os.path.join(self.directory, '%s.sh' % name), 'w') as script:
+            script.write(content + '\n')
+
+    def attempt(self):
+        markers = os.path.join(self.directory, 'markers')
+        cmds = ['sudo() { bash %s/$(basename $2); }' % self.directory]
+        cmds += bootstrap_phases.resumable([phase_command('base'), phase_command('kafka')], markers)
+        process = subprocess.Popen(['bash', '-c', ';'.join(cmds)], cwd=self.directory, stdout=subprocess.PIPE)
+        process.communicate()
+        return process.returncode
+
+    def runs(self):
+        with open(os.path.join(self.directory, 'runs')) as runs:
+            return runs.read().split()
+
+    def test_resumes_from_failed_phase(self):
+        self.assertNotEqual(self.attempt(), 0)
+        self.assertEqual(self.runs(), ['base', 'kafka'])
+        self.assertEqual(self.attempt(), 0)
+        self.assertEqual(self.runs(), ['base', 'kafka', 'kafka'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'markers'))), ['base', 'kafka'])
+        # a completed bootstrap runs nothing again
+        self.assertEqual(self.attempt(), 0)
+        self.assertEqual(self.runs(), ['base', 'kafka', 'kafka'])
+
+if __name__ == '__main__':
+    unittest.main()
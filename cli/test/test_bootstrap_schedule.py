@@ -0,0 +1,63 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for the order hosts are bootstrapped in and the predicted makespan
+
+"""
+
+import unittest
+
+import bootstrap_schedule
+
+from inventory import Host
+
+def host(name, node_type):
+    return Host(name, name, node_type, None, '10.0.0.1')
+
+class OrderTest(unittest.TestCase):
+
+    def test_critical_then_longest(self):
+        hosts = [host('dn-1', 'hadoop-dn'), host('kafka', 'kafka'), host('dn-0', 'hadoop-dn'), host('edge', 'hadoop-edge'),
+                 host('saltmaster', 'saltmaster')]
+        expected = {'hadoop-dn': 100.0, 'kafka': 200.0, 'hadoop-edge': 50.0, 'saltmaster': 10.0}
+        ordered = bootstrap_schedule.order(hosts, expected)
+        self.assertEqual([instance.name for instance in ordered], ['edge', 'saltmaster', 'kafka', 'dn-0', 'dn-1'])
+
+    def test_unknown_types_take_median(self):
+        history = {'a': {'mean_s': 10.0, 'samples': 1}, 'b': {'mean_s': 30.0, 'samples': 1}, 'c': {'mean_s': 20.0, 'samples': 2}}
+        self.assertEqual(bootstrap_schedule.expected_durations(history, ['a', 'new']), {'a': 10.0, 'new': 20.0})
+        self.assertEqual(bootstrap_schedule.expected_durations({}, ['new']), {'new': bootstrap_schedule.DEFAULT_DURATION_S})
+
+class PredictedMakespanTest(unittest.TestCase):
+
+    def test_no_operations(self):
+        self.assertEqual(bootstrap_schedule.predicted_makespan([], 4), 0.0)
+
+    def test_slots(self):
+        self.assertEqual(bootstrap_schedule.predicted_makespan([3, 3, 3], 2), 6.0)
+        self.assertEqual(bootstrap_schedule.predicted_makespan([3, 3, 3], 3), 3.0)
+        # the long operation started last finishes last
+        self.assertEqual(bootstrap_schedule.predicted_makespan([1, 1, 5], 2), 6.0)
+        self.assertEqual(bootstrap_schedule.predicted_makespan([5, 1, 1], 2), 5.0)
+
+    def test_stagger(self):
+        self.assertEqual(bootstrap_schedule.predicted_makespan([1, 1], 2, stagger_s=5), 6.0)
+        self.assertEqual(bootstrap_schedule.predicted_makespan([10, 10], 2, stagger_s=1), 11.0)
+
+    def test_no_slots_counts_as_one(self):
+        self.assertEqual(bootstrap_schedule.predicted_makespan([2, 2], 0), 4.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for the shared read only configuration and its disk cache
+
+"""
+
+# the tests stand in for the YAML parser and read the cache the way a new process would
+# pylint: disable=protected-access
+
+import os
+import stat
+import shutil
+import tempfile
+import unittest
+
+import config_cache
+
+class FreezeTest(unittest.TestCase):
+
+    def test_read_only(self):
+        frozen = config_cache.freeze({'a': {'b': 1}})
+        for modify in [lambda: frozen.__setitem__('a', 2), lambda: frozen.update(a=2), lambda: frozen.pop('a'),
+                       lambda: frozen['a'].setdefault('c', 3), frozen.clear]:
+            self.assertRaises(TypeError, modify)
+        self.assertEqual(frozen, {'a': {'b': 1}})
+
+    def test_nested(self):
+        frozen = config_cache.freeze({'hosts': [{'name': 'a'}], 'count': 1})
+        self.assertIsInstance(frozen, config_cache.FrozenDict)
+        self.assertIsInstance(frozen['hosts'], tuple)
+        self.assertIsInstance(frozen['hosts'][0], config_cache.FrozenDict)
+        self.assertEqual(frozen['count'], 1)
+
+class LoadYamlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = config_cache.CACHE_DIR
+        self.parse_yaml = config_cache._parse_yaml
+        config_cache.CACHE_DIR = os.path.join(self.directory, 'cache')
+        self.path = os.path.join(self.directory, 'config.yaml')
+        self.write('cli:\n  MAX_SIMULTANEOUS_OUTBOUND_CONNECTIONS: 10\n')
+        self.parsed = []
+
+    def tearDown(self):
+        config_cache.CACHE_DIR = self.cache_dir
+        config_cache._parse_yaml = self.parse_yaml
+        config_cache._PARSED.clear()
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        with open(self.path, 'w') as config_file:
+            config_file.write(content)
+
+    def load(self):
+        # a new process only has what is cached on disk
+        config_cache._PARSED.clear()
+        return config_cache.load_yaml(self.path)
+
+    def count_parses(self):
+        def parse(content):
+            self.parsed.append(content)
+            return self.parse_yaml(content)
+        config_cache._parse_yaml = parse
+
+    def test_parsed_once_per_process(self):
+        first = config_cache.load_yaml(self.path)
+        self.assertIs(config_cache.load_yaml(self.path), first)
+        self.assertEqual(first, {'cli': {'MAX_SIMULTANEOUS_OUTBOUND_CONNECTIONS': 10}})
+        self.assertRaises(TypeError, lambda: first.__setitem__('cli', None))
+
+    def test_disk_cache(self):
+        self.load()
+        cache_file = config_cache._cache_file(os.path.abspath(self.path))
+        self.assertEqual(stat.S_IMODE(os.stat(cache_file).st_mode), 0o600)
+        self.count_parses()
+        self.assertEqual(self.load(), {'cli': {'MAX_SIMULTANEOUS_OUTBOUND_CONNECTIONS': 10}})
+        self.assertEqual(self.parsed, [])
+        self.write('cli:\n  MAX_SIMULTANEOUS_OUTBOUND_CONNECTIONS: 200\n')
+        self.assertEqual(self.load(), {'cli': {'MAX_SIMULTANEOUS_OUTBOUND_CONNECTIONS': 200}})
+        self.assertEqual(len(self.parsed), 1)
+
+    def test_writable_cache_ignored(self):
+        self.load()
+        os.chmod(config_cache._cache_file(os.path.abspath(self.path)), 0o666)
+        self.count_parses()
+        self.load()
+        self.assertEqual(len(self.parsed), 1)
+
+    def test_no_json_form_not_cached(self):
+        self.write('1: one\n')
+        self.assertEqual(self.load(), {1: 'one'})
+        self.assertFalse(os.path.exists(config_cache._cache_file(os.path.abspath(self.path))))
+
+if __name__ == '__main__':
+    unittest.main()
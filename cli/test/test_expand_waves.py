@@ -0,0 +1,88 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for the waves expand adds hosts in
+
+"""
+
+import unittest
+
+import expand_waves
+
+from inventory import Host
+
+def host(key, node_type='kafka'):
+    return Host(key, key, node_type, None, '10.0.0.1')
+
+class SaltBatchTest(unittest.TestCase):
+
+    def test_sizes(self):
+        self.assertEqual(expand_waves.salt_batch(0), 1)
+        self.assertEqual(expand_waves.salt_batch(1), 1)
+        self.assertEqual(expand_waves.salt_batch(5), 5)
+        # two even batches rather than one of 5 and one of 1
+        self.assertEqual(expand_waves.salt_batch(6), 3)
+        self.assertEqual(expand_waves.salt_batch(10), 5)
+        self.assertEqual(expand_waves.salt_batch(11), 4)
+
+class PlanTest(unittest.TestCase):
+
+    def test_plan(self):
+        hosts = [host(key) for key in 'abcde']
+        self.assertEqual(expand_waves.plan([], 2), [])
+        self.assertEqual([[h.key for h in wave] for wave in expand_waves.plan(hosts, 2)], [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual([[h.key for h in wave] for wave in expand_waves.plan(hosts, 0)], [['a', 'b', 'c', 'd', 'e']])
+
+    def test_unfinished(self):
+        journal = {expand_waves.JOURNAL_KEY: [{'hosts': ['a'], 'state': expand_waves.COMPLETE},
+                                              {'hosts': ['b'], 'state': expand_waves.DETACHED},
+                                              {'hosts': ['c'], 'state': expand_waves.FAILED},
+                                              {'hosts': ['d', 'e'], 'state': expand_waves.BOOTSTRAPPED}]}
+        self.assertEqual(expand_waves.unfinished(journal), [['c'], ['d', 'e']])
+        self.assertEqual(expand_waves.unfinished(None), [])
+
+class ResumePlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = dict((key, host(key)) for key in 'abcdefg')
+
+    def keys(self, waves):
+        return [[h.key for h in wave] for wave in waves]
+
+    def test_unfinished_waves_first(self):
+        # c was bootstrapped by the interrupted expand, so is no longer one of the new hosts
+        hosts = [self.cluster[key] for key in 'abdefg']
+        waves = expand_waves.resume_plan(self.cluster, hosts, [['a', 'b', 'c']], 2)
+        self.assertEqual(self.keys(waves), [['a', 'b', 'c'], ['d', 'e'], ['f', 'g']])
+
+    def test_hosts_gone_dropped(self):
+        waves = expand_waves.resume_plan(self.cluster, [self.cluster['d']], [['x', 'a'], ['y']], 2)
+        self.assertEqual(self.keys(waves), [['a'], ['d']])
+
+    def test_host_planned_once(self):
+        hosts = [self.cluster[key] for key in 'abc']
+        waves = expand_waves.resume_plan(self.cluster, hosts, [['a', 'b'], ['b', 'c']], 5)
+        self.assertEqual(self.keys(waves), [['a', 'b'], ['c']])
+
+    def test_nothing_to_resume(self):
+        hosts = [self.cluster[key] for key in 'abc']
+        self.assertEqual(self.keys(expand_waves.resume_plan(self.cluster, hosts, [], 2)), [['a', 'b'], ['c']])
+
+    def test_needs_orchestrate(self):
+        self.assertTrue(expand_waves.needs_orchestrate([host('a'), host('b', 'hadoop-dn')]))
+        self.assertFalse(expand_waves.needs_orchestrate([host('a')]))
+
+if __name__ == '__main__':
+    unittest.main()
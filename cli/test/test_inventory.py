@@ -0,0 +1,95 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for loading and indexing the hosts of a cluster
+
+"""
+
+import unittest
+
+import inventory
+
+from inventory import Host, Inventory
+from bastion_routing import BastionRing
+
+class Instance(object):
+    def __init__(self, name, node_type, node_idx, private_ip_address, ip_address=None):
+        self.tags = {'Name': name, 'node_type': node_type, 'node_idx': node_idx}
+        self.private_ip_address = private_ip_address
+        self.ip_address = ip_address
+        self.id = 'i-%s' % name # pylint: disable=invalid-name
+
+def cluster_hosts():
+    return [Host('test-dn-0', 'test-dn-0', 'hadoop-dn', 0, '10.0.0.3'),
+            Host('test-dn-1', 'test-dn-1', 'hadoop-dn', 1, '10.0.0.4'),
+            Host('test-saltmaster', 'test-saltmaster', 'saltmaster', None, '10.0.0.2'),
+            Host('test-bastion', 'test-bastion', 'bastion', None, '10.0.0.1', '203.0.113.1', is_bastion=True),
+            Host('test-untyped', 'test-untyped', None, None, '10.0.0.5')]
+
+class HostTest(unittest.TestCase):
+
+    def test_from_ec2(self):
+        host = inventory.from_ec2(Instance('test-saltmaster', 'saltmaster', '', '10.0.0.2'), 'test-saltmaster')
+        self.assertEqual((host.key, host.node_type, host.node_idx, host.instance_id), ('test-saltmaster', 'saltmaster', '', 'i-test-saltmaster'))
+        self.assertTrue(host.is_saltmaster)
+        self.assertFalse(host.is_bastion)
+        self.assertTrue(inventory.from_ec2(Instance('test-bastion', 'bastion', '', '10.0.0.1', '203.0.113.1')).is_bastion)
+
+    def test_from_existing_machine(self):
+        host = inventory.from_existing_machine('test-kafka-2', 'kafka-2', {'ip_address': '10.0.0.7', 'node_type': 'kafka'})
+        self.assertEqual((host.name, host.node_idx, host.ip_address), ('10.0.0.7', '2', None))
+        bastion = inventory.from_existing_machine('test-bastion', 'bastion', {'ip_address': '10.0.0.1', 'node_type': 'bastion',
+                                                                              'public_ip_address': '203.0.113.1', 'is_bastion': True})
+        self.assertEqual((bastion.node_idx, bastion.ip_address, bastion.is_bastion), ('', '203.0.113.1', True))
+
+class InventoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cluster = Inventory(cluster_hosts(), saltmaster_key='test-saltmaster')
+
+    def test_indexes(self):
+        self.assertEqual(len(self.cluster), 5)
+        self.assertIn('test-dn-1', self.cluster)
+        self.assertEqual(self.cluster['test-dn-1'].private_ip_address, '10.0.0.4')
+        self.assertIsNone(self.cluster.get('test-missing'))
+        self.assertEqual([host.key for host in self.cluster.of_type('hadoop-dn')], ['test-dn-0', 'test-dn-1'])
+        self.assertEqual(self.cluster.node_types(), ['bastion', 'hadoop-dn', 'saltmaster'])
+        self.assertEqual(self.cluster.saltmaster.key, 'test-saltmaster')
+        self.assertEqual(self.cluster.bastion_ips(), ['203.0.113.1'])
+        self.assertNotIn('test-untyped', [host.key for host in self.cluster.typed])
+
+    def test_saltmaster_by_flag(self):
+        hosts = cluster_hosts() + [Host('10.0.0.9', '10.0.0.9', 'saltmaster', None, '10.0.0.9', is_saltmaster=True)]
+        self.assertEqual(Inventory(hosts[3:]).saltmaster.key, '10.0.0.9')
+
+    def test_bootstrap_state(self):
+        self.assertEqual(len(self.cluster.unbootstrapped()), 4)
+        self.assertEqual(self.cluster.counts(live_only=True), {})
+        self.cluster.mark_bootstrapped(['test-dn-0', 'test-saltmaster'])
+        self.assertEqual([host.key for host in self.cluster.bootstrapped()], ['test-dn-0', 'test-saltmaster'])
+        self.assertEqual([host.key for host in self.cluster.unbootstrapped()], ['test-bastion', 'test-dn-1'])
+        self.assertEqual(self.cluster.counts(live_only=True), {'hadoop-dn': 1, 'saltmaster': 1})
+        self.assertEqual(self.cluster.counts(), {'bastion': 1, 'hadoop-dn': 2, 'saltmaster': 1})
+
+    def test_routes_follow_bastions(self):
+        ring = BastionRing(['203.0.113.1'])
+        self.assertEqual(self.cluster.hosts_by_bastion(ring), {'203.0.113.1': self.cluster.private_ips()})
+        ring.set_bastions(['203.0.113.1', '203.0.113.2'])
+        routes = self.cluster.hosts_by_bastion(ring)
+        self.assertEqual(sorted(sum(routes.values(), [])), sorted(self.cluster.private_ips()))
+        self.assertEqual(routes, ring.hosts_by_bastion(self.cluster.private_ips()))
+
+if __name__ == '__main__':
+    unittest.main()
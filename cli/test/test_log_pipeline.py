@@ -0,0 +1,109 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for the queued debug log writer
+
+"""
+
+# the tests check how many log files the writer holds open
+# pylint: disable=protected-access
+
+import os
+import gzip
+import shutil
+import logging
+import tempfile
+import unittest
+
+import log_pipeline
+
+class ParseLevelsTest(unittest.TestCase):
+
+    def test_levels(self):
+        self.assertEqual(log_pipeline.parse_levels(['salt=warning', 'remote=DEBUG']),
+                         {'salt': logging.WARNING, 'remote': logging.DEBUG})
+        self.assertEqual(log_pipeline.parse_levels(None), {})
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, log_pipeline.parse_levels, ['network=INFO'])
+        self.assertRaises(ValueError, log_pipeline.parse_levels, ['salt=LOUD'])
+
+    def test_host_log_dir(self):
+        self.assertEqual(log_pipeline.host_log_dir('/logs/pnda-cli.1.log'), '/logs/pnda-cli.1')
+        self.assertEqual(log_pipeline.host_log_dir('/logs/pnda-cli.1.log.gz'), '/logs/pnda-cli.1')
+
+class LogPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.logger = logging.getLogger('test_log_pipeline')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+
+    def tearDown(self):
+        for log_handler in list(self.logger.handlers):
+            self.logger.removeHandler(log_handler)
+        shutil.rmtree(self.directory)
+
+    def run_pipeline(self, records, levels=None, compress=False):
+        summary_path = os.path.join(self.directory, 'pnda-cli.log%s' % ('.gz' if compress else ''))
+        pipeline = log_pipeline.LogPipeline(levels, compress)
+        log_handler = log_pipeline.QueueHandler(pipeline, summary_path)
+        log_handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(log_handler)
+        pipeline.start()
+        for level, message, host, stream in records:
+            self.logger.log(level, message, extra={'host': host, 'stream': stream})
+        pipeline.stop()
+        return pipeline, summary_path
+
+    def read(self, path):
+        with (gzip.open(path) if path.endswith('.gz') else open(path)) as log_file:
+            return log_file.read().splitlines()
+
+    def test_host_logs_and_levels(self):
+        _, summary_path = self.run_pipeline([(logging.INFO, 'starting', None, 'cli'),
+                                             (logging.INFO, 'highstate', 'host1', 'salt'),
+                                             (logging.ERROR, 'failed', 'host1', 'salt'),
+                                             (logging.DEBUG, 'ls', 'host2', 'remote')],
+                                            levels={'salt': logging.WARNING})
+        self.assertEqual(self.read(summary_path), ['starting', 'failed', 'ls'])
+        self.assertEqual(self.read(os.path.join(self.directory, 'pnda-cli', 'host1.log')), ['highstate', 'failed'])
+        self.assertEqual(self.read(os.path.join(self.directory, 'pnda-cli', 'host2.log')), ['ls'])
+
+    def test_compressed(self):
+        _, summary_path = self.run_pipeline([(logging.INFO, 'bootstrapping', 'host1', 'bootstrap')], compress=True)
+        self.assertEqual(self.read(summary_path), ['bootstrapping'])
+        self.assertEqual(self.read(os.path.join(self.directory, 'pnda-cli', 'host1.log.gz')), ['bootstrapping'])
+
+    def test_open_files_capped(self):
+        max_open_files = log_pipeline.MAX_OPEN_FILES
+        batch_size = log_pipeline.BATCH_SIZE
+        log_pipeline.MAX_OPEN_FILES = 2
+        # one record per batch, so files are reopened as hosts take turns
+        log_pipeline.BATCH_SIZE = 1
+        try:
+            records = [(logging.INFO, 'line %s' % line, 'host%s' % (line % 4), 'remote') for line in range(12)]
+            pipeline, _ = self.run_pipeline(records)
+        finally:
+            log_pipeline.MAX_OPEN_FILES = max_open_files
+            log_pipeline.BATCH_SIZE = batch_size
+        self.assertTrue(len(pipeline._files) <= 2)
+        for host in range(4):
+            self.assertEqual(self.read(os.path.join(self.directory, 'pnda-cli', 'host%s.log' % host)),
+                             ['line %s' % line for line in range(host, 12, 4)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for building and querying detached remote jobs
+
+"""
+
+import os
+import time
+import base64
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+import remote_job
+
+def decode(command):
+    # echo <script> | base64 -d | bash -s -- <args>
+    return base64.b64decode(command.split()[1]), command.split(' -- ', 1)[1].split()
+
+class BuildTest(unittest.TestCase):
+
+    def test_job_script(self):
+        script = remote_job.build_job_script('create-1', ['salt-run state.orchestrate', 'echo done'])
+        self.assertEqual(script.splitlines(), ["trap 'echo $? > ~/pnda-jobs/create-1.exit' EXIT", 'cd ~',
+                                               'salt-run state.orchestrate', 'echo done'])
+
+    def test_launch_command(self):
+        script, args = decode(remote_job.build_launch_command('create-1', ['echo done']))
+        self.assertIn(remote_job.STARTED_MARKER, script)
+        self.assertEqual(args[0], 'create-1')
+        self.assertEqual(base64.b64decode(args[1]), remote_job.build_job_script('create-1', ['echo done']))
+
+    def test_status_command(self):
+        script, args = decode(remote_job.build_status_command('create-1', tail_lines=3))
+        self.assertIn(remote_job.STATE_MARKER, script)
+        self.assertEqual(args, ['create-1', '3'])
+
+class ParseStatusTest(unittest.TestCase):
+
+    def test_finished(self):
+        self.assertEqual(remote_job.parse_status_output(['PNDA_JOB_STATE finished 2', 'last line\n']),
+                         ('finished', 2, ['last line']))
+
+    def test_running(self):
+        self.assertEqual(remote_job.parse_status_output(['PNDA_JOB_STATE running']), ('running', None, []))
+
+    def test_no_state(self):
+        self.assertEqual(remote_job.parse_status_output([]), ('unknown', None, []))
+
+class RunJobTest(unittest.TestCase):
+    '''
+    Runs the launch and status scripts with bash, with a temporary home directory
+    '''
+
+    def setUp(self):
+        self.home = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.home)
+
+    def run_command(self, command):
+        env = dict(os.environ, HOME=self.home)
+        output = subprocess.check_output(['bash', '-c', command], env=env, cwd=self.home)
+        return output.splitlines()
+
+    def status(self, job_id):
+        return remote_job.parse_status_output(self.run_command(remote_job.build_status_command(job_id)))
+
+    def test_job_runs_once(self):
+        launch = remote_job.build_launch_command('create-1', ['echo started $(pwd)', 'exit 3'])
+        self.assertEqual(self.run_command(launch), ['PNDA_JOB_STARTED create-1'])
+        deadline = time.time() + 10
+        while self.status('create-1')[0] == 'running' and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertEqual(self.status('create-1'), ('finished', 3, ['started %s' % self.home]))
+        # a retried launch finds the job already started and leaves it alone
+        self.assertEqual(self.run_command(launch), ['PNDA_JOB_STARTED create-1 already started'])
+        self.assertEqual(self.status('create-1')[1], 3)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.status('create-2'), ('unknown', None, []))
+
+if __name__ == '__main__':
+    unittest.main()
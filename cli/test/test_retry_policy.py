@@ -0,0 +1,112 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for retry backoff, error classification and retry limits
+
+"""
+
+import ssl
+import socket
+import logging
+import unittest
+
+import retry_policy
+
+LOG = logging.getLogger('test')
+LOG.addHandler(logging.NullHandler())
+
+class ServerError(Exception):
+    def __init__(self, status, error_code=None):
+        super(ServerError, self).__init__('%s %s' % (status, error_code))
+        self.status = status
+        self.error_code = error_code
+
+class CommandError(Exception):
+    def __init__(self, message, exit_code):
+        super(CommandError, self).__init__(message)
+        self.exit_code = exit_code
+
+class ClassificationTest(unittest.TestCase):
+
+    def test_aws_errors(self):
+        self.assertTrue(retry_policy.is_retryable_aws_error(ServerError(400, 'Throttling')))
+        self.assertTrue(retry_policy.is_retryable_aws_error(ServerError(503)))
+        self.assertTrue(retry_policy.is_retryable_aws_error(ssl.SSLError()))
+        self.assertTrue(retry_policy.is_retryable_aws_error(socket.error()))
+        self.assertFalse(retry_policy.is_retryable_aws_error(ServerError(400, 'ValidationError')))
+        self.assertFalse(retry_policy.is_retryable_aws_error(ServerError(400, 'AlreadyExistsException')))
+        self.assertFalse(retry_policy.is_retryable_aws_error(ValueError()))
+
+    def test_connection_failures(self):
+        self.assertTrue(retry_policy.is_connection_failure(CommandError('failed', retry_policy.SSH_CONNECTION_FAILURE)))
+        self.assertTrue(retry_policy.is_connection_failure(CommandError('lost connection', 1)))
+        self.assertFalse(retry_policy.is_connection_failure(CommandError('failed', 1)))
+
+class BackoffTest(unittest.TestCase):
+
+    def test_delay_bounds(self):
+        policy = retry_policy.RetryPolicy('test', retry_policy.is_any_error, base_delay=1, max_delay=20)
+        for attempt in range(10):
+            for _ in range(50):
+                self.assertTrue(0 <= policy.delay(attempt) <= min(20, 2 ** attempt))
+
+class CallTest(unittest.TestCase):
+
+    def failing(self, errors):
+        calls = []
+        def func():
+            calls.append(len(calls))
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]
+            return len(calls)
+        return func, calls
+
+    def test_retries_until_success(self):
+        policy = retry_policy.RetryPolicy('test', retry_policy.is_any_error, base_delay=0, max_delay=0)
+        func, calls = self.failing([ValueError(), ValueError()])
+        self.assertEqual(policy.call(LOG, func), 3)
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(policy.metrics['calls'], 1)
+        self.assertEqual(policy.metrics['retries'], 2)
+        self.assertEqual(policy.metrics['gave_up'], 0)
+
+    def test_not_retryable(self):
+        policy = retry_policy.RetryPolicy('test', retry_policy.is_retryable_aws_error, base_delay=0, max_delay=0)
+        func, calls = self.failing([ServerError(400, 'ValidationError')])
+        self.assertRaises(ServerError, policy.call, LOG, func)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.metrics['retries'], 0)
+
+    def test_max_attempts(self):
+        policy = retry_policy.RetryPolicy('test', retry_policy.is_any_error, base_delay=0, max_delay=0, max_attempts=2)
+        func, calls = self.failing([ValueError('first'), ValueError('second'), ValueError('third')])
+        self.assertRaisesRegexp(ValueError, 'second', policy.call, LOG, func)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(policy.metrics['gave_up'], 1)
+
+    def test_deadline(self):
+        policy = retry_policy.RetryPolicy('test', retry_policy.is_any_error, base_delay=10, max_delay=10, deadline=0)
+        func, calls = self.failing([ValueError()])
+        self.assertRaises(ValueError, policy.call, LOG, func)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(policy.metrics['gave_up'], 1)
+
+    def test_single_attempt(self):
+        func, calls = self.failing([CommandError('lost connection', retry_policy.SSH_CONNECTION_FAILURE)])
+        self.assertRaises(CommandError, retry_policy.SINGLE_ATTEMPT.call, LOG, func)
+        self.assertEqual(len(calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
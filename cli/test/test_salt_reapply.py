@@ -0,0 +1,86 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for working out what reapply sends, removes and runs again
+
+"""
+
+import unittest
+
+import salt_reapply
+
+ORCHESTRATE = '''
+hdfs-create:
+  salt.state:
+    - tgt: 'G@roles:hadoop_manager'
+    - tgt_type: compound
+    - sls: cdh.create_hdfs
+kafka-and-zk:
+  salt.state:
+    - tgt: '*'
+    - sls:
+      - zookeeper
+      - kafka.server
+    - require:
+      - salt: hdfs-create
+'''
+
+class DiffManifestsTest(unittest.TestCase):
+
+    def test_send_changed_and_new(self):
+        send, _ = salt_reapply.diff_manifests({'salt/a.sls': '1', 'salt/b.sls': '2', 'salt/c.sls': '3'},
+                                              {'salt/a.sls': '1', 'salt/b.sls': 'x'})
+        self.assertEqual(send, ['salt/b.sls', 'salt/c.sls'])
+
+    def test_remove_files_gone_locally(self):
+        _, remove = salt_reapply.diff_manifests({'salt/a.sls': '1'},
+                                                {'salt/a.sls': '2', 'salt/old.sls': '3', 'pillar/gone.sls': '4'})
+        self.assertEqual(remove, ['pillar/gone.sls', 'salt/old.sls'])
+
+    def test_generated_never_removed(self):
+        remote = {'pillar/env_parameters.sls': '1', 'pillar/certs.sls': '2', 'pillar/roles/kafka/kafka-key.sls': '3'}
+        self.assertEqual(salt_reapply.diff_manifests({}, remote), ([], []))
+
+    def test_in_sync(self):
+        manifest = {'salt/a.sls': '1'}
+        self.assertEqual(salt_reapply.diff_manifests(manifest, dict(manifest)), ([], []))
+
+class OrchestrateTest(unittest.TestCase):
+
+    def test_orchestrated_states(self):
+        self.assertEqual(salt_reapply.orchestrated_states(ORCHESTRATE), set(['cdh.create_hdfs', 'zookeeper', 'kafka.server']))
+        self.assertEqual(salt_reapply.orchestrated_states(''), set())
+
+    def test_pillar_or_orchestration(self):
+        self.assertTrue(salt_reapply.needs_orchestrate(['pillar/services.sls'], [], ORCHESTRATE))
+        self.assertTrue(salt_reapply.needs_orchestrate(['salt/orchestrate/pnda.sls'], [], ''))
+
+    def test_orchestrated_state_changed(self):
+        self.assertTrue(salt_reapply.needs_orchestrate(['salt/kafka/templates/server.properties'], [], ORCHESTRATE))
+        self.assertTrue(salt_reapply.needs_orchestrate(['salt/cdh/create_hdfs.sls'], [], ORCHESTRATE))
+
+    def test_orchestrated_state_applied(self):
+        self.assertTrue(salt_reapply.needs_orchestrate([], ['zookeeper'], ORCHESTRATE))
+
+    def test_other_changes(self):
+        self.assertFalse(salt_reapply.needs_orchestrate(['salt/grafana/init.sls', 'salt/_modules/pnda.py', 'README.md'],
+                                                        ['grafana'], ORCHESTRATE))
+
+    def test_changed_states(self):
+        self.assertEqual(salt_reapply.changed_states(['salt/kafka/init.sls', 'salt/_grains/roles.py', 'salt/top.sls', 'pillar/a.sls']),
+                         ['kafka'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Unit tests for the admission of transfers by TransferScheduler
+
+"""
+
+# the tests check admission on the scheduler's own state
+# pylint: disable=protected-access
+
+import time
+import unittest
+
+from threading import Thread, Event
+
+from transfer_scheduler import TransferScheduler
+
+def wait_until(condition, timeout_s=5):
+    deadline = time.time() + timeout_s
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError('timed out waiting')
+        time.sleep(0.01)
+
+class AdmitTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = TransferScheduler(max_in_flight_bytes=100, small_bytes=10)
+        self.admitted = []
+
+    def start_bulk(self, name, size):
+        def admit():
+            self.scheduler._admit(size)
+            self.admitted.append(name)
+        thread = Thread(target=admit)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_small_not_held_by_bulk(self):
+        self.assertTrue(self.scheduler._admit(100))
+        self.assertFalse(self.scheduler._admit(10))
+
+    def test_oversize_bulk_when_idle(self):
+        self.assertTrue(self.scheduler._admit(500))
+        self.assertEqual(self.scheduler.report()['peak_in_flight_bytes'], 500)
+
+    def test_bulk_in_arrival_order(self):
+        self.scheduler._admit(80)
+        first = self.start_bulk('first', 50)
+        wait_until(lambda: len(self.scheduler._bulk_queue) == 1)
+        # fits under the cap, but must not overtake the transfer waiting before it
+        second = self.start_bulk('second', 20)
+        wait_until(lambda: len(self.scheduler._bulk_queue) == 2)
+        time.sleep(0.05)
+        self.assertEqual(self.admitted, [])
+        self.scheduler._release(80, True, time.time())
+        first.join(5)
+        second.join(5)
+        self.assertEqual(self.admitted, ['first', 'second'])
+        self.assertEqual(self.scheduler._in_flight_bytes, 70)
+
+    def test_bulk_waits_for_small(self):
+        self.scheduler._admit(80)
+        self.assertFalse(self.scheduler._admit(10))
+        thread = self.start_bulk('bulk', 20)
+        wait_until(lambda: len(self.scheduler._bulk_queue) == 1)
+        time.sleep(0.05)
+        self.assertEqual(self.admitted, [])
+        self.scheduler._release(10, False, time.time())
+        thread.join(5)
+        self.assertEqual(self.admitted, ['bulk'])
+
+class TransferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = TransferScheduler(max_in_flight_bytes=100, small_bytes=10)
+        self.started = []
+        self.finish = {}
+
+    def start(self, name, size):
+        self.finish[name] = Event()
+        def run():
+            with self.scheduler.transfer(size):
+                self.started.append(name)
+                self.finish[name].wait(5)
+        thread = Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_small_ahead_of_bulk(self):
+        self.start('small-1', 5)
+        wait_until(lambda: self.started == ['small-1'])
+        bulk = self.start('bulk', 50)
+        wait_until(lambda: len(self.scheduler._bulk_queue) == 1)
+        # a small transfer arriving after the bulk one starts ahead of it
+        self.start('small-2', 5)
+        wait_until(lambda: self.started == ['small-1', 'small-2'])
+        self.finish['small-1'].set()
+        time.sleep(0.05)
+        self.assertEqual(self.started, ['small-1', 'small-2'])
+        self.finish['small-2'].set()
+        wait_until(lambda: self.started == ['small-1', 'small-2', 'bulk'])
+        self.finish['bulk'].set()
+        bulk.join(5)
+        self.assertEqual(self.scheduler.report()['transfers'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
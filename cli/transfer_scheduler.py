@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2018 Cisco and/or its affiliates.
+
+This software is licensed to you under the terms of the Apache License, Version 2.0 (the "License").
+You may obtain a copy of the License at http://www.apache.org/licenses/LICENSE-2.0
+The code, technical concepts, and all information contained herein, are the property of
+Cisco Technology, Inc. and/or its affiliated entities, under various laws including copyright,
+international treaties, patent, and/or contract. Any use of the material herein must be in
+accordance with the terms of the License.
+All rights not expressly granted by the License are reserved.
+
+Unless required by applicable law or agreed to separately in writing, software distributed under
+the License is distributed on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND,
+either express or implied.
+
+Purpose:    Scheduling of scp transfers by size, so bulk uploads do not starve the short ssh
+            sessions that share the link to the bastion. Bulk transfers are admitted while the
+            bytes they have in flight are under a cap and only while no small transfer is in
+            flight, each can be held to a bandwidth limit, and achieved throughput is measured.
+            Only scp goes through the scheduler. ssh sessions, including the connectivity
+            sweep, last as long as their remote commands and carry little data, so the cap
+            and the bandwidth limit are what keep bulk transfers from crowding them.
+
+"""
+
+import time
+import threading
+
+from contextlib import contextmanager
+
+# defaults for the cli section of pnda_env.yaml
+MAX_IN_FLIGHT_TRANSFER_MB = 256
+SMALL_TRANSFER_KB = 256
+
+class TransferScheduler(object):
+    '''
+    Admits transfers of known sizes. Small ones, at most small_bytes, are control path
+    operations and start straight away. Bulk ones wait, in the order they arrive, until no small
+    transfer is in flight and their bytes fit under max_in_flight_bytes with the other bulk
+    transfers in flight, or until none is in flight for one larger than the cap.
+    '''
+
+    def __init__(self, max_in_flight_bytes, small_bytes, bandwidth_limit_kbps=None):
+        self.max_in_flight_bytes = max_in_flight_bytes
+        self.small_bytes = small_bytes
+        self.bandwidth_limit_kbps = bandwidth_limit_kbps
+        self._condition = threading.Condition()
+        self._in_flight_bytes = 0
+        self._small_in_flight = 0
+        self._bulk_queue = []
+        self._active = 0
+        self._busy_since = None
+        self._stats = {'transfers': 0, 'bulk_transfers': 0, 'bytes': 0, 'busy_s': 0.0, 'waited_s': 0.0,
+                       'peak_in_flight_bytes': 0, 'transfer_s': 0.0}
+
+    @staticmethod
+    def from_config(cli_config):
+        return TransferScheduler(int(cli_config.get('MAX_IN_FLIGHT_TRANSFER_MB', MAX_IN_FLIGHT_TRANSFER_MB)) * 1024 * 1024,
+                                 int(cli_config.get('SMALL_TRANSFER_KB', SMALL_TRANSFER_KB)) * 1024,
+                                 cli_config.get('TRANSFER_BANDWIDTH_LIMIT_KBPS'))
+
+    def scp_options(self, size):
+        '''
+        Options to add to the scp command for a transfer of size bytes
+        '''
+        if self.bandwidth_limit_kbps is None or size <= self.small_bytes:
+            return []
+        return ['-l', str(int(self.bandwidth_limit_kbps))]
+
+    def _admit(self, size):
+        bulk = size > self.small_bytes
+        ticket = object()
+        with self._condition:
+            if bulk:
+                self._bulk_queue.append(ticket)
+                while self._bulk_queue[0] is not ticket or self._small_in_flight > 0 or \
+                      (self._in_flight_bytes > 0 and self._in_flight_bytes + size > self.max_in_flight_bytes):
+                    self._condition.wait()
+                self._bulk_queue.pop(0)
+                self._in_flight_bytes += size
+                self._stats['bulk_transfers'] += 1
+                self._stats['peak_in_flight_bytes'] = max(self._stats['peak_in_flight_bytes'], self._in_flight_bytes)
+                # the next bulk transfer may fit too
+                self._condition.notify_all()
+            else:
+                self._small_in_flight += 1
+            if self._active == 0:
+                self._busy_since = time.time()
+            self._active += 1
+        return bulk
+
+    def _release(self, size, bulk, started):
+        now = time.time()
+        with self._condition:
+            if bulk:
+                self._in_flight_bytes -= size
+            else:
+                self._small_in_flight -= 1
+            self._active -= 1
+            if self._active == 0:
+                self._stats['busy_s'] += now - self._busy_since
+            self._stats['transfers'] += 1
+            self._stats['bytes'] += size
+            self._stats['transfer_s'] += now - started
+            self._condition.notify_all()
+
+    @contextmanager
+    def transfer(self, size):
+        '''
+        Hold a place for a transfer of size bytes for as long as the with block runs, waiting for
+        one first if it is bulk. Yields the extra scp options the transfer should be made with.
+        '''
+        requested = time.time()
+        bulk = self._admit(size)
+        started = time.time()
+        with self._condition:
+            self._stats['waited_s'] += started - requested
+        try:
+            yield self.scp_options(size)
+        finally:
+            self._release(size, bulk, started)
+
+    def report(self):
+        '''
+        Transfers made so far, with the aggregate throughput over the time any was in flight
+        '''
+        with self._condition:
+            stats = dict(self._stats)
+        stats['mbps'] = round(stats['bytes'] * 8 / 1000000.0 / stats['busy_s'], 2) if stats['busy_s'] > 0 else 0.0
+        stats['busy_s'] = round(stats['busy_s'], 1)
+        stats['waited_s'] = round(stats['waited_s'], 1)
+        stats['transfer_s'] = round(stats['transfer_s'], 1)
+        return stats
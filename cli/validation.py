@@ -24,6 +24,8 @@ import os
 import argparse
 from argparse import RawTextHelpFormatter, ArgumentTypeError
 
+import log_pipeline
+
 class RangeValidator(object):
     '''
     Simple field validator based on rules specification file
@@ -34,7 +36,7 @@ class RangeValidator(object):
         self._load(flavor)
 
     def _load(self, flavor):
-        path = '../cloud-formation/%s/validation.json' % flavor
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cloud-formation', flavor, 'validation.json')
         if os.path.isfile(path):
             with open(path) as validation_file:
                 rules = json.load(validation_file)
@@ -133,17 +135,22 @@ class UserInputValidator(object):
         # arbitrary predicates that can be associated with fields
         self._field_flags = {
             # predicate for allowing none-valued arguments (suppress prompt) 
-            'allow_none': lambda args: (args['command'] == 'expand') or (args['command'] == 'create' and args['x_machines_definition'] is not None)
+            'allow_none': lambda args: (args['command'] == 'expand') or (args['command'] == 'create' and args['x_machines_definition'] is not None),
+            # predicate for fields that have a default when not given (never prompt)
+            'has_default': lambda args: True
         }
 
         self._validated_fields = {
-            "pnda_cluster" : {"validator":name_validator, "group":["create", "expand", "destroy"], "required":True, "flags":[]},
-            "keyname": {"validator":key_validator, "group":["create", "expand"], "required":True, "flags":[]},
+            "pnda_cluster" : {"validator":name_validator, "group":["create", "expand", "destroy", "status", "collect", "reapply"], "required":True, "flags":[]},
+            "keyname": {"validator":key_validator, "group":["create", "expand", "bake"], "required":True, "flags":[]},
             "datanodes" : {"validator":integer_validator, "group":["create", "expand"], "required":False, "flags":['allow_none']},
             "opentsdb_nodes" : {"validator":integer_validator, "group":["create", "expand"], "required":False, "flags":['allow_none']},
             "kafka_nodes" : {"validator":integer_validator, "group":["create", "expand"], "required":False, "flags":['allow_none']},
             "zk_nodes" : {"validator":integer_validator, "group":["create", "expand"], "required":False, "flags":['allow_none']},
-            "flavor" : {"validator":flavor_validator, "group":["create", "expand"], "required":True, "flags":[]}
+            "bastions" : {"validator":integer_validator, "group":["create", "expand"], "required":False, "flags":['has_default']},
+            "syndics" : {"validator":integer_validator, "group":["create", "expand"], "required":False, "flags":['has_default']},
+            "flavor" : {"validator":flavor_validator, "group":["create", "expand", "bake", "reapply"], "required":True, "flags":[]},
+            "batch_definition" : {"validator":key_validator, "group":["batch"], "required":True, "flags":[]}
         }
 
     def _value_or_default(self, field, func, default):
@@ -175,7 +182,7 @@ class UserInputValidator(object):
     def _range_validate_field(self, field, val):
         return self._range_validator.validate_field(field, val) if self._range_validator is not None else True
 
-    def _validate_user_input(self, args):
+    def _validate_user_input(self, args, interactive=True):
 
         # gather arguments via raw_input and run validation and actions in similar fashion to argparse
         def _prompt_user(field, val):
@@ -214,9 +221,11 @@ class UserInputValidator(object):
                     raise ArgumentTypeError("%s: '%s' not in valid range (%s)" % (field, val, rule))
             else: # value not specified
                 # if allow_none is set, allow none-valued field to pass through
-                if not self._field_validator_flag(args, field, 'allow_none'):
+                if not self._field_validator_flag(args, field, 'allow_none') and not self._field_validator_flag(args, field, 'has_default'):
                     # if field 'required' or non-zero rule then prompt user
                     if (self._field_validator_required(field) or (rule is not None and rule != "0")):
+                        if not interactive:
+                            raise ArgumentTypeError("%s: must be specified" % field)
                         val = _prompt_user(field, val)
                     # if rule is zero, default to 0 without prompting
                     elif rule is not None and rule == "0":
@@ -242,7 +251,33 @@ class UserInputValidator(object):
         
         - Create cluster without user input:
             pnda-cli.py create -s mykeyname -e squirrel-land -f standard -n 5 -o 1 -k 2 -z 3
-            
+
+        - Start creating a cluster, leaving salt running on the saltmaster, then check on it later:
+            pnda-cli.py create -e squirrel-land -f standard -s keyname --detach
+            pnda-cli.py status -e squirrel-land
+
+        - Create a cluster, bootstrapping instances while the rest of the stack is still being created:
+            pnda-cli.py create -e squirrel-land -f standard -s keyname --overlap-stack
+
+        - Create a cluster with three bastions, ssh sessions to the other hosts are spread over them:
+            pnda-cli.py create -e squirrel-land -f standard -s keyname --bastions 3
+
+        - Create a large cluster whose minions register with four salt syndics rather than directly with the saltmaster:
+            pnda-cli.py create -e squirrel-land -f standard -s keyname -n 20 --syndics 4
+
+        - Collect the tails of the bootstrap, salt and minion logs from every host of a cluster into one archive in cli/logs:
+            pnda-cli.py collect -e squirrel-land
+
+        - Push platform-salt changes to a running cluster and see what highstate would change on its kafka hosts, then apply them:
+            pnda-cli.py reapply -e squirrel-land -f standard --roles kafka --test
+            pnda-cli.py reapply -e squirrel-land -f standard --roles kafka
+
+        - Bake images with the packages for each node type of a flavor, which later creates of that flavor use:
+            pnda-cli.py bake -f standard -s keyname
+
+        - Create, expand or destroy several clusters at once, as listed in a batch definition file:
+            pnda-cli.py batch -c batch_example.yaml
+
         """
 
         def _build_action(func):
@@ -252,16 +287,24 @@ class UserInputValidator(object):
                     func(values)
             return _WrappedFuncAction
 
+        def _list_func(val):
+            return [item.strip() for item in val.split(',') if item.strip()]
+
+        def _wave_size_func(val):
+            if not val.isdigit():
+                raise ArgumentTypeError('must be a whole number, 0 for a single wave')
+            return int(val)
+
         parser = argparse.ArgumentParser(formatter_class=RawTextHelpFormatter,
                                          description='PNDA CLI',
                                          epilog=epilog)
 
         parser.add_argument('command',
                             help='Mode of operation',
-                            choices=['create', 'expand', 'destroy'])
+                            choices=['create', 'expand', 'destroy', 'status', 'collect', 'reapply', 'bake', 'batch'])
         parser.add_argument('-e', '--pnda-cluster',
                             type=self._field_validator_func("pnda_cluster"),
-                            help='Namespaced environment for machines in this cluster')
+                            help='Namespaced environment for machines in this cluster. For bake, the name of the temporary stack (default bake-<flavor>)')
         parser.add_argument('-n', '--datanodes',
                             type=self._field_validator_func("datanodes"),
                             help='How many datanodes for the hadoop cluster')
@@ -274,6 +317,14 @@ class UserInputValidator(object):
         parser.add_argument('-z', '--zk-nodes',
                             type=self._field_validator_func("zk_nodes"),
                             help='How many zookeeper nodes for the databus cluster')
+        parser.add_argument('--bastions',
+                            type=self._field_validator_func("bastions"),
+                            help=('How many bastions ssh sessions to the cluster go through (default 1). '
+                                  'For expand, the new total, which defaults to the bastions the cluster has'))
+        parser.add_argument('--syndics',
+                            type=self._field_validator_func("syndics"),
+                            help=('How many salt syndics minions register with instead of the saltmaster (default 0). '
+                                  'For expand, the new total, which defaults to the syndics the cluster has'))
         parser.add_argument('-f', '--flavor',
                             type=self._field_validator_func("flavor"),
                             help='PNDA flavor: %s' % self._flavors,
@@ -293,6 +344,52 @@ class UserInputValidator(object):
         parser.add_argument('-m', '--x-machines-definition',
                             help=('File describing topology of target server cluster. If specified, '
                                   'topology specifiers -k, -z, -o and -n are not required.'))
+        parser.add_argument('--self-bootstrap',
+                            action='store_true',
+                            help=('Create only: instances download a bootstrap bundle from BOOTSTRAP_BUCKET and bootstrap themselves at boot, '
+                                  'instead of being bootstrapped over ssh once the stack is up'))
+        parser.add_argument('--overlap-stack',
+                            action='store_true',
+                            help=('Create only: bootstrap each instance as soon as it is running, while the rest of the '
+                                  'Cloud Formation stack is still being created'))
+        parser.add_argument('--detach',
+                            action='store_true',
+                            help=('Leave salt running on the saltmaster as a background job after create or expand, '
+                                  'and do not wait for the stack to be deleted on destroy. Follow progress with the status command.'))
+        parser.add_argument('--wave-size',
+                            type=_wave_size_func,
+                            help=('Expand only: how many new hosts are bootstrapped and have salt run on them together (default '
+                                  'EXPAND_WAVE_SIZE in pnda_env.yaml, or 10). 0 adds them all in one wave'))
+        parser.add_argument('--states',
+                            type=_list_func,
+                            help='Reapply only: comma separated states to apply instead of highstate')
+        parser.add_argument('--roles',
+                            type=_list_func,
+                            help='Reapply only: comma separated roles, salt runs on the minions with any of them')
+        parser.add_argument('--minions',
+                            type=_list_func,
+                            help='Reapply only: comma separated minion ids salt runs on, as well as those with --roles')
+        parser.add_argument('--test',
+                            action='store_true',
+                            help='Reapply only: run salt with test=True, reporting what would change without changing it')
+        parser.add_argument('-c', '--batch-definition',
+                            help='File listing the clusters to operate on concurrently, for the batch command')
+
+        def _log_level_func(val):
+            try:
+                log_pipeline.parse_levels([val])
+            except ValueError as error:
+                raise ArgumentTypeError(str(error))
+            return val
+        parser.add_argument('--log-level',
+                            action='append',
+                            metavar='STREAM=LEVEL',
+                            type=_log_level_func,
+                            help=('Minimum level of records from a stream (%s) written to the debug log, e.g. salt=WARNING. '
+                                  'Per host logs always get everything. May be repeated.' % ', '.join(log_pipeline.STREAMS)))
+        parser.add_argument('--compress-logs',
+                            action='store_true',
+                            help='gzip the debug log and per host logs as they are written')
 
         args = parser.parse_args()
 
@@ -306,6 +403,29 @@ class UserInputValidator(object):
         validated_fields = self._validate_user_input(vars(args))
         return validated_fields
 
+    def validate_definition(self, definition):
+        '''
+        Validate one cluster definition from a batch file without prompting for missing values
+        '''
+        args = {'command': definition.get('command')}
+        for field in ['pnda_cluster', 'keyname', 'datanodes', 'opentsdb_nodes', 'kafka_nodes', 'zk_nodes', 'bastions', 'syndics',
+                      'flavor', 'branch', 'x_machines_definition', 'pnda_env']:
+            val = definition.get(field)
+            if val is not None:
+                val = self._field_validator_func(field)(str(val))
+                if field == 'flavor':
+                    self._field_validator_action(field)(val)
+            args[field] = val
+        args['no_config_check'] = definition.get('no_config_check', False)
+        args['dry_run'] = definition.get('dry_run', False)
+        args['detach'] = definition.get('detach', False)
+        args['self_bootstrap'] = definition.get('self_bootstrap', False)
+        args['overlap_stack'] = definition.get('overlap_stack', False)
+        args['wave_size'] = definition.get('wave_size')
+        if args['command'] not in ['create', 'expand', 'destroy']:
+            raise ArgumentTypeError("command: must be one of create, expand or destroy")
+        return self._validate_user_input(args, False)
+
     def get_range_validator(self):
         '''
         Access flavor specific range validator object